@@ -6,14 +6,50 @@ the last part of the assignment, it is the heart of the clustering algorithm.  Y
 need this class to view the complete visualizer.
 
 """
+import os
 import math
+import time
 import random
+import itertools
 import numpy
+import concurrent.futures
+import multiprocessing
 
 
 # For accessing the previous parts of the assignment
 import a6dataset
 import a6cluster
+import a6kernels
+import a6parallel
+import a6kdtree
+
+
+# The partition engines an Algorithm can use
+ENGINES = ['python', 'numpy', 'hamerly', 'kdtree']
+
+# The relative error allowed for in the distance bounds of the hamerly engine
+BOUND_SLACK = 1e-10
+
+# The relative error allowed for in those bounds when distances are computed in float32
+BOUND_SLACK32 = 1e-4
+
+# The types an Algorithm can compute distances in
+DTYPES = [numpy.float64, numpy.float32]
+
+# The ways an Algorithm can pick its initial centroids when no seeds are given
+INITS = ['random', 'k-means++', 'k-means||']
+
+# The number of steps between the inertia checks of a restart (see restart)
+ABANDON_STEPS = 5
+
+# How many times larger than the best run's inertia a restart must be to give up
+ABANDON_MARGIN = 1.1
+
+# The best inertia found so far by the restarts, in a worker process of restart
+_best = None
+
+# The version of the checkpoint file format written by Algorithm.checkpoint
+CHECKPOINT_VERSION = 1
 
 # Part A
 def valid_seeds(value, size):
@@ -46,12 +82,397 @@ def valid_seeds(value, size):
     return good
 
 
+def kmeanspp_seeds(dset, k):
+    """
+    Returns a list of k seeds for dset chosen by k-means++.
+
+    The first seed is picked uniformly at random. Each later seed is picked at random
+    with probability proportional to the squared distance from the point to the
+    closest seed so far (D-squared sampling). The distances to the closest seed are
+    kept for every point and updated with one vectorized pass per new seed. If every
+    point is already at a seed, the remaining seeds are picked uniformly at random.
+
+    The random choices are made with the module random, so random.seed makes the
+    result repeatable.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter k: the number of seeds
+    Precondition: k is an int, 0 < k <= dset.getSize()
+    """
+    assert type(k)==int and k>0 and k<=dset.getSize()
+    size = dset.getSize()
+
+    seeds = [random.randrange(size)]
+    closest = a6kernels.squared_to(dset, dset.getBlock(seeds[0], seeds[0]+1)[0])
+    while len(seeds) < k:
+        seeds.append(_sample(closest, seeds))
+        point = dset.getBlock(seeds[-1], seeds[-1]+1)[0]
+        closest = numpy.minimum(closest, a6kernels.squared_to(dset, point))
+
+    return seeds
+
+
+def kmeansll_seeds(dset, k, rounds=5, factor=2):
+    """
+    Returns a list of k seeds for dset chosen by scalable k-means++ (k-means||).
+
+    Instead of picking one seed per pass over the data like k-means++, this method
+    picks many candidates per pass. After a first random candidate, each of the
+    rounds passes keeps every point independently with probability factor*k times its
+    squared distance to the closest candidate, divided by the sum of those squared
+    distances. So each round picks about factor*k candidates. Each candidate is then
+    weighted by the number of points closest to it, and k seeds are picked from the
+    candidates with weighted k-means++. If there are fewer than k candidates, the
+    missing seeds are picked by k-means++ over the whole dataset.
+
+    The random choices are made with the module random (and a numpy generator seeded
+    from it), so random.seed makes the result repeatable.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter k: the number of seeds
+    Precondition: k is an int, 0 < k <= dset.getSize()
+
+    Parameter rounds: the number of sampling passes (OPTIONAL)
+    Precondition: rounds is an int >= 0
+
+    Parameter factor: the oversampling factor (OPTIONAL)
+    Precondition: factor is an int or float > 0
+    """
+    assert type(k)==int and k>0 and k<=dset.getSize()
+    assert type(rounds)==int and rounds>=0
+    assert type(factor) in [int,float] and factor>0
+    size = dset.getSize()
+    generator = numpy.random.default_rng(random.getrandbits(64))
+
+    #oversample the candidates
+    candidates = [random.randrange(size)]
+    closest = a6kernels.squared_to(dset, dset.getBlock(candidates[0], candidates[0]+1)[0])
+    for x in range(rounds):
+        total = closest.sum()
+        if total == 0:
+            break
+        chosen = numpy.flatnonzero(generator.random(size) < factor*k*closest/total)
+        if len(chosen) > 0:
+            points = numpy.array([dset.getBlock(i, i+1)[0] for i in chosen.tolist()])
+            dists = a6kernels.assign(dset, points, a6kernels.MEMORY_BUDGET)[1]
+            closest = numpy.minimum(closest, dists*dists)
+            candidates.extend(chosen.tolist())
+
+    #top up with k-means++ if there are too few candidates
+    while len(candidates) < k:
+        candidates.append(_sample(closest, candidates))
+        point = dset.getBlock(candidates[-1], candidates[-1]+1)[0]
+        closest = numpy.minimum(closest, a6kernels.squared_to(dset, point))
+    if len(candidates) == k:
+        return candidates
+
+    #weight the candidates, and reduce them to k seeds with weighted k-means++
+    points = numpy.array([dset.getBlock(i, i+1)[0] for i in candidates])
+    labels = a6kernels.assign(dset, points, a6kernels.MEMORY_BUDGET)[0]
+    weights = numpy.bincount(labels, minlength=len(candidates)).astype(numpy.float64)
+
+    picked = [_sample(weights, [])]
+    diff = points-points[picked[0]]
+    near = numpy.einsum('ij,ij->i', diff, diff)
+    while len(picked) < k:
+        picked.append(_sample(near*weights, picked))
+        diff = points-points[picked[-1]]
+        near = numpy.minimum(near, numpy.einsum('ij,ij->i', diff, diff))
+
+    return [candidates[i] for i in picked]
+
+
+def _sample(weights, taken):
+    """
+    Returns a random position of weights, picked with probability proportional to weight.
+
+    If all of the weights are 0, this picks a position not in taken uniformly at random.
+
+    Parameter weights: the weight of each position
+    Precondition: weights is a 1-D numpy float array of values >= 0, and has more
+    elements than taken
+
+    Parameter taken: the positions that were already picked
+    Precondition: taken is a list of ints
+    """
+    total = weights.sum()
+    if total == 0:
+        free = numpy.setdiff1d(numpy.arange(len(weights)), taken)
+        return int(free[random.randrange(len(free))])
+
+    pos = int(numpy.searchsorted(numpy.cumsum(weights), random.random()*total, side='right'))
+    return min(pos, len(weights)-1)
+
+
+def resume(filename, dset, workers=None):
+    """
+    Returns an Algorithm in the state saved by Algorithm.checkpoint.
+
+    The result has the centroids, clusters and step count of the saved algorithm,
+    as well as its engine and other options, so calling run on it continues where
+    the saved one stopped. With the numpy engine, it then computes exactly the same
+    clusters as the saved algorithm would have. (The bounds of the hamerly engine and
+    the running sums of incremental tracking are not saved, and are simply computed
+    again by the next step.) Worker processes are not saved either; they are given
+    by workers instead.
+
+    Parameter filename: the checkpoint file
+    Precondition: filename is the name of a file written by Algorithm.checkpoint for
+    dset, with a version no later than CHECKPOINT_VERSION
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter workers: the number of worker processes (OPTIONAL)
+    Precondition: workers is None or an int > 0. If it is not None, the saved engine
+    is 'numpy'.
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    with numpy.load(filename, allow_pickle=False) as data:
+        version = int(data['version'])
+        assert version <= CHECKPOINT_VERSION, 'checkpoint version '+repr(version)+' is not supported'
+        centroids = data['centroids']
+        labels = data['labels']
+        steps = int(data['steps'])
+        options = {'engine': str(data['engine']), 'metric': str(data['metric']),
+                   'dtype': numpy.dtype(str(data['dtype'])).type,
+                   'incremental': bool(data['incremental'])}
+
+    assert len(labels) == dset.getSize() and centroids.shape[1] == dset.getDimension()
+    k = len(centroids)
+    result = Algorithm(dset, k, seeds=list(range(k)), workers=workers, **options)
+    result._restore(centroids, labels, steps)
+    return result
+
+
+def restart(dset, k, restarts=10, workers=None, maxstep=300, engine='numpy', init='random',
+            abandon=False, metric='euclidean'):
+    """
+    Returns a pair (alg, inertias) for the best of several independent k-means runs.
+
+    Each of the restarts runs is an Algorithm with its own random seeds (picked as
+    given by init), run for at most maxstep steps. The value alg is an Algorithm for
+    dset in the final state of the run with the smallest inertia (see getInertia).
+    Ties go to the earlier run. The value inertias is a list with the final inertia
+    of each run, or None for a run that was abandoned.
+
+    If workers is not None, the runs are spread over that many worker processes, and
+    the dataset is copied once into shared memory for them. The best run finished so
+    far (in any process) shares the inertia it had every ABANDON_STEPS steps. If
+    abandon is True, a run checks its own inertia at those same steps, and gives up
+    when it is more than ABANDON_MARGIN times what the best run's was at that step.
+
+    Abandoning is a heuristic, so it is off by default. A run that is behind at some
+    step might still have caught up and ended below the best, so restart may return
+    a worse result than it would have without abandoning. With workers, it also
+    depends on which runs happen to finish first. With abandon False, the result only
+    depends on the state of the module random.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k <= dset.getSize()
+
+    Parameter restarts: the number of runs (OPTIONAL)
+    Precondition: restarts is an int > 0
+
+    Parameter workers: the number of worker processes (OPTIONAL)
+    Precondition: workers is None or an int > 0
+
+    Parameter maxstep: the maximum number of steps of each run (OPTIONAL)
+    Precondition: maxstep is an int > 0
+
+    Parameter engine: the partition engine of each run (OPTIONAL)
+    Precondition: engine is one of the strings in ENGINES
+
+    Parameter init: how each run picks its seeds (OPTIONAL)
+    Precondition: init is one of the strings in INITS
+
+    Parameter abandon: whether to abandon runs worse than the best so far (OPTIONAL)
+    Precondition: abandon is a bool
+
+    Parameter metric: the distance metric of each run (OPTIONAL)
+    Precondition: metric is a key of a6kernels.METRICS. If it is not 'euclidean',
+    engine is 'python' or 'numpy'. If dset is sparse, workers is None (and see
+    Algorithm for the other options).
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    assert type(k)==int and k>0 and k<=dset.getSize()
+    assert type(restarts)==int and restarts>0
+    assert workers is None or (type(workers) == int and workers > 0 and not dset.isSparse())
+    assert type(maxstep)==int and maxstep>0
+    assert engine in ENGINES and init in INITS
+    assert type(abandon) == bool
+    assert metric == 'euclidean' or engine in ['python', 'numpy']
+
+    keys = [random.getrandbits(64) for x in range(restarts)]
+    best = multiprocessing.Array('d', [math.inf]*(maxstep//ABANDON_STEPS+1))
+    if workers is None:
+        state = random.getstate()
+        results = [_restart_run(dset, k, maxstep, engine, init, abandon, metric, key, best)
+                   for key in keys]
+        random.setstate(state)
+    else:
+        with a6parallel.shared_dataset(dset) as spec:
+            with concurrent.futures.ProcessPoolExecutor(workers, initializer=_restart_init,
+                                                        initargs=(best,)) as pool:
+                jobs = [pool.submit(_restart_job, spec, k, maxstep, engine, init, abandon,
+                                    metric, key) for key in keys]
+                results = [job.result() for job in jobs]
+
+    #rebuild the best run (the first run to finish is never abandoned)
+    inertias = [None if x is None else x[0] for x in results]
+    pick = min((results[pos][0], pos) for pos in range(restarts) if results[pos] is not None)[1]
+    alg = Algorithm(dset, k, seeds=list(range(k)), engine=engine, metric=metric)
+    alg._restore(results[pick][1], results[pick][2], results[pick][3])
+    return alg, inertias
+
+
+def _restart_init(best):
+    """
+    Prepares a worker process of restart.
+
+    Parameter best: the inertias of the best run so far
+    Precondition: best is a shared multiprocessing.Array of type 'd' (see _restart_run)
+    """
+    global _best
+    _best = best
+
+
+def _restart_job(spec, k, maxstep, engine, init, abandon, metric, key):
+    """
+    Returns the result of _restart_run on the dataset in shared memory.
+
+    This is the work done by one worker process of restart.
+
+    Parameter spec: the shared points
+    Precondition: spec is a spec for a shared 2-D array, as returned by a6parallel.share
+
+    The other parameters are the same as for _restart_run.
+    """
+    return a6parallel.call_attached(spec, _restart_run, k, maxstep, engine, init, abandon,
+                                    metric, key, _best)
+
+
+def _restart_run(dset, k, maxstep, engine, init, abandon, metric, key, best):
+    """
+    Returns a tuple (inertia, centroids, labels, steps) for one run of restart.
+
+    The value centroids is a 2-D array with the final centroids, labels is an int
+    array with the cluster of each point, and steps is the number of steps the run
+    performed. If the run is abandoned, this returns None instead.
+
+    Parameter key: the seed for the module random
+    Precondition: key is an int
+
+    Parameter best: the inertias of the best run so far (updated when the run finishes)
+    Precondition: best is a shared multiprocessing.Array of type 'd' with
+    maxstep//ABANDON_STEPS+1 elements. Element 0 is the final inertia of the best run,
+    and element i > 0 is its inertia after i*ABANDON_STEPS steps (or its final inertia,
+    if it converged sooner). They are all infinity if no run has finished.
+
+    The other parameters are the same as for restart.
+    """
+    random.seed(key)
+    alg = Algorithm(dset, k, engine=engine, init=init, metric=metric)
+    checks = []
+    for x in range(maxstep):
+        if alg.step():
+            break
+        if alg.getSteps() % ABANDON_STEPS == 0:
+            checks.append(alg.getInertia())
+            if abandon and checks[-1] > ABANDON_MARGIN*best[len(checks)]:
+                return None
+
+    #share the inertias of this run if it is the best so far
+    inertia = alg.getInertia()
+    with best.get_lock():
+        if inertia < best[0]:
+            best[0] = inertia
+            for pos in range(1, len(best)):
+                best[pos] = checks[pos-1] if pos <= len(checks) else inertia
+    return inertia, alg._centroids(), alg._membership(), alg.getSteps()
+
+
 class Algorithm(object):
     """
     A class to manage and run the k-means algorithm.
 
     The method step() performs one step of the calculation.  The method run() will
     continue the calculation until it converges (or reaches a maximum number of steps).
+
+    The partition step can be done by one of several engines. The 'python' engine
+    (the default) finds the nearest cluster of each point with _nearest. The 'numpy'
+    engine computes the distances from a whole chunk of points to every centroid at
+    once, and then rebuilds all the clusters in a single pass. Both engines produce
+    the same clusters.
+
+    The 'hamerly' engine is for runs with many steps. It remembers, for every point,
+    an upper bound on the distance to its own centroid and a lower bound on the
+    distance to any other centroid, and moves these bounds by how far the centroids
+    moved. A point whose upper bound is below both its lower bound and half the
+    distance from its centroid to the next closest centroid cannot change cluster,
+    so its distances are not computed at all. It still produces the same clusters as
+    the other engines, and getSkipped() reports how many distances it avoided.
+
+    The 'kdtree' engine is for runs with many clusters. Once per step, it builds a
+    k-d tree over the centroids (see a6kdtree), so each point is only measured
+    against the few centroids near it. It also produces the same clusters as the
+    other engines. Whatever the engine, classify() and classifyPoints() use such a
+    tree to find the clusters of new points, without changing the clusters.
+
+    The numpy engine can also spread each partition over several worker processes.
+    The dataset is copied once into shared memory and cut into contiguous shards. Each
+    worker labels the points of its shard and adds up the points of each cluster, and
+    the partial sums are then combined into the new centroids. The result is exactly
+    the same as with a single process. The workers and the shared memory are created by
+    the first partition that needs them, and they last until close() is called, even
+    after run() returns. So either call close() when done with such an object, or use
+    it in a with statement, which calls close() on the way out. As a last resort,
+    close() is also called when the object is garbage collected.
+
+    With the vectorized engines, an Algorithm can also track convergence incrementally.
+    It then keeps the sum of the points in each cluster from step to step, and after
+    each partition only the points that changed cluster are subtracted from their old
+    sum and added to their new one. Only the clusters that gained or lost points get
+    new centroids, and the algorithm has converged as soon as a partition moves no
+    points at all. Late steps, where few points move, then cost time proportional to
+    the number of moved points rather than the size of the dataset. (The running sums
+    may drift from freshly computed ones by rounding error.) In this mode the clusters
+    should only be changed by the Algorithm itself.
+
+    The vectorized engines normally compute distances in float64. With the dtype
+    numpy.float32 they compute them in float32 instead, which halves the memory the
+    distance kernels move around (especially with a float32 dataset, whose blocks are
+    then used as they are). The centroids are still kept, and the points of each
+    cluster still added up, in float64. Points that are almost exactly as close to
+    two centroids may then end up in a different cluster than with float64.
+
+    Distances are euclidean by default, but any metric in a6kernels.METRICS can be
+    used instead. The clusters then measure with its scalar kernel, and the numpy
+    engine with its batched kernel. The hamerly and kdtree engines rely on the
+    geometry of euclidean distance, so they only support that metric. Centroids are
+    still moved to the mean of their points.
+
+    A sparse dataset (see Dataset) is clustered by the numpy engine, with euclidean
+    distances, in a single process. Its blocks are measured by the sparse kernels of
+    a6kernels, whose cost depends on the number of nonzeros and not the dimension.
+    These compute |x|^2 + |c|^2 - 2 x.c, so their distances can round a little
+    differently from those of the same points stored densely.
+
+    To see where the time of a run goes, add a sink with addSink. A sink is any
+    function taking one argument, such as the classes in a6monitor. After every step,
+    each sink is called with a dictionary describing the step: the number of the step
+    ('step'), the seconds spent in the partition ('partition') and in the update
+    ('update'), the number of points that changed cluster ('moved'), the inertia
+    after the update ('inertia', see Cluster.getInertia), the largest distance a
+    centroid moved ('shift'), and whether the step converged ('converged'). Without
+    sinks, none of this is measured.
     """
     # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
     # Attribute _dataset: The Dataset for this algorithm
@@ -59,6 +480,72 @@ class Algorithm(object):
     #
     # Attribute _cluster: The clusters to use at each step
     # Invariant: _cluster is a non-empty list of Cluster instances
+    #
+    # Attribute _engine: The partition engine
+    # Invariant: _engine is one of the strings in ENGINES
+    #
+    # Attribute _metric: The distance metric
+    # Invariant: _metric is a key of a6kernels.METRICS. It is 'euclidean' for the
+    # hamerly and kdtree engines
+    #
+    # Attribute _dtype: The type distances are computed in
+    # Invariant: _dtype is the numpy dtype of one of the types in DTYPES (always
+    # float64 for the python engine)
+    #
+    # MUTABLE ATTRIBUTES (Can be changed at any time, via _partition)
+    # Attribute _labels: The cluster of each point after the last partition
+    # Invariant: _labels is None if no vectorized engine has partitioned yet.
+    # Otherwise it is a 1-D numpy int array with an element per dataset point,
+    # and _labels[i] is the position in _cluster of the cluster holding point i.
+    #
+    # Attribute _upper: The upper distance bounds of the hamerly engine
+    # Invariant: _upper is None, or a 1-D float array with an element per point;
+    # _upper[i] is at least the distance from point i to centroid _labels[i]
+    #
+    # Attribute _lower: The lower distance bounds of the hamerly engine
+    # Invariant: _lower is None, or a 1-D float array with an element per point;
+    # _lower[i] is at most the distance from point i to any other centroid
+    #
+    # Attribute _anchors: The centroids when the bounds were last updated
+    # Invariant: _anchors is None, or a 2-D float array with a row per cluster
+    #
+    # Attribute _skipped: The number of distance computations skipped
+    # Invariant: _skipped is an int >= 0
+    #
+    # Attribute _workers: The number of worker processes for the numpy engine
+    # Invariant: _workers is None (no workers) or an int > 0
+    #
+    # Attribute _pool: The worker processes
+    # Invariant: _pool is None or a ProcessPoolExecutor with _workers processes
+    #
+    # Attribute _shared: The shared memory used by the workers
+    # Invariant: _shared is None, or a list [points, pspec, labels, lspec] of the
+    # SharedMemory blocks (and their specs) holding a copy of the dataset and the
+    # labels array
+    #
+    # Attribute _partial: The cluster sums computed by the last partition
+    # Invariant: _partial is None, or a pair (sums, counts) for the current labels
+    #
+    # Attribute _incremental: Whether convergence is tracked incrementally
+    # Invariant: _incremental is a bool (always False for the python engine)
+    #
+    # Attribute _previous: The labels before the last partition
+    # Invariant: _previous is None, or a copy of _labels from before the last
+    # partition (only kept if _incremental is True)
+    #
+    # Attribute _sums: The running sums of the points in each cluster
+    # Invariant: _sums is None, or a pair (sums, counts) for the labels before the
+    # last partition (only kept if _incremental is True)
+    #
+    # Attribute _steps: The number of steps performed so far
+    # Invariant: _steps is an int >= 0
+    #
+    # Attribute _sinks: The functions called with the event of each step
+    # Invariant: _sinks is a list of functions taking one argument
+    #
+    # Attribute _index: The k-d tree over the centroids, when it was last built
+    # Invariant: _index is None or a KDTree. Its centroids may be out of date, so
+    # it is only used through _tree
 
     # Part B
     def getClusters(self):
@@ -72,7 +559,88 @@ class Algorithm(object):
         return self._cluster
 
 
-    def __init__(self, dset, k, seeds=None):
+    def getSteps(self):
+        """
+        Returns the number of steps performed so far (by step or run).
+        """
+        return self._steps
+
+
+    def getSkipped(self):
+        """
+        Returns the number of point-to-centroid distances the hamerly engine skipped.
+
+        This counts, over every partition so far, the distances that the bounds proved
+        unnecessary. It is always 0 for the other engines.
+        """
+        return self._skipped
+
+
+    def getMetric(self):
+        """
+        Returns the name of the distance metric of this algorithm.
+        """
+        return self._metric
+
+
+    def getDtype(self):
+        """
+        Returns the type distances are computed in, as one of the types in DTYPES.
+        """
+        return self._dtype.type
+
+
+    def addSink(self, sink):
+        """
+        Adds a function to call with the event of every step from now on.
+
+        Parameter sink: the function to add
+        Precondition: sink is a function taking one argument (a dictionary)
+        """
+        assert callable(sink)
+        self._sinks.append(sink)
+
+
+    def removeSink(self, sink):
+        """
+        Stops calling the given function after every step.
+
+        Parameter sink: the function to remove
+        Precondition: sink was added with addSink
+        """
+        self._sinks.remove(sink)
+
+
+    def getInertia(self):
+        """
+        Returns the sum of the squared euclidean distances from each point to its
+        cluster centroid.
+
+        This is the quantity k-means tries to make small; it never increases from one
+        step to the next. Points that are not in any cluster (such as before the first
+        step) do not count. The dataset is read one block at a time.
+        """
+        size = self._dataset.getSize()
+        centroids = self._centroids()
+        labels = self._membership()
+
+        result = 0.0
+        for start in range(0, size, a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, size)
+            local = labels[start:stop]
+            member = local >= 0
+            block = self._dataset.getBlock(start, stop)[member]
+            if isinstance(block, a6dataset.SparseBlock):
+                squares = a6kernels.sparse_residuals(block, centroids, local[member])
+                result = result+float(squares.sum())
+            else:
+                diff = block-centroids[local[member]]
+                result = result+float(numpy.einsum('ij,ij->', diff, diff))
+        return result
+
+
+    def __init__(self, dset, k, seeds=None, engine='python', workers=None, init='random',
+                 incremental=False, dtype=numpy.float64, metric='euclidean'):
         """
         Initializes the algorithm for the dataset ds, using k clusters.
 
@@ -80,6 +648,9 @@ class Algorithm(object):
         tuple of indices into the dataset. They specify which points should be the
         initial cluster centroids. Otherwise, the clusters are initialized by randomly
         selecting k different points from the database to be the cluster centroids.
+        How they are selected depends on init: 'random' picks them uniformly, while
+        'k-means++' and 'k-means||' use kmeanspp_seeds and kmeansll_seeds. These
+        usually need far fewer steps to converge, and find better clusters.
 
         Parameter dset: the dataset
         Precondition: dset is an instance of Dataset
@@ -89,24 +660,79 @@ class Algorithm(object):
 
         Paramter seeds: the initial cluster indices (OPTIONAL)
         Precondition: seeds is None, or a list/tuple of valid seeds.
+
+        Parameter engine: the partition engine (OPTIONAL)
+        Precondition: engine is one of the strings in ENGINES
+
+        Parameter workers: the number of worker processes (OPTIONAL)
+        Precondition: workers is None or an int > 0. If it is not None, engine is
+        'numpy'.
+
+        Parameter init: how to pick the seeds if seeds is None (OPTIONAL)
+        Precondition: init is one of the strings in INITS
+
+        Parameter incremental: whether to track convergence incrementally (OPTIONAL)
+        Precondition: incremental is a bool. If it is True, engine is not 'python'.
+
+        Parameter dtype: the type to compute distances in (OPTIONAL)
+        Precondition: dtype is one of the types in DTYPES. If it is numpy.float32,
+        engine is not 'python'.
+
+        Parameter metric: the distance metric (OPTIONAL)
+        Precondition: metric is a key of a6kernels.METRICS. If it is not 'euclidean',
+        engine is 'python' or 'numpy'.
+
+        If dset is sparse, engine must be 'numpy' with no workers, incremental must be
+        False and metric must be 'euclidean'.
         """
         # IMPLEMENT ME
         #enforce preconditions
         assert isinstance(dset, a6dataset.Dataset)
         assert type(k)==int and k>0 and k<=dset.getSize()
         assert seeds is None or valid_seeds(seeds, dset.getSize())
+        assert engine in ENGINES
+        assert workers is None or (type(workers) == int and workers > 0 and engine == 'numpy')
+        assert init in INITS
+        assert type(incremental) == bool and not (incremental and engine == 'python')
+        assert dtype in DTYPES and not (dtype == numpy.float32 and engine == 'python')
+        assert metric in a6kernels.METRICS
+        assert metric == 'euclidean' or engine in ['python', 'numpy']
+        assert not dset.isSparse() or (engine == 'numpy' and workers is None
+                                       and not incremental and metric == 'euclidean')
 
         # If seeds is None, get random sample indices
-        if seeds is None:
+        if seeds is None and init == 'k-means++':
+            seeds = kmeanspp_seeds(dset, k)
+        elif seeds is None and init == 'k-means||':
+            seeds = kmeansll_seeds(dset, k)
+        elif seeds is None:
             seeds = random.sample(range(dset.getSize()),k)
 
-        # Set dataset
+        # Set dataset and engine
         self._dataset=dset
+        self._engine = engine
+        self._dtype = numpy.dtype(dtype)
+        self._metric = metric
+        self._labels = None
+        self._upper = None
+        self._lower = None
+        self._anchors = None
+        self._skipped = 0
+        self._workers = workers
+        self._pool = None
+        self._shared = None
+        self._partial = None
+        self._incremental = incremental
+        self._previous = None
+        self._sums = None
+        self._steps = 0
+        self._index = None
+        self._sinks = []
 
         # Set cluster to empty list
         self._cluster = []
         for s in seeds:
-            cl = a6cluster.Cluster(dset,dset.getPoint(s))
+            cl = a6cluster.Cluster(dset,dset.getPoint(s),metric)
             self._cluster.append(cl)
 
 
@@ -115,7 +741,7 @@ class Algorithm(object):
         """
         Returns the cluster nearest to point
 
-        This method uses the distance method of each Cluster to compute the distance
+        This method uses the distance kernel of each Cluster to compute the distance
         between point and the cluster centroid. It returns the Cluster that is closest.
 
         Ties are broken in favor of clusters occurring earlier in the list returned
@@ -124,23 +750,27 @@ class Algorithm(object):
         Parameter point: The point to compare.
         Precondition: point is a tuple of numbers (int or float). Its length is the
         same as the dataset dimension.
+
+        This method is called once per point in every partition, so it only checks its
+        precondition if a6dataset.STRICT is True.
         """
         # IMPLEMENT ME
-        assert a6dataset.is_point(point)
-        assert len(point) == self._dataset.getDimension()
+        if a6dataset.STRICT:
+            assert a6dataset.is_point(point)
+            assert len(point) == self._dataset.getDimension()
 
         # Set the default nearestCluster to be the first cluster
         closestCluster = self._cluster[0]
 
         # Set the default nearestDistance to be the distance from the points
         # to the centroid of the first cluster
-        closestDistance = closestCluster.distance(point)
+        closestDistance = closestCluster._distance(point)
 
         # Loop through all clusters, if the distance < nearestDistance, set
         # nearestDistance to the current distance and set the nearestCluster
         # to current cluster
-        for x in self._cluster:
-            distance = x.distance(point)
+        for x in self._cluster[1:]:
+            distance = x._distance(point)
             if distance < closestDistance:
                 closestDistance = distance
                 closestCluster = x
@@ -153,17 +783,415 @@ class Algorithm(object):
         """
         Repartitions the dataset so each point is in exactly one Cluster.
         """
+        if self._incremental and self._labels is not None:
+            self._previous = self._labels.copy()
+
+        if self._engine == 'numpy' and self._workers is not None:
+            self._partitionParallel()
+            return
+        elif self._engine == 'numpy':
+            self._partitionNumpy()
+            return
+        elif self._engine == 'hamerly':
+            self._partitionHamerly()
+            return
+        elif self._engine == 'kdtree':
+            self._partitionKDTree()
+            return
+
         # First, clear each cluster of its points.
         for x in self._cluster:
             x.clear()
 
         #Then, for each point in the dataset,find the nearest cluster and
-        #add the point to that cluster.
-        for y in range(len(self._dataset.getContents())):
-            nearest = self._nearest(self._dataset.getContents()[y])
+        #add the point to that cluster. Get the contents once, since with
+        #array storage getContents() has to build a new list every call.
+        contents = self._dataset.getContents()
+        for y in range(len(contents)):
+            nearest = self._nearest(contents[y])
             nearest.addIndex(y)
 
 
+    def _partitionNumpy(self):
+        """
+        Repartitions the dataset using the vectorized kernels.
+
+        The distances from each block of points to all of the centroids are computed
+        at once (in chunks that fit a6kernels.MEMORY_BUDGET), and each point goes to
+        the closest centroid. As in _nearest, ties go to the earlier cluster. See
+        _assign for the rest.
+        """
+        self._assign(self._centroids().astype(self._dtype), None)
+
+
+    def _assign(self, centroids, tree):
+        """
+        Labels every point with its nearest centroid, and rebuilds the clusters.
+
+        The dataset is read one block at a time. While a block is at hand, the sums,
+        counts, bounding boxes, inertias and radii of its points with each label are
+        computed too (a6kernels.label_stats), and added to those of the earlier
+        blocks in order. The sums and counts are kept for the next call to _update,
+        and (with the euclidean metric) the rest are cached in the clusters after
+        they are rebuilt.
+
+        Parameter centroids: the current centroids
+        Precondition: centroids is a 2-D array of type _dtype with a row per cluster
+
+        Parameter tree: the k-d tree to label the points with
+        Precondition: tree is None (to use a6kernels.nearest) or a KDTree over
+        centroids
+        """
+        size = self._dataset.getSize()
+        k = len(centroids)
+        self._labels = numpy.empty(size, dtype=numpy.intp)
+
+        sums = numpy.zeros(centroids.shape, dtype=numpy.float64)
+        counts = numpy.zeros(k, dtype=numpy.intp)
+        low = numpy.full(centroids.shape, math.inf)
+        high = numpy.full(centroids.shape, -math.inf)
+        inertia = numpy.zeros(k, dtype=numpy.float64)
+        radius = numpy.zeros(k, dtype=numpy.float64)
+
+        for start in range(0, size, a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, size)
+            block = self._dataset.getBlock(start, stop)
+            if tree is None:
+                work = block.astype(self._dtype, copy=False)
+                labels, dists = a6kernels.nearest(work, centroids, a6kernels.MEMORY_BUDGET,
+                                                  self._metric)
+            else:
+                labels, dists = tree.nearest(block, a6kernels.MEMORY_BUDGET)
+            self._labels[start:stop] = labels
+
+            part = a6kernels.label_stats(block, labels, dists, k)
+            sums += part[0]
+            counts += part[1]
+            low = numpy.minimum(low, part[2])
+            high = numpy.maximum(high, part[3])
+            inertia += part[4]
+            radius = numpy.maximum(radius, part[5])
+
+        self._partial = (sums, counts)
+        self._regroup()
+        if self._metric == 'euclidean':
+            for pos in range(k):
+                self._cluster[pos]._setStats(counts[pos], sums[pos], low[pos], high[pos],
+                                             inertia[pos], radius[pos])
+
+
+    def _partitionParallel(self):
+        """
+        Repartitions the dataset using the worker processes.
+
+        The dataset is cut into one contiguous shard per worker (each a whole number of
+        a6kernels.BLOCK_ROWS blocks), and the workers run a6parallel.partition_shard
+        on them. The labels come back through shared memory, while the sums and counts
+        of each block are added together here, in the same order as
+        a6kernels.cluster_sums would. They are kept for the next call to _update.
+        """
+        centroids = self._centroids().astype(self._dtype)
+        size = self._dataset.getSize()
+        k = len(self._cluster)
+        self._share()
+
+        #cut the dataset into shards of whole blocks
+        blocks = -(-size // a6kernels.BLOCK_ROWS)
+        width = -(-blocks // self._workers)*a6kernels.BLOCK_ROWS
+        jobs = []
+        for start in range(0, size, width):
+            stop = min(start+width, size)
+            jobs.append(self._pool.submit(a6parallel.partition_shard, self._shared[1],
+                        self._shared[3], start, stop, centroids, a6kernels.MEMORY_BUDGET,
+                        self._metric))
+
+        #combine the partial sums in order
+        sums = numpy.zeros((k, self._dataset.getDimension()), dtype=numpy.float64)
+        counts = numpy.zeros(k, dtype=numpy.intp)
+        for job in jobs:
+            for part in job.result():
+                sums += part[0]
+                counts += part[1]
+
+        labels = numpy.ndarray(size, dtype=numpy.intp, buffer=self._shared[2].buf)
+        self._labels = labels.copy()
+        del labels
+        self._partial = (sums, counts)
+
+        self._regroup()
+
+
+    def _share(self):
+        """
+        Starts the worker processes and copies the dataset to shared memory, if needed.
+
+        The copy is made again if the dataset has changed size since the last copy.
+        """
+        size = self._dataset.getSize()
+        if self._shared is not None and self._shared[1][1][0] != size:
+            self._release()
+
+        if self._shared is None:
+            points, pspec = a6parallel.share(self._dataset)
+            labels, lspec = a6parallel.allocate((size,), numpy.intp)
+            self._shared = [points, pspec, labels, lspec]
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(self._workers)
+
+
+    def _release(self):
+        """
+        Frees the shared memory used by the worker processes, if any.
+        """
+        if self._shared is not None:
+            for memory in [self._shared[0], self._shared[2]]:
+                memory.close()
+                memory.unlink()
+            self._shared = None
+
+
+    def close(self):
+        """
+        Stops the worker processes and frees their shared memory.
+
+        The object can still be used afterwards; the workers are started again by the
+        next partition that needs them. This method does nothing if there are no
+        workers.
+        """
+        self._release()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+    def __enter__(self):
+        """
+        Returns this object, for use in a with statement.
+        """
+        return self
+
+
+    def __exit__(self, kind, value, traceback):
+        """
+        Calls close() at the end of a with statement.
+
+        Any exception raised in the with statement is passed on.
+        """
+        self.close()
+        return False
+
+
+    def __del__(self):
+        """
+        Calls close() when this object is garbage collected, if it still has workers.
+        """
+        #the initializer may have failed before these were set
+        if getattr(self, '_pool', None) is not None or getattr(self, '_shared', None) is not None:
+            self.close()
+
+
+    def _partitionHamerly(self):
+        """
+        Repartitions the dataset, skipping the points that cannot change cluster.
+
+        On the first call (or if the dataset or clusters changed size) every distance
+        is computed, as in _partitionNumpy. After that, the bounds of each point are
+        first loosened by how far the centroids moved. A point keeps its cluster if
+        its upper bound is below the larger of its lower bound and half the distance
+        from its centroid to the nearest other centroid. If not, its upper bound is
+        recomputed exactly and checked again. Only the points that fail both checks
+        are measured against every centroid.
+
+        The checks are strict (with a little slack for rounding, BOUND_SLACK or
+        BOUND_SLACK32 depending on the dtype), so a point is only skipped when its
+        own cluster is strictly the closest. Hence the result is the same as
+        _partitionNumpy, including how ties are broken.
+        """
+        centroids = self._centroids()
+        size = self._dataset.getSize()
+        k = len(self._cluster)
+
+        if (self._labels is None or self._upper is None or len(self._labels) != size
+            or self._anchors.shape != centroids.shape):
+            self._labels = numpy.empty(size, dtype=numpy.intp)
+            self._upper = numpy.empty(size, dtype=numpy.float64)
+            self._lower = numpy.empty(size, dtype=numpy.float64)
+            candidates = numpy.arange(size)
+        else:
+            candidates = self._loosenBounds(centroids)
+
+        #measure the remaining points against every centroid, a block at a time
+        work = centroids.astype(self._dtype)
+        for start in range(0, size, a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, size)
+            local = candidates[(candidates >= start) & (candidates < stop)]
+            if len(local) > 0:
+                block = self._dataset.getBlock(start, stop)[local-start].astype(self._dtype)
+                result = a6kernels.nearest_two(block, work, a6kernels.MEMORY_BUDGET)
+                self._labels[local] = result[0]
+                self._upper[local] = result[1]
+                self._lower[local] = result[2]
+
+        self._anchors = centroids
+        self._regroup()
+
+
+    def _partitionKDTree(self):
+        """
+        Repartitions the dataset using a k-d tree over the centroids.
+
+        The tree is built once, and then each block of points is labeled with it. As
+        in _nearest, ties go to the earlier cluster. See _assign for the rest.
+        """
+        tree = self._tree()
+        self._assign(tree.getCentroids(), tree)
+
+
+    def _tree(self):
+        """
+        Returns a k-d tree over the current centroids.
+
+        The tree is kept in _index, and is only built again if a centroid has changed
+        since it was built.
+        """
+        centroids = self._centroids().astype(self._dtype)
+        if self._index is None or not numpy.array_equal(self._index.getCentroids(), centroids):
+            self._index = a6kdtree.KDTree(centroids)
+        return self._index
+
+
+    def _loosenBounds(self, centroids):
+        """
+        Returns the points whose cluster might change, after moving the bounds.
+
+        This method moves the bounds of every point to account for the centroids
+        moving from _anchors to centroids. It then applies the two checks described
+        in _partitionHamerly, and returns an int array with the positions of the
+        points that fail both. Every distance that the checks make unnecessary is
+        added to the skipped count.
+
+        Parameter centroids: the current centroids
+        Precondition: centroids is a 2-D float array with the same shape as _anchors
+        """
+        k = len(centroids)
+        labels = self._labels
+        slack = BOUND_SLACK if self._dtype == numpy.float64 else BOUND_SLACK32
+
+        #loosen the bounds by how far each centroid moved
+        drift = numpy.sqrt(((centroids-self._anchors)**2).sum(axis=1))
+        self._upper += drift[labels]
+        if k > 1:
+            order = numpy.argsort(drift)
+            largest = numpy.full(k, drift[order[-1]])
+            largest[order[-1]] = drift[order[-2]]
+            self._lower -= largest[labels]
+
+        #half the distance from each centroid to the next closest one
+        gaps = a6kernels.distances(centroids, centroids)
+        gaps[numpy.arange(k), numpy.arange(k)] = math.inf
+        bound = numpy.maximum(gaps.min(axis=1)[labels]/2, self._lower)*(1-slack)
+
+        #first check, with the loose upper bound
+        candidates = numpy.flatnonzero(self._upper*(1+slack) >= bound)
+        self._skipped = self._skipped + (len(labels)-len(candidates))*k
+
+        #second check, with the exact distance to the point's own centroid
+        size = self._dataset.getSize()
+        for start in range(0, size, a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, size)
+            local = candidates[(candidates >= start) & (candidates < stop)]
+            if len(local) > 0:
+                diff = self._dataset.getBlock(start, stop)[local-start]-centroids[labels[local]]
+                self._upper[local] = numpy.sqrt(numpy.einsum('ij,ij->i', diff, diff))
+
+        remaining = candidates[self._upper[candidates]*(1+slack) >= bound[candidates]]
+        self._skipped = self._skipped + (len(candidates)-len(remaining))*(k-1)
+        return remaining
+
+
+    def _regroup(self):
+        """
+        Rebuilds the clusters from _labels.
+
+        Normally every cluster is rebuilt, with a single sort of the labels. When
+        convergence is tracked incrementally, only the clusters that gained or lost
+        points in the last partition are rebuilt, unless that is more than a quarter
+        of them.
+        """
+        k = len(self._cluster)
+        if self._previous is None or len(self._previous) != len(self._labels):
+            touched = numpy.arange(k)
+        else:
+            moved = self._labels != self._previous
+            touched = numpy.unique(numpy.concatenate([self._labels[moved], self._previous[moved]]))
+
+        if len(touched)*4 > k:
+            groups = a6kernels.group(self._labels, k)
+            for pos in range(k):
+                self._cluster[pos].setIndices(groups[pos].tolist())
+        else:
+            for pos in touched.tolist():
+                self._cluster[pos].setIndices(numpy.flatnonzero(self._labels == pos).tolist())
+
+
+    def _centroids(self):
+        """
+        Returns the centroids of all clusters as a 2-D float64 numpy array.
+
+        Row i of the array is the centroid of the cluster at position i of
+        getClusters().
+        """
+        result = numpy.array([x.getCentroid() for x in self._cluster], dtype=numpy.float64)
+        return result.reshape(len(self._cluster), self._dataset.getDimension())
+
+
+    def _restore(self, centroids, labels, steps):
+        """
+        Puts this object in the state of another run with the same dataset.
+
+        Parameter centroids: the centroid of each cluster
+        Precondition: centroids is a 2-D float array with a row per cluster, and a
+        column per dimension
+
+        Parameter labels: the cluster of each point
+        Precondition: labels is a 1-D int array of positions in getClusters() (or -1
+        for a point in no cluster), with an element per dataset point
+
+        Parameter steps: the number of steps the other run performed
+        Precondition: steps is an int >= 0
+        """
+        #new clusters, so that the centroids are exact and nothing is cached
+        self._cluster = [a6cluster.Cluster(self._dataset, tuple(row.tolist()), self._metric)
+                         for row in numpy.asarray(centroids, dtype=numpy.float64)]
+        self._labels = numpy.array(labels, dtype=numpy.intp)
+        self._previous = None
+        self._sums = None
+        self._partial = None
+        self._upper = None
+        self._steps = steps
+
+        if (self._labels >= 0).all():
+            self._regroup()
+        else:
+            for pos in range(len(self._cluster)):
+                self._cluster[pos].setIndices(numpy.flatnonzero(self._labels == pos).tolist())
+            self._labels = None
+
+
+    def _membership(self):
+        """
+        Returns an int array with the position of the cluster holding each point.
+
+        The array has an element per dataset point, which is -1 for a point that is not
+        in any cluster. It is built from the indices of the clusters, so it is correct
+        whatever engine made them.
+        """
+        labels = numpy.full(self._dataset.getSize(), -1, dtype=numpy.intp)
+        for pos in range(len(self._cluster)):
+            labels[numpy.array(self._cluster[pos].getIndices(), dtype=numpy.intp)] = pos
+        return labels
+
+
     # Part D
     def _update(self):
         """
@@ -172,22 +1200,89 @@ class Algorithm(object):
         This method first updates the centroids of all clusters'.  When it is done, it
         checks whether any of them have changed. It returns False if just one has
         changed. Otherwise, it returns True.
+
+        After a partition by the other engines, all of the new centroids are computed
+        at once from the sums of the points with each label. The numpy and kdtree
+        engines (and the worker processes) add these up during the partition, while
+        for the hamerly engine it takes one more pass over the dataset.
         """
         # IMPLEMENT ME
+        #when tracking incrementally, only move the points that changed cluster
+        if self._incremental and self._labels is not None:
+            return self._updateIncremental()
+
+        #with labels from the numpy engine, update every cluster in one pass
+        if self._partial is not None:
+            sums, counts = self._partial
+            self._partial = None
+            flags = a6cluster.update_all(self._cluster, sums, counts)
+            return flags.count(False) == 0
+        elif self._engine != 'python' and self._labels is not None:
+            k = len(self._cluster)
+            sums, counts = a6kernels.cluster_sums(self._dataset, self._labels, k)
+            flags = a6cluster.update_all(self._cluster, sums, counts)
+            return flags.count(False) == 0
+
         #loop through elements in cluster; append True/False according to
         #if centroids are updated
+        list = []
         for x in self._cluster:
-            list = []
             if x.update() == True:
                 list.append(True)
             else:
                 list.append(False)
 
         #if just one has changed return False
-        if list.count(True) >= 1:
-            return True
-        else:
+        if list.count(False) >= 1:
             return False
+        else:
+            return True
+
+
+    def _updateIncremental(self):
+        """
+        Returns True if no point changed cluster in the last partition; False otherwise.
+
+        The first time (or if the dataset changed size), this method adds up all of
+        the points of every cluster and updates every centroid. After that, it only
+        updates the centroids of the clusters that gained or lost points.
+
+        The numpy and kdtree engines add up every cluster during the partition anyway
+        (see _assign), so those sums are used as they are. After the hamerly engine,
+        which only measures some of the points, the points that changed cluster are
+        subtracted from the sums of their old clusters and added to the sums of their
+        new ones instead.
+        """
+        k = len(self._cluster)
+        partial = self._partial
+        self._partial = None
+
+        if self._sums is None or self._previous is None or len(self._previous) != len(self._labels):
+            if partial is None:
+                partial = a6kernels.cluster_sums(self._dataset, self._labels, k)
+            self._sums = partial
+            flags = a6cluster.update_all(self._cluster, partial[0], partial[1])
+            return flags.count(False) == 0
+
+        moved = numpy.flatnonzero(self._labels != self._previous)
+        if partial is not None:
+            self._sums = partial
+        if len(moved) == 0:
+            return True
+
+        #move the points from their old sums to their new ones
+        if partial is None:
+            points = a6kernels.gather(self._dataset, moved)
+            old = a6kernels.label_sums(points, self._previous[moved], k)
+            new = a6kernels.label_sums(points, self._labels[moved], k)
+            self._sums = (self._sums[0]-old[0]+new[0], self._sums[1]-old[1]+new[1])
+        sums, counts = self._sums
+
+        touched = numpy.unique(numpy.concatenate([self._labels[moved], self._previous[moved]]))
+        for pos in touched.tolist():
+            if counts[pos] > 0:
+                self._cluster[pos].setCentroid(sums[pos]/counts[pos])
+        return False
 
 
     def step(self):
@@ -200,23 +1295,149 @@ class Algorithm(object):
         """
         # In a cycle, we partition the points and then update the means.
         # IMPLEMENT ME
+        if len(self._sinks) > 0:
+            return self._stepMeasured()
+
         #repartition
+        self._steps = self._steps+1
         self._partition()
 
         #update
         return self._update()
 
 
+    def _stepMeasured(self):
+        """
+        Returns the result of step(), after sending an event about it to every sink.
+        """
+        self._steps = self._steps+1
+        labels = self._membership()
+        centroids = self._centroids()
+
+        start = time.perf_counter()
+        self._partition()
+        middle = time.perf_counter()
+        result = self._update()
+        end = time.perf_counter()
+
+        moved = int((self._membership() != labels).sum())
+        shift = numpy.sqrt(((self._centroids()-centroids)**2).sum(axis=1)).max()
+        event = {'step': self._steps, 'partition': middle-start, 'update': end-middle,
+                 'moved': moved, 'inertia': sum(x.getInertia() for x in self._cluster),
+                 'shift': float(shift), 'converged': result}
+        for sink in list(self._sinks):
+            sink(event)
+        return result
+
+
+    def classify(self, point):
+        """
+        Returns the cluster nearest to point, without adding point to it.
+
+        This is the same cluster as _nearest would return, but it is found with a
+        k-d tree over the centroids (or the batched kernel of the metric, if it is
+        not euclidean). The tree is kept between calls, as long as the centroids do
+        not change. The point does not have to be in the dataset.
+
+        Parameter point: The point to classify
+        Precondition: point is a tuple of numbers (int or float). Its length is the
+        same as the dataset dimension.
+        """
+        assert a6dataset.is_point(point)
+        assert len(point) == self._dataset.getDimension()
+
+        labels = self._classify(numpy.array([point], dtype=numpy.float64))
+        return self._cluster[int(labels[0])]
+
+
+    def classifyPoints(self, points):
+        """
+        Returns an int array with the position of the nearest cluster to each point.
+
+        Element i of the result is the position in getClusters() of the cluster that
+        classify would return for point i, but all of the points are classified at
+        once. The points do not change any cluster.
+
+        Parameter points: The points to classify
+        Precondition: points is a 2-D numpy array with a row per point, and as many
+        columns as the dataset dimension
+        """
+        assert isinstance(points, numpy.ndarray) and points.ndim == 2
+        assert points.shape[1] == self._dataset.getDimension()
+
+        labels = numpy.empty(len(points), dtype=numpy.intp)
+        for start in range(0, len(points), a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, len(points))
+            labels[start:stop] = self._classify(points[start:stop])
+        return labels
+
+
+    def _classify(self, points):
+        """
+        Returns an int array with the position of the nearest cluster to each point.
+
+        Parameter points: The points to classify
+        Precondition: points is a 2-D numpy array with a row per point, and as many
+        columns as the dataset dimension
+        """
+        if self._metric == 'euclidean':
+            return self._tree().nearest(points, a6kernels.MEMORY_BUDGET)[0]
+        centroids = self._centroids().astype(self._dtype)
+        work = points.astype(self._dtype, copy=False)
+        return a6kernels.nearest(work, centroids, a6kernels.MEMORY_BUDGET, self._metric)[0]
+
+
     # Part D
-    def run(self, maxstep):
+    def checkpoint(self, filename):
+        """
+        Saves the state of this algorithm to the given file, for resume.
+
+        The file is a .npz file holding the format version, the centroids, the cluster
+        of each point, the number of steps so far and the options of this algorithm.
+        It is first written to filename+'.tmp' and then renamed to filename, so a crash
+        while writing never leaves a partial checkpoint behind.
+
+        Parameter filename: the file to write
+        Precondition: filename is a string
+        """
+        assert type(filename) == str
+
+        temporary = filename+'.tmp'
+        with open(temporary, 'wb') as file:
+            numpy.savez(file, version=numpy.array(CHECKPOINT_VERSION),
+                        centroids=self._centroids(), labels=self._membership(),
+                        steps=numpy.array(self._steps), engine=numpy.array(self._engine),
+                        metric=numpy.array(self._metric), dtype=numpy.array(self._dtype.str),
+                        incremental=numpy.array(self._incremental))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+
+
+    def run(self, maxstep, checkpoint=None, every=None, seconds=None):
         """
         Continues clustering until either it converges or performs maxstep steps.
 
         After the maxstep call to step, if this calculation did not converge, this
         method will stop.
 
+        If checkpoint is not None, the state of the algorithm is saved to that file
+        (see the method checkpoint) every every steps, or once seconds seconds have
+        passed since it was last saved, whichever comes first. It is also saved when
+        this method stops. A crashed run can then go on from the last checkpoint
+        with resume.
+
         Parameter maxstep: The maximum number of steps to perform
         Precondition: maxstep is an int >= 0
+
+        Parameter checkpoint: The checkpoint file (OPTIONAL)
+        Precondition: checkpoint is None or a string
+
+        Parameter every: The number of steps between checkpoints (OPTIONAL)
+        Precondition: every is None or an int > 0
+
+        Parameter seconds: The time between checkpoints (OPTIONAL)
+        Precondition: seconds is None or a number > 0
         """
         # Call k_means_step repeatedly, up to maxstep times, until the
         #algorithm converges. Stop once you reach maxstep iterations even if
@@ -226,8 +1447,229 @@ class Algorithm(object):
         # IMPLEMENT ME
         #enforce precondition
         assert type(maxstep)==int and maxstep>=0
+        assert checkpoint is None or type(checkpoint) == str
+        assert every is None or (type(every) == int and every > 0)
+        assert seconds is None or (type(seconds) in [int,float] and seconds > 0)
 
         #loop through indices in maxstep, check for convergence/max num steps
+        saved = time.monotonic()
         for x in range(maxstep):
             if self.step()==True:
+                break
+            if checkpoint is not None and ((every is not None and (x+1) % every == 0)
+                or (seconds is not None and time.monotonic()-saved >= seconds)):
+                self.checkpoint(checkpoint)
+                saved = time.monotonic()
+
+        if checkpoint is not None:
+            self.checkpoint(checkpoint)
+
+
+class MiniBatchAlgorithm(object):
+    """
+    A class to run k-means on a stream of points that is too large to hold in memory.
+
+    Instead of a Dataset, this class reads its points from an iterator (such as a
+    generator or an open file), a batch of points at a time. Each call to step()
+    reads the next batch, puts every point of the batch in the nearest cluster, and
+    then moves each centroid towards the points it received. The amount a centroid
+    moves is governed by its own learning rate, which is 1 over the number of points
+    that cluster has received so far. Hence every centroid is the running mean of
+    all of the points ever assigned to it, and only one batch is in memory at a time.
+
+    The clusters returned by getClusters() are ordinary Cluster objects over a
+    Dataset holding the last batch. Their indices are the positions in that batch of
+    the points they received.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _source: The iterator supplying the points
+    # Invariant: _source is an iterator whose elements are points (int/float
+    # tuples) of dimension _dimension
+    #
+    # Attribute _dimension: The point dimension
+    # Invariant: _dimension is an int > 0
+    #
+    # Attribute _batch: The number of points read by each step
+    # Invariant: _batch is an int > 0
+    #
+    # MUTABLE ATTRIBUTES (Can be changed at any time, via step)
+    # Attribute _cluster: The clusters over the last batch
+    # Invariant: _cluster is a non-empty list of Cluster instances
+    #
+    # Attribute _counts: The number of points each cluster has received
+    # Invariant: _counts is a 1-D numpy int array with an element per cluster
+    #
+    # Attribute _batches: The number of batches read so far
+    # Invariant: _batches is an int >= 0
+    #
+    # Attribute _finished: Whether the source has run out of points
+    # Invariant: _finished is a bool
+
+    def getClusters(self):
+        """
+        Returns the list of clusters in this object.
+
+        This method returns the cluster list directly (it does not copy).
+        """
+        return self._cluster
+
+
+    def getBatches(self):
+        """
+        Returns the number of batches read so far (including the first batch).
+        """
+        return self._batches
+
+
+    def isFinished(self):
+        """
+        Returns True if the source has no more points; False otherwise.
+        """
+        return self._finished
+
+
+    def __init__(self, source, dim, k, batch=1024, seeds=None):
+        """
+        Initializes the algorithm for the points in source, using k clusters.
+
+        This method reads the first batch from source. If the optional argument seeds
+        is supplied, those seeds are indices into this first batch, and specify which
+        points should be the initial centroids. Otherwise, k different points of the
+        first batch are picked at random.
+
+        Parameter source: the points to cluster
+        Precondition: source is an iterable (such as a list, generator or iterator)
+        of points (int/float tuples) of dimension dim
+
+        Parameter dim: the point dimension
+        Precondition: dim is an int > 0
+
+        Parameter k: the number of clusters
+        Precondition: k is an int, 0 < k <= batch, and source has at least k points
+
+        Parameter batch: the number of points read by each step (OPTIONAL)
+        Precondition: batch is an int > 0
+
+        Parameter seeds: the initial cluster indices (OPTIONAL)
+        Precondition: seeds is None, or a list/tuple of valid seeds for the first batch.
+        """
+        assert type(dim) == int and dim > 0
+        assert type(batch) == int and batch > 0
+        assert type(k) == int and k > 0 and k <= batch
+
+        self._source = iter(source)
+        self._dimension = dim
+        self._batch = batch
+        self._batches = 0
+        self._finished = False
+
+        #read the first batch, and seed the clusters from it
+        first = self._read()
+        assert first is not None and first.getSize() >= k
+        assert seeds is None or valid_seeds(seeds, first.getSize())
+        if seeds is None:
+            seeds = random.sample(range(first.getSize()),k)
+
+        self._cluster = []
+        for s in seeds:
+            self._cluster.append(a6cluster.Cluster(first,first.getPoint(s)))
+        self._counts = numpy.zeros(k, dtype=numpy.intp)
+        self._learn(first, 0)
+
+
+    def _read(self):
+        """
+        Returns a Dataset with the next batch of points, or None if there are none.
+
+        The batch has _batch points, unless the source runs out first. If it does,
+        this method sets _finished to True.
+        """
+        points = list(itertools.islice(self._source, self._batch))
+        if len(points) < self._batch:
+            self._finished = True
+        if len(points) == 0:
+            return None
+
+        self._batches = self._batches+1
+        result = a6dataset.Dataset(self._dimension, dtype=numpy.float64)
+        result.addPoints(points)
+        return result
+
+
+    def _learn(self, dset, tolerance):
+        """
+        Returns True if no centroid moved more than tolerance; False otherwise.
+
+        This method moves the clusters over to dset, puts each point of dset in the
+        nearest cluster, and then moves each centroid to the running mean of all of
+        the points its cluster has received. As in Cluster.update, a centroid that is
+        close to its new position according to numpy.allclose does not move.
+
+        Parameter dset: the batch
+        Precondition: dset is a Dataset of float64 array storage with the same
+        dimension as this algorithm
+
+        Parameter tolerance: the largest move that counts as unchanged
+        Precondition: tolerance is an int or float >= 0
+        """
+        k = len(self._cluster)
+        centroids = numpy.array([x.getCentroid() for x in self._cluster], dtype=numpy.float64)
+        self._cluster = [a6cluster.Cluster(dset,x.getCentroid()) for x in self._cluster]
+
+        #partition the batch
+        labels = a6kernels.nearest(dset.getArray(), centroids, a6kernels.MEMORY_BUDGET)[0]
+        groups = a6kernels.group(labels, k)
+        for pos in range(k):
+            self._cluster[pos].setIndices(groups[pos].tolist())
+
+        #move each centroid to the running mean of its points
+        sums, counts = a6kernels.label_sums(dset.getArray(), labels, k)
+        self._counts += counts
+        rates = counts/numpy.maximum(self._counts, 1)
+        moved = centroids + rates[:, None]*(sums/numpy.maximum(counts, 1)[:, None] - centroids)
+        shift = numpy.sqrt(((moved-centroids)**2).sum(axis=1))
+
+        result = True
+        for pos in range(k):
+            if counts[pos] > 0 and self._cluster[pos].setCentroid(moved[pos]) == False:
+                result = result and shift[pos] <= tolerance
+        return result
+
+
+    def step(self, tolerance=0):
+        """
+        Returns True if the algorithm converges after one more batch; False otherwise.
+
+        This method reads the next batch from the source and learns from it. The
+        algorithm has converged if no centroid moved by more than tolerance (a move
+        that numpy.allclose considers no move at all always counts as converged). If
+        the source has no points left, this method does nothing and returns True.
+
+        Parameter tolerance: the largest move that counts as unchanged (OPTIONAL)
+        Precondition: tolerance is an int or float >= 0
+        """
+        assert type(tolerance) in [int,float] and tolerance >= 0
+        if self._finished:
+            return True
+
+        dset = self._read()
+        if dset is None:
+            return True
+        return self._learn(dset, tolerance)
+
+
+    def run(self, maxbatch, tolerance=0):
+        """
+        Continues clustering until it converges, runs out of points, or reads maxbatch
+        more batches.
+
+        Parameter maxbatch: The maximum number of batches to read
+        Precondition: maxbatch is an int >= 0
+
+        Parameter tolerance: the largest move that counts as unchanged (OPTIONAL)
+        Precondition: tolerance is an int or float >= 0
+        """
+        assert type(maxbatch)==int and maxbatch>=0
+        for x in range(maxbatch):
+            if self.step(tolerance) or self._finished:
                 return
@@ -0,0 +1,544 @@
+"""
+Benchmarks for k-Means clustering
+
+This file measures how the different options of the clustering classes perform on
+synthetic data: clouds of points (Gaussian blobs) around randomly placed centers.
+Run it as a script; for example
+
+    python a6bench.py seeding --n 20000 --dim 2 --k 20 --trials 5
+
+compares how many steps each seeding strategy needs to converge, while
+
+    python a6bench.py suite --n 1000 100000 --dim 2 64 --k 16 --out today.json
+    python a6bench.py compare yesterday.json today.json
+
+times each phase of the clustering over a grid of sizes and modes, saves the results,
+and compares them against an earlier run. Finally
+
+    python a6bench.py precision --n 100000 --dim 256 --k 64
+
+times clustering in float32 against float64, and reports how much the results differ.
+
+"""
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import tracemalloc
+import numpy
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6kernels
+import a6algorithm
+
+
+# The grid swept by the suite benchmark when none is given
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+DIMENSIONS = [2, 16, 64, 256]
+CLUSTERS = [2, 16, 128, 1024]
+
+# The storage modes of a dataset, and the dtype for each
+STORAGES = {'list': None, 'float64': numpy.float64, 'float32': numpy.float32}
+
+# The fields that identify a configuration in the suite results
+CONFIGURATION = ['n', 'dim', 'k', 'storage', 'engine', 'workers']
+
+# The timed phases of the suite benchmark
+PHASES = ['dataset', 'init', 'partition', 'update', 'step', 'run']
+
+
+def blobs(n, dim, k, spread=1.0, dtype=numpy.float64):
+    """
+    Returns a Dataset of n points scattered around k random centers.
+
+    The centers are picked uniformly in a cube of side 10*k**(1/dim), so that the
+    blobs mostly stay apart, and each point is drawn from a normal distribution with
+    standard deviation spread around a random center. The points are made with a
+    numpy generator seeded from the module random, so random.seed makes the result
+    repeatable. They are generated and added a chunk at a time, so that even very
+    large datasets never need more than one chunk of extra memory.
+
+    Parameter n: the number of points
+    Precondition: n is an int > 0
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter k: the number of blobs
+    Precondition: k is an int > 0
+
+    Parameter spread: the standard deviation of each blob (OPTIONAL)
+    Precondition: spread is an int or float >= 0
+
+    Parameter dtype: the storage type of the dataset (OPTIONAL)
+    Precondition: dtype is numpy.float64 or numpy.float32
+    """
+    generator = numpy.random.default_rng(random.getrandbits(64))
+    centers = generator.random((k,dim))*10*k**(1/dim)
+    result = a6dataset.Dataset(dim, dtype=dtype)
+    for start in range(0, n, a6dataset.INGEST_ROWS):
+        size = min(a6dataset.INGEST_ROWS, n-start)
+        points = centers[generator.integers(k, size=size)]+generator.normal(0, spread, (size,dim))
+        result.addPoints(points)
+    return result
+
+
+def inertia(dset, alg):
+    """
+    Returns the sum of the squared distances from each point to its nearest centroid.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter alg: the clustering to measure
+    Precondition: alg is an instance of Algorithm for dset
+    """
+    centroids = numpy.array([c.getCentroid() for c in alg.getClusters()], dtype=numpy.float64)
+    dists = a6kernels.assign(dset, centroids)[1]
+    return float((dists*dists).sum())
+
+
+def steps(alg, maxstep):
+    """
+    Returns the number of steps alg takes to converge (at most maxstep).
+
+    Parameter alg: the clustering to run
+    Precondition: alg is an instance of Algorithm
+
+    Parameter maxstep: the maximum number of steps to perform
+    Precondition: maxstep is an int > 0
+    """
+    for x in range(maxstep):
+        if alg.step():
+            return x+1
+    return maxstep
+
+
+def seeding(n, dim, k, trials, maxstep=300, engine='numpy'):
+    """
+    Returns a list of results comparing the seeding strategies in a6algorithm.INITS.
+
+    Each trial makes a new blobs dataset, and clusters it once with each strategy.
+    The result has a dictionary per strategy, with the average seeding time (in
+    seconds), number of steps to converge and final inertia over all trials.
+
+    Parameter n: the number of points
+    Precondition: n is an int > 0
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k <= n
+
+    Parameter trials: the number of datasets to try
+    Precondition: trials is an int > 0
+
+    Parameter maxstep: the maximum number of steps per run (OPTIONAL)
+    Precondition: maxstep is an int > 0
+
+    Parameter engine: the partition engine (OPTIONAL)
+    Precondition: engine is one of the strings in a6algorithm.ENGINES
+    """
+    totals = {}
+    for init in a6algorithm.INITS:
+        totals[init] = [0.0, 0, 0.0]
+
+    for x in range(trials):
+        dset = blobs(n, dim, k)
+        for init in a6algorithm.INITS:
+            start = time.perf_counter()
+            alg = a6algorithm.Algorithm(dset, k, engine=engine, init=init)
+            totals[init][0] += time.perf_counter()-start
+            totals[init][1] += steps(alg, maxstep)
+            totals[init][2] += inertia(dset, alg)
+
+    result = []
+    for init in a6algorithm.INITS:
+        result.append({'init': init, 'seconds': totals[init][0]/trials,
+                       'steps': totals[init][1]/trials, 'inertia': totals[init][2]/trials})
+    return result
+
+
+def profile(n, dim, k, storage='float64', engine='numpy', workers=1, maxstep=50, memory=True,
+            seed=0):
+    """
+    Returns a dictionary of timings for one configuration of the clustering classes.
+
+    This method makes a blobs dataset with the given storage, and then times (in
+    seconds) each phase of clustering it separately: making the dataset, making
+    the Algorithm, one _partition, one _update, one more full step, and finally a
+    run of at most maxstep steps. It also records the total number of steps (with
+    the separate _partition and _update counting as one).
+
+    The dataset and the seeds depend only on seed, n, dim and k, so that different
+    storage modes and engines are timed on the same data.
+
+    If memory is True, the dataset and the first step are then repeated under
+    tracemalloc, to record their peak memory use (in bytes). This is done apart
+    from the timings, since tracing slows Python code down.
+
+    Parameter n: the number of points
+    Precondition: n is an int > 0
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k <= n
+
+    Parameter storage: the dataset storage mode (OPTIONAL)
+    Precondition: storage is a key of STORAGES
+
+    Parameter engine: the partition engine (OPTIONAL)
+    Precondition: engine is one of the strings in a6algorithm.ENGINES
+
+    Parameter workers: the number of processes (OPTIONAL)
+    Precondition: workers is an int > 0. If it is more than 1, engine is 'numpy'.
+
+    Parameter maxstep: the maximum number of steps of the run (OPTIONAL)
+    Precondition: maxstep is an int >= 0
+
+    Parameter memory: whether to record peak memory use (OPTIONAL)
+    Precondition: memory is a bool
+
+    Parameter seed: the random seed (OPTIONAL)
+    Precondition: seed is an int
+    """
+    assert storage in STORAGES
+    dtype = STORAGES[storage]
+    result = {'n': n, 'dim': dim, 'k': k, 'storage': storage, 'engine': engine,
+              'workers': workers}
+    random.seed('%d/%d/%d/%d' % (seed, n, dim, k))
+
+    start = time.perf_counter()
+    dset = blobs(n, dim, k, dtype=dtype)
+    result['dataset'] = time.perf_counter()-start
+    seeds = random.sample(range(n), k)
+
+    start = time.perf_counter()
+    alg = a6algorithm.Algorithm(dset, k, seeds, engine, None if workers == 1 else workers)
+    result['init'] = time.perf_counter()-start
+
+    for phase in ['partition', 'update', 'step']:
+        start = time.perf_counter()
+        if phase == 'partition':
+            alg._partition()
+        elif phase == 'update':
+            alg._update()
+        else:
+            alg.step()
+        result[phase] = time.perf_counter()-start
+
+    start = time.perf_counter()
+    alg.run(maxstep)
+    result['run'] = time.perf_counter()-start
+    result['steps'] = alg.getSteps()+1
+    alg.close()
+
+    if memory:
+        del alg, dset
+        random.seed('%d/%d/%d/%d' % (seed, n, dim, k))
+        tracemalloc.start()
+        dset = blobs(n, dim, k, dtype=dtype)
+        result['peak_dataset'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        alg = a6algorithm.Algorithm(dset, k, random.sample(range(n), k), engine,
+                                    None if workers == 1 else workers)
+        alg.step()
+        result['peak_step'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        alg.close()
+
+    return result
+
+
+def precision(n, dim, k, engine='numpy', maxstep=50, seed=0):
+    """
+    Returns a list of results comparing clustering in float64 and in float32.
+
+    This method makes a float64 blobs dataset and a float32 copy of it, and clusters
+    both from the same seeds: the first with distances in float64, the second with
+    distances in float32 (see Algorithm). The result has a dictionary per mode with
+    the time of the run (in seconds), its number of steps, the time per step, and
+    the accuracy of its final clusters: the inertia measured in float64 against the
+    float64 points, the fraction of points in the same cluster as in float64, and
+    the largest distance between a centroid and the float64 one.
+
+    Parameter n: the number of points
+    Precondition: n is an int > 0
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter k: the number of clusters
+    Precondition: k is an int, 0 < k <= n
+
+    Parameter engine: the partition engine (OPTIONAL)
+    Precondition: engine is one of the strings in a6algorithm.ENGINES, but not 'python'
+
+    Parameter maxstep: the maximum number of steps of each run (OPTIONAL)
+    Precondition: maxstep is an int > 0
+
+    Parameter seed: the random seed (OPTIONAL)
+    Precondition: seed is an int
+    """
+    assert engine != 'python'
+    random.seed('%d/%d/%d/%d' % (seed, n, dim, k))
+    exact = blobs(n, dim, k)
+    single = a6dataset.Dataset(dim, dtype=numpy.float32)
+    single.addPoints(exact.getArray())
+    seeds = random.sample(range(n), k)
+
+    result = []
+    for mode, dset, dtype in [('float64', exact, numpy.float64), ('float32', single, numpy.float32)]:
+        alg = a6algorithm.Algorithm(dset, k, seeds, engine, dtype=dtype)
+        start = time.perf_counter()
+        alg.run(maxstep)
+        seconds = time.perf_counter()-start
+
+        labels = alg._membership()
+        centroids = alg._centroids()
+        if mode == 'float64':
+            expected = (labels, centroids)
+        shift = numpy.sqrt(((centroids-expected[1])**2).sum(axis=1)).max()
+        result.append({'mode': mode, 'seconds': seconds, 'steps': alg.getSteps(),
+                       'step_seconds': seconds/max(alg.getSteps(), 1),
+                       'inertia': inertia(exact, alg),
+                       'agreement': float((labels == expected[0]).mean()),
+                       'shift': float(shift)})
+    return result
+
+
+def suite(sizes=SIZES, dims=DIMENSIONS, ks=CLUSTERS, storages=('float64',),
+          engines=('numpy',), workers=(1,), maxstep=50, memory=True, seed=0):
+    """
+    Returns a list with the result of profile for every configuration in the grid.
+
+    Configurations with more clusters than points, or with several workers for an
+    engine other than 'numpy', are skipped. Each result is printed as it finishes,
+    since the large configurations can take a long time.
+
+    Parameter sizes: the numbers of points to try (OPTIONAL)
+    Precondition: sizes is a list of ints > 0
+
+    Parameter dims: the point dimensions to try (OPTIONAL)
+    Precondition: dims is a list of ints > 0
+
+    Parameter ks: the numbers of clusters to try (OPTIONAL)
+    Precondition: ks is a list of ints > 0
+
+    Parameter storages: the storage modes to try (OPTIONAL)
+    Precondition: storages is a list or tuple of keys of STORAGES
+
+    Parameter engines: the partition engines to try (OPTIONAL)
+    Precondition: engines is a list or tuple of strings in a6algorithm.ENGINES
+
+    Parameter workers: the numbers of processes to try (OPTIONAL)
+    Precondition: workers is a list or tuple of ints > 0
+
+    Parameter maxstep: the maximum number of steps of each run (OPTIONAL)
+    Precondition: maxstep is an int >= 0
+
+    Parameter memory: whether to record peak memory use (OPTIONAL)
+    Precondition: memory is a bool
+
+    Parameter seed: the random seed (OPTIONAL)
+    Precondition: seed is an int
+    """
+    result = []
+    for n in sizes:
+        for dim in dims:
+            for k in ks:
+                for storage in storages:
+                    for engine in engines:
+                        for count in workers:
+                            if k <= n and (count == 1 or engine == 'numpy'):
+                                row = profile(n, dim, k, storage, engine, count, maxstep,
+                                              memory, seed)
+                                show([row], len(result) == 0)
+                                result.append(row)
+    return result
+
+
+def save(rows, filename):
+    """
+    Writes a list of result dictionaries to a file.
+
+    The file is JSON if filename ends with .json, and CSV otherwise.
+
+    Parameter rows: the results to save
+    Precondition: rows is a non-empty list of dictionaries with the same keys
+
+    Parameter filename: the file to write
+    Precondition: filename is a string
+    """
+    with open(filename, 'w', newline='') as file:
+        if filename.endswith('.json'):
+            json.dump(rows, file, indent=1)
+        else:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def load(filename):
+    """
+    Returns the list of result dictionaries saved in a file by save.
+
+    Parameter filename: the file to read
+    Precondition: filename is a string naming a file written by save
+    """
+    with open(filename, newline='') as file:
+        if filename.endswith('.json'):
+            return json.load(file)
+
+        result = []
+        for row in csv.DictReader(file):
+            for key in row:
+                if key not in ['storage', 'engine']:
+                    row[key] = _parse(row[key])
+            result.append(row)
+        return result
+
+
+def compare(old, new):
+    """
+    Returns a list comparing two lists of suite results, configuration by configuration.
+
+    For every configuration in both lists, the result has a dictionary with the
+    configuration and, for every timed phase, the ratio of the new time to the old
+    one. A ratio above 1 is a slowdown.
+
+    Parameter old: the earlier results
+    Precondition: old is a list of dictionaries returned by profile
+
+    Parameter new: the later results
+    Precondition: new is a list of dictionaries returned by profile
+    """
+    earlier = {}
+    for row in old:
+        earlier[tuple(row[key] for key in CONFIGURATION)] = row
+
+    result = []
+    for row in new:
+        match = earlier.get(tuple(row[key] for key in CONFIGURATION))
+        if match is not None:
+            entry = {}
+            for key in CONFIGURATION:
+                entry[key] = row[key]
+            for phase in PHASES:
+                entry[phase] = row[phase]/match[phase] if match[phase] > 0 else math.inf
+            result.append(entry)
+    return result
+
+
+def show(rows, header=True):
+    """
+    Prints a list of result dictionaries as a table.
+
+    Parameter rows: the results to print
+    Precondition: rows is a list of dictionaries with the same keys
+
+    Parameter header: whether to print the column names first (OPTIONAL)
+    Precondition: header is a bool
+    """
+    if len(rows) == 0:
+        return
+
+    keys = list(rows[0].keys())
+    if header:
+        print('  '.join('%14s' % key for key in keys))
+    for row in rows:
+        cells = []
+        for key in keys:
+            value = row[key]
+            cells.append('%14.6g' % value if type(value) == float else '%14s' % value)
+        print('  '.join(cells))
+
+
+# HELPER FUNCTIONS
+def _parse(text):
+    """
+    Returns the value of a cell read from a csv file.
+
+    The value is an int if the text is one, and otherwise a float if the text is one
+    (including 'inf' and 'nan'). If it is neither, the text itself is returned.
+
+    Parameter text: the text of the cell
+    Precondition: text is a string
+    """
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def main():
+    """
+    Runs the benchmark named on the command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks for k-means clustering')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('seeding', help='compare the seeding strategies')
+    command.add_argument('--n', type=int, default=20000, help='number of points')
+    command.add_argument('--dim', type=int, default=2, help='point dimension')
+    command.add_argument('--k', type=int, default=20, help='number of clusters')
+    command.add_argument('--trials', type=int, default=5, help='datasets to average over')
+    command.add_argument('--maxstep', type=int, default=300, help='step limit per run')
+    command.add_argument('--seed', type=int, default=None, help='random seed')
+
+    command = commands.add_parser('suite', help='time each phase over a grid of sizes')
+    command.add_argument('--n', type=int, nargs='+', default=SIZES, help='numbers of points')
+    command.add_argument('--dim', type=int, nargs='+', default=DIMENSIONS, help='dimensions')
+    command.add_argument('--k', type=int, nargs='+', default=CLUSTERS, help='numbers of clusters')
+    command.add_argument('--storage', nargs='+', default=['float64'], choices=list(STORAGES),
+                         help='dataset storage modes')
+    command.add_argument('--engine', nargs='+', default=['numpy'], choices=a6algorithm.ENGINES,
+                         help='partition engines')
+    command.add_argument('--workers', type=int, nargs='+', default=[1], help='process counts')
+    command.add_argument('--maxstep', type=int, default=50, help='step limit per run')
+    command.add_argument('--no-memory', action='store_true', help='skip peak memory')
+    command.add_argument('--out', default=None, help='.json or .csv file for the results')
+    command.add_argument('--seed', type=int, default=0, help='random seed')
+
+    command = commands.add_parser('precision', help='compare float32 against float64')
+    command.add_argument('--n', type=int, default=100000, help='number of points')
+    command.add_argument('--dim', type=int, default=256, help='point dimension')
+    command.add_argument('--k', type=int, default=64, help='number of clusters')
+    command.add_argument('--engine', default='numpy', choices=a6algorithm.ENGINES[1:],
+                         help='partition engine')
+    command.add_argument('--maxstep', type=int, default=50, help='step limit per run')
+    command.add_argument('--seed', type=int, default=0, help='random seed')
+
+    command = commands.add_parser('compare', help='compare two saved suite results')
+    command.add_argument('old', help='the earlier results')
+    command.add_argument('new', help='the later results')
+
+    args = parser.parse_args()
+    if args.command == 'seeding' and args.seed is not None:
+        random.seed(args.seed)
+    if args.command == 'seeding':
+        show(seeding(args.n, args.dim, args.k, args.trials, args.maxstep))
+    elif args.command == 'precision':
+        show(precision(args.n, args.dim, args.k, args.engine, args.maxstep, args.seed))
+    elif args.command == 'suite':
+        rows = suite(args.n, args.dim, args.k, args.storage, args.engine, args.workers,
+                     args.maxstep, not args.no_memory, args.seed)
+        if args.out is not None and len(rows) > 0:
+            save(rows, args.out)
+    else:
+        show(compare(load(args.old), load(args.new)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+Bisecting k-Means clustering
+
+This file contains the class BisectTree, for clustering with a very large number of
+clusters. Instead of moving k centroids at once, it starts with a single cluster and
+keeps splitting the cluster of largest inertia in two with 2-means (an Algorithm with
+k=2). The splits form a binary tree, and a new point is labeled by going down the
+tree, so it is only measured against two centroids per level instead of all k.
+
+"""
+import heapq
+import numpy
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6kernels
+import a6algorithm
+
+
+class BisectTree(object):
+    """
+    A class representing a tree of clusters found by bisecting k-means.
+
+    Each node of the tree is a cluster of dataset points. Node 0, the root, holds all
+    of the points. An inner node was split by 2-means into its two children, and the
+    leaves are the final clusters, numbered 0..getSize()-1 in the order they were
+    made (so also in the order of their nodes). Every node records its centroid, its
+    number of points and its inertia.
+
+    The method predict() labels new points by descending the tree: at each inner
+    node, a point moves to the child whose centroid is closer. That takes two
+    distances per level, so about 2 log2(k) for a balanced tree. The leaf found this
+    way is usually, but not always, the leaf with the nearest centroid.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _centroids: The centroid of each node
+    # Invariant: _centroids is a 2-D float64 array with a row per node
+    #
+    # Attribute _children: The children of each node
+    # Invariant: _children is a 2-D int array with a row [left, right] per node. Both
+    # are positions of nodes, or -1 for a leaf.
+    #
+    # Attribute _leaves: The leaf number of each node
+    # Invariant: _leaves is a 1-D int array with an element per node, which is the
+    # number of the leaf (or -1 for an inner node)
+    #
+    # Attribute _counts: The number of points in each node
+    # Invariant: _counts is a 1-D int array with an element per node
+    #
+    # Attribute _inertia: The inertia of each node
+    # Invariant: _inertia is a 1-D float array with an element per node, the sum of
+    # the squared euclidean distances from its points to its centroid
+    #
+    # Attribute _labels: The leaf of each dataset point
+    # Invariant: _labels is a 1-D int array with an element per dataset point
+
+    def getSize(self):
+        """
+        Returns the number of leaves (final clusters) in this tree.
+        """
+        return int((self._leaves >= 0).sum())
+
+
+    def getNodes(self):
+        """
+        Returns the number of nodes in this tree.
+        """
+        return len(self._centroids)
+
+
+    def getDepth(self):
+        """
+        Returns the number of splits on the longest path from the root to a leaf.
+        """
+        depth = numpy.zeros(len(self._children), dtype=numpy.intp)
+        for node in range(len(self._children)):
+            for child in self._children[node].tolist():
+                if child >= 0:
+                    depth[child] = depth[node]+1
+        return int(depth.max())
+
+
+    def getChildren(self, node):
+        """
+        Returns the pair (left, right) of children of the given node, or None for a leaf.
+
+        Parameter node: the node
+        Precondition: node is an int, 0 <= node < getNodes()
+        """
+        assert type(node) == int and 0 <= node < self.getNodes()
+        if self._children[node, 0] < 0:
+            return None
+        return int(self._children[node, 0]), int(self._children[node, 1])
+
+
+    def getLeaf(self, node):
+        """
+        Returns the leaf number of the given node, or -1 if it is not a leaf.
+
+        Parameter node: the node
+        Precondition: node is an int, 0 <= node < getNodes()
+        """
+        assert type(node) == int and 0 <= node < self.getNodes()
+        return int(self._leaves[node])
+
+
+    def getCentroid(self, node):
+        """
+        Returns the centroid of the given node, as a tuple.
+
+        Parameter node: the node
+        Precondition: node is an int, 0 <= node < getNodes()
+        """
+        assert type(node) == int and 0 <= node < self.getNodes()
+        return tuple(self._centroids[node].tolist())
+
+
+    def getCount(self, node):
+        """
+        Returns the number of dataset points in the given node.
+
+        Parameter node: the node
+        Precondition: node is an int, 0 <= node < getNodes()
+        """
+        assert type(node) == int and 0 <= node < self.getNodes()
+        return int(self._counts[node])
+
+
+    def getInertia(self, node=None):
+        """
+        Returns the inertia of the given node, or the total inertia of the leaves.
+
+        Parameter node: the node (OPTIONAL)
+        Precondition: node is None or an int, 0 <= node < getNodes()
+        """
+        if node is None:
+            return float(self._inertia[self._leaves >= 0].sum())
+        assert type(node) == int and 0 <= node < self.getNodes()
+        return float(self._inertia[node])
+
+
+    def getCentroids(self):
+        """
+        Returns the centroids of the leaves as a 2-D numpy array (a row per leaf).
+
+        Row i is the centroid of leaf i.
+        """
+        return self._centroids[self._leaves >= 0]
+
+
+    def getLabels(self):
+        """
+        Returns an int array with the leaf holding each dataset point.
+
+        This method returns the array directly (it does not copy), so it should not
+        be modified.
+        """
+        return self._labels
+
+
+    def __init__(self, dset, k, maxstep=100, dtype=numpy.float64):
+        """
+        Initializes a tree splitting dset into k clusters by bisecting k-means.
+
+        The tree starts with a root holding every point. Then, until there are k
+        leaves, the leaf of largest inertia is split by an Algorithm with 2 clusters
+        (k-means++ seeds, numpy engine) run on just its points. A leaf whose points
+        are all the same cannot be split, so the tree may end with fewer than k
+        leaves if there are not enough distinct points.
+
+        Parameter dset: the dataset
+        Precondition: dset is an instance of Dataset
+
+        Parameter k: the number of clusters
+        Precondition: k is an int, 0 < k <= dset.getSize()
+
+        Parameter maxstep: the maximum number of steps of each 2-means run (OPTIONAL)
+        Precondition: maxstep is an int > 0
+
+        Parameter dtype: the type to compute distances in (OPTIONAL)
+        Precondition: dtype is one of the types in a6algorithm.DTYPES
+        """
+        assert isinstance(dset, a6dataset.Dataset)
+        assert type(k) == int and k > 0 and k <= dset.getSize()
+        assert type(maxstep) == int and maxstep > 0
+        assert dtype in a6algorithm.DTYPES
+
+        size = dset.getSize()
+        sums = a6kernels.cluster_sums(dset, numpy.zeros(size, dtype=numpy.intp), 1)[0]
+        root = sums[0]/size
+
+        centroids = [root]
+        children = [[-1, -1]]
+        points = [numpy.arange(size)]
+        counts = [size]
+        inertia = [float(a6kernels.squared_to(dset, root).sum())]
+
+        #split the leaf of largest inertia until there are k leaves
+        leaves = 1
+        heap = [(-inertia[0], 0)]
+        while leaves < k and len(heap) > 0:
+            node = heapq.heappop(heap)[1]
+            if inertia[node] == 0:
+                break
+            split = self._split(dset, points[node], maxstep, dtype)
+            if split is None:
+                continue
+
+            children[node] = [len(centroids), len(centroids)+1]
+            for part in split:
+                heapq.heappush(heap, (-part[3], len(centroids)))
+                centroids.append(part[0])
+                children.append([-1, -1])
+                points.append(part[1])
+                counts.append(part[2])
+                inertia.append(part[3])
+            points[node] = None
+            leaves = leaves+1
+
+        self._centroids = numpy.array(centroids, dtype=numpy.float64)
+        self._children = numpy.array(children, dtype=numpy.intp)
+        self._counts = numpy.array(counts, dtype=numpy.intp)
+        self._inertia = numpy.array(inertia, dtype=numpy.float64)
+        self._leaves = numpy.full(len(centroids), -1, dtype=numpy.intp)
+        self._labels = numpy.empty(size, dtype=numpy.intp)
+        leaf = 0
+        for node in range(len(centroids)):
+            if children[node][0] < 0:
+                self._leaves[node] = leaf
+                self._labels[points[node]] = leaf
+                leaf = leaf+1
+
+
+    def predict(self, points):
+        """
+        Returns an int array with the leaf reached by each point, going down the tree.
+
+        The points are sent down the tree a6kernels.BLOCK_ROWS at a time. At every
+        level, each point that is at an inner node is measured against the centroids
+        of its two children, and moves to the closer one (the left one, if there is
+        a tie).
+
+        Parameter points: the points to label
+        Precondition: points is a 2-D numpy array with a row per point, and a column
+        per dimension of the dataset
+        """
+        assert isinstance(points, numpy.ndarray) and points.ndim == 2
+        assert points.shape[1] == self._centroids.shape[1]
+
+        result = numpy.empty(len(points), dtype=numpy.intp)
+        for start in range(0, len(points), a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, len(points))
+            result[start:stop] = self._leaves[self._descend(points[start:stop])]
+        return result
+
+
+    # HELPER METHODS
+    def _descend(self, points):
+        """
+        Returns an int array with the node reached by each point, going down the tree.
+
+        Parameter points: the points to send down
+        Precondition: points is a 2-D numpy array with a row per point, and a column
+        per dimension of the dataset
+        """
+        nodes = numpy.zeros(len(points), dtype=numpy.intp)
+        active = numpy.arange(len(points))
+        while len(active) > 0:
+            pairs = self._children[nodes[active]]
+            inner = pairs[:, 0] >= 0
+            active = active[inner]
+            pairs = pairs[inner]
+            if len(active) == 0:
+                break
+
+            here = points[active]
+            left = here-self._centroids[pairs[:, 0]]
+            right = here-self._centroids[pairs[:, 1]]
+            closer = numpy.einsum('ij,ij->i', right, right) < numpy.einsum('ij,ij->i', left, left)
+            nodes[active] = numpy.where(closer, pairs[:, 1], pairs[:, 0])
+        return nodes
+
+
+    def _split(self, dset, positions, maxstep, dtype):
+        """
+        Returns the two halves of a leaf split by 2-means, or None if it cannot be split.
+
+        Each half is a tuple (centroid, positions, count, inertia), with the positions
+        of its points in dset (in increasing order). The 2-means run sees only the
+        points of the leaf, as a dataset wrapping a copy of them.
+
+        Parameter dset: the dataset
+        Precondition: dset is an instance of Dataset
+
+        Parameter positions: the positions of the points of the leaf
+        Precondition: positions is a 1-D numpy int array of increasing valid positions
+
+        Parameter maxstep: the maximum number of steps of the run
+        Precondition: maxstep is an int > 0
+
+        Parameter dtype: the type to compute distances in
+        Precondition: dtype is one of the types in a6algorithm.DTYPES
+        """
+        if len(positions) < 2:
+            return None
+
+        block = a6kernels.gather(dset, positions)
+        if isinstance(block, a6dataset.SparseBlock):
+            sub = a6dataset.wrap_csr(dset.getDimension(), block.getIndptr(),
+                                     block.getIndices(), block.getValues())
+        else:
+            sub = a6dataset.wrap_array(block)
+
+        alg = a6algorithm.Algorithm(sub, 2, engine='numpy', init='k-means++', dtype=dtype)
+        alg.run(maxstep)
+
+        result = []
+        for cluster in alg.getClusters():
+            indices = numpy.array(cluster.getIndices(), dtype=numpy.intp)
+            if len(indices) == 0:
+                return None
+            result.append((numpy.array(cluster.getCentroid(), dtype=numpy.float64),
+                           positions[numpy.sort(indices)], len(indices),
+                           cluster.getInertia()))
+        return result
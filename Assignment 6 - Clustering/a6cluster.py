@@ -12,6 +12,138 @@ import numpy
 
 # For accessing the previous parts of the assignment
 import a6dataset
+import a6kernels
+
+
+def update_all(clusters, sums, counts):
+    """
+    Returns a list with the result of update() for each cluster in clusters.
+
+    This method recomputes the centroids of all of the clusters at once, from the
+    sums and counts of their points (see a6kernels.cluster_sums). That lets every
+    new centroid come out of a single pass over the dataset, instead of a pass over
+    the contents of each cluster. The new centroid of a cluster is its sum divided
+    by its count, and it is accepted or rejected by numpy.allclose exactly as in
+    update(). A cluster with no points keeps its centroid.
+
+    Parameter clusters: the clusters to update
+    Precondition: clusters is a list of Cluster instances
+
+    Parameter sums: the sum of the points in each cluster
+    Precondition: sums is a 2-D numpy array with a row per cluster, and row i is
+    the sum of the points in clusters[i]
+
+    Parameter counts: the number of points in each cluster
+    Precondition: counts is a 1-D numpy int array with an element per cluster,
+    and element i is the number of points in clusters[i]
+    """
+    assert type(clusters) == list
+    assert len(sums) == len(clusters) and len(counts) == len(clusters)
+
+    #accumulator
+    result = []
+
+    #empty clusters are unchanged, the others move to their mean
+    for pos in range(len(clusters)):
+        if counts[pos] == 0:
+            result.append(True)
+        else:
+            result.append(clusters[pos].setCentroid(sums[pos]/counts[pos]))
+
+    return result
+
+
+class PointView(object):
+    """
+    A class representing a read-only view of the points in a cluster.
+
+    A view does not copy the points into tuples like Cluster.getContents. Element i
+    is a read-only numpy array for the point at position i of the cluster's index
+    list, read straight from the dataset. The method getArray() returns all of the
+    points as a single read-only 2-D array, gathered from the dataset a block at a
+    time. The view follows any later change to the points of the cluster.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _dataset: The Dataset holding the points
+    # Invariant: _dataset is an instance of Dataset
+    #
+    # Attribute _indices: The index list of the cluster (not a copy)
+    # Invariant: _indices is a list of valid indices into _dataset
+
+    def __init__(self, dset, indices):
+        """
+        Initializes a view of the points of dset at the given indices.
+
+        Parameter dset: the dataset
+        Precondition: dset is an instance of Dataset
+
+        Parameter indices: the indices of the points
+        Precondition: indices is a list of distinct valid indices into dset
+        """
+        assert isinstance(dset,a6dataset.Dataset)
+        assert type(indices) == list
+        self._dataset = dset
+        self._indices = indices
+
+
+    def __len__(self):
+        """
+        Returns the number of points in this view.
+        """
+        return len(self._indices)
+
+
+    def __getitem__(self, pos):
+        """
+        Returns the point at position pos of this view, as a read-only 1-D array.
+
+        Parameter pos: the position of the point
+        Precondition: pos is an int with -len(self) <= pos < len(self)
+        """
+        index = self._indices[pos]
+        result = self._dataset.getBlock(index, index+1)[0]
+        result.flags.writeable = False
+        return result
+
+
+    def __iter__(self):
+        """
+        Returns an iterator over the points of this view, as read-only 1-D arrays.
+        """
+        return iter(self.getArray())
+
+
+    def getArray(self):
+        """
+        Returns the points of this view as a read-only 2-D array.
+
+        The array has the same type as the dataset storage (float64 for list storage),
+        so a float32 dataset is not widened.
+
+        Row i of the array is the point at position i of the view. The points are
+        gathered from the dataset in increasing index order (see a6kernels.gather),
+        and then put back in the order of the view. With list storage, they are read
+        from the tuples of the dataset in the order of the view instead. For a sparse
+        dataset, the result is an a6dataset.SparseBlock of the points.
+        """
+        if self._dataset.getDtype() is None:
+            contents = self._dataset.getContents()
+            result = numpy.array([contents[index] for index in self._indices],
+                                 dtype=numpy.float64)
+            result = result.reshape(len(self._indices), self._dataset.getDimension())
+            result.flags.writeable = False
+            return result
+
+        indices = numpy.array(self._indices, dtype=numpy.intp)
+        order = numpy.argsort(indices)
+        if self._dataset.isSparse():
+            return a6kernels.gather(self._dataset, indices[order])[numpy.argsort(order)]
+
+        dtype = self._dataset.getDtype()
+        result = numpy.empty((len(indices), self._dataset.getDimension()), dtype=dtype)
+        result[order] = a6kernels.gather(self._dataset, indices[order])
+        result.flags.writeable = False
+        return result
 
 
 class Cluster(object):
@@ -28,6 +160,25 @@ class Cluster(object):
     represented as a list of n numbers, not as an index into the dataset. (This is because
     the centroid is generally not a point in the dataset, but rather is usually in between
     the data points.)
+
+    Besides the index list, a cluster keeps a bitmap with one bit per dataset index,
+    recording which indices it contains. This makes addIndex and hasIndex constant
+    time, instead of a search of the index list. The bitmap is only built when one of
+    those methods needs it, so clusters filled with setIndices never pay for it. If
+    the list from getIndices is changed directly, the cluster notices that its length
+    changed, and builds the bitmap (and the statistics below) again.
+
+    A cluster also caches some statistics about its points: the radius, the inertia
+    (the sum of the squared distances to the centroid) and the bounding box. The
+    vectorized engines of Algorithm record them as a side product of each partition,
+    and otherwise they are measured the first time they are needed. Either way they
+    are kept until the points change. When the centroid moves, the inertia is moved
+    with it, but the radius has to be measured again.
+
+    Distances are measured with the metric of the cluster, one of the metrics in
+    a6kernels.METRICS (euclidean by default). The inertia is always measured with
+    squared euclidean distances, since that is what moving the centroid to the mean
+    of the points makes small.
     """
     # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
     # Attribute _dataset: The Dataset for this cluster
@@ -37,10 +188,34 @@ class Cluster(object):
     # Invariant: _centroid is a point (tuple of int/float) whose length is
     #equal to the dimension of _dataset.
     #
+    # Attribute _metric: The name of the distance metric of this cluster
+    # Invariant: _metric is a key of a6kernels.METRICS
+    #
+    # Attribute _scalar: The scalar kernel of the metric
+    # Invariant: _scalar is a6kernels.METRICS[_metric][0]
+    #
     # MUTABLE ATTRIBUTES (Can be changed at any time, via addIndex, or clear)
     # Attribute _indices: the indices of this cluster's points in the dataset
     # Invariant: _indices is a list of ints. For each element ind in _indices,
     # 0 <= ind < _dataset.getSize()
+    #
+    # Attribute _members: the membership bitmap of this cluster
+    # Invariant: _members is None (the bitmap must be rebuilt from _indices) or a
+    # bytearray in which bit (ind % 8) of byte (ind // 8) is 1 exactly when ind is
+    # in _indices. Bytes past the end of _members are all 0.
+    #
+    # Attribute _synced: the length of _indices when _members and _stats were made
+    # Invariant: _synced is an int >= 0. If it is not len(_indices), then _indices
+    # was changed through getIndices, and _members and _stats are out of date.
+    #
+    # Attribute _stats: the cached statistics of this cluster
+    # Invariant: _stats is None (nothing is known) or a list [count, total, low,
+    # high, inertia, radius] for the points in _indices. The value count is their
+    # number and total is their sum (a 1-D float array). The values low and high
+    # are tuples with the corners of their bounding box (None if count is 0). The
+    # value inertia is the sum of their squared euclidean distances to _centroid, and
+    # radius is their largest distance to _centroid (by _metric), or None if it is
+    # not known.
 
     # Part A
     def getIndices(self):
@@ -66,7 +241,14 @@ class Cluster(object):
         return self._centroid
 
 
-    def __init__(self, dset, centroid):
+    def getMetric(self):
+        """
+        Returns the name of the distance metric of this cluster.
+        """
+        return self._metric
+
+
+    def __init__(self, dset, centroid, metric='euclidean'):
         """
         Initializes a new empty cluster with the given centroid
 
@@ -75,17 +257,66 @@ class Cluster(object):
 
         Parameter centroid: the cluster centroid
         Precondition: centroid is a tuple of dset.getDimension() numbers
+
+        Parameter metric: the distance metric (OPTIONAL)
+        Precondition: metric is a key of a6kernels.METRICS. If dset is sparse, it is
+        'euclidean'.
         """
         # IMPLEMENT ME
         #enforce preconditions
         assert isinstance(dset,a6dataset.Dataset)
         assert a6dataset.is_point(centroid)
         assert len(centroid) == dset.getDimension()
+        assert metric in a6kernels.METRICS
+        assert metric == 'euclidean' or not dset.isSparse()
 
         #set attributes for a new empty cluster
         self._dataset = dset
         self._indices = []
+        self._members = bytearray()
+        self._synced = 0
         self._centroid = centroid
+        self._metric = metric
+        self._scalar = a6kernels.METRICS[metric][0]
+        self._stats = None
+
+
+    def setCentroid(self, centroid):
+        """
+        Returns True if centroid is the same as the current centroid; False otherwise.
+
+        This method moves the centroid of this cluster to the given position, unless
+        the two are the same according to numpy.allclose, in which case the centroid
+        is left alone. This is the last part of update(), for when the new centroid
+        has already been computed some other way.
+
+        If the centroid moves, the cached inertia is moved with it by the parallel
+        axis theorem (so it may differ from a fresh one by rounding error), and the
+        cached radius is forgotten.
+
+        Parameter centroid: the new centroid
+        Precondition: centroid is a tuple, list or 1-D numpy array of numbers. Its
+        length is the same as the dataset dimension.
+        """
+        assert len(centroid) == self._dataset.getDimension()
+        self._sync()
+
+        #Check if the new centroid is the same as the old, if yes return True
+        if numpy.allclose(list(self._centroid), centroid) == True:
+            return True
+        #If changed, change the centroid to be new one, and return False
+        else:
+            moved = numpy.asarray(centroid, dtype=numpy.float64)
+            if self._stats is not None and self._stats[0] > 0:
+                count = self._stats[0]
+                mean = self._stats[1]/count
+                before = mean-numpy.array(self._centroid, dtype=numpy.float64)
+                after = mean-moved
+                inertia = self._stats[4]-count*before.dot(before)+count*after.dot(after)
+                self._stats[4] = max(float(inertia), 0.0)
+                self._stats[5] = None
+            self._centroid = tuple(moved.tolist())
+            return False
 
 
     def addIndex(self, index):
@@ -100,8 +331,53 @@ class Cluster(object):
         """
         # IMPLEMENT ME
         assert type(index)==int and index>=0 and index<self._dataset.getSize()
-        if index not in self._indices:
+        members = self._bitmap()
+
+        #grow the bitmap (at least doubling it) if the index is past its end
+        byte = index >> 3
+        if byte >= len(members):
+            members.extend(bytes(max(byte+1, 2*len(members))-len(members)))
+
+        #add the index only if its bit is not set yet
+        bit = 1 << (index & 7)
+        if not members[byte] & bit:
+            members[byte] = members[byte] | bit
             self._indices.append(index)
+            self._synced = len(self._indices)
+            self._stats = None
+
+
+    def hasIndex(self, index):
+        """
+        Returns True if the given dataset index is in this cluster; False otherwise.
+
+        Parameter index: the index to look for
+        Precondition: index is an int >= 0
+        """
+        assert type(index)==int and index>=0
+        members = self._bitmap()
+        byte = index >> 3
+        return byte < len(members) and members[byte] & (1 << (index & 7)) != 0
+
+
+    def setIndices(self, indices):
+        """
+        Replaces the points in this cluster with the given dataset indices.
+
+        This has the same result as calling clear() followed by addIndex() on each
+        element of indices. However, it does not search the cluster for duplicates,
+        so it takes time proportional to len(indices) instead of its square.
+
+        Parameter indices: the new indices of this cluster's points
+        Precondition: indices is a list of distinct valid indices into this cluster's
+        dataset
+        """
+        assert type(indices) == list
+        self._indices.clear()
+        self._indices.extend(indices)
+        self._members = None
+        self._synced = len(self._indices)
+        self._stats = None
 
 
     def clear(self):
@@ -110,6 +386,9 @@ class Cluster(object):
         """
         # IMPLEMENT ME
         self._indices.clear()
+        self._members = bytearray()
+        self._synced = 0
+        self._stats = None
 
 
     def getContents(self):
@@ -117,7 +396,8 @@ class Cluster(object):
         Returns a new list containing copies of the points in this cluster.
 
         The result is a list of points (tuples of int/float). It has to be computed
-        from the list of indices.
+        from the list of indices. Use getView to read the points without copying
+        them into tuples.
         """
         # IMPLEMENT ME
         #accumulator
@@ -129,10 +409,23 @@ class Cluster(object):
         return newlist
 
 
+    def getView(self):
+        """
+        Returns a read-only PointView of the points in this cluster.
+
+        The view reads the points straight from the dataset when they are used, and
+        follows any later change to the points of this cluster.
+        """
+        return PointView(self._dataset, self._indices)
+
+
     # Part B
     def distance(self, point):
         """
-        Returns the euclidean distance from point to this cluster's centroid.
+        Returns the distance from point to this cluster's centroid.
+
+        The distance is measured with the metric of this cluster (euclidean by
+        default).
 
         Parameter point: The point to be measured
         Precondition: point is a tuple of numbers (int or float), with the same dimension
@@ -140,47 +433,52 @@ class Cluster(object):
         """
         # IMPLEMENT ME
         assert a6dataset.is_point(point) and len(point) == len(self._centroid)
-
-        #accumulators
-        accumulator = []
-        substract = 0
-
-        #loop through point's indices, subtract cluster's centroid from point
-        for x in range(len(point)):
-            subtract = point[x]-self._centroid[x]
-            accumulator.append((subtract)**2)
-
-        #accumulator
-        sum = 0
-
-        #loop through elements in accumulator, add differences
-        for x in accumulator:
-            sum = sum + x
-
-        #return distance
-        return math.sqrt((sum))
+        return self._distance(point)
 
 
     def getRadius(self):
         """
         Returns the maximum distance from any point in this cluster, to the centroid.
 
-        This method loops over the contents of this cluster to find the maximum distance
-        from the centroid.
+        The distances are measured with the metric of this cluster. The radius is
+        cached until the points or the centroid change. If it is not known, all of
+        the statistics of this cluster are measured at once (see getInertia and
+        getBounds).
         """
         # IMPLEMENT ME
-        #accumulators
-        max = 0
-        distance = 0
+        self._sync()
+        if self._stats is None or self._stats[5] is None:
+            self._measure()
+        return self._stats[5]
 
-        #loop through cluster contents, find max distance
-        for x in self.getContents():
-            distance = self.distance(x)
-            if distance > max:
-                max = distance
 
-        #return max distance
-        return max
+    def getInertia(self):
+        """
+        Returns the sum of the squared euclidean distances from the points in this
+        cluster to the centroid.
+
+        The inertia is cached until the points change. It is 0 for an empty cluster.
+        """
+        self._sync()
+        if self._stats is None:
+            self._measure()
+        return self._stats[4]
+
+
+    def getBounds(self):
+        """
+        Returns a pair (low, high) of points bounding the points in this cluster.
+
+        The tuple low has the smallest value of each coordinate over the points in
+        this cluster, and high has the largest. The result is None if the cluster is
+        empty. It is cached until the points change.
+        """
+        self._sync()
+        if self._stats is None:
+            self._measure()
+        if self._stats[0] == 0:
+            return None
+        return self._stats[2], self._stats[3]
 
 
     def update(self):
@@ -198,35 +496,125 @@ class Cluster(object):
         If there are no points in the cluster, the centroid. does not change.
         """
         # IMPLEMENT ME
+        #read the points through a view, as one array (for list storage, it only
+        #converts the tuples of this cluster)
+        points = self.getView().getArray()
+
         #if no points centroid doesn't change, return true
-        if len(self.getContents()) == 0:
+        if len(points) == 0:
             return True
 
-        #placeholder of new centroid
-        newCent = []
+        #add up each coordinate over the points, in order, and divide by the
+        #number of points
+        labels = numpy.zeros(len(points), dtype=numpy.intp)
+        newCent = a6kernels.label_sums(points, labels, 1)[0][0]/len(points)
 
-        #First set each coordinator in the new point to be 0
-        for i in range(self._dataset.getDimension()):
-            newCent.append(0)
+        #Keep the old centroid if it is close enough, otherwise move it
+        return self.setCentroid(newCent)
 
-        #Then get the sum of the first coordinates of all the points in the
-        #cluster then second coordinates, third and so on
-        for i in range(len(newCent)):
-            for j in range(len(self.getContents())):
-                newCent[i] = self.getContents()[j][i] + newCent[i]
 
-        #For each coordinate in the new centroid point, divide by the number of
-        #points
-        for i in range(len(newCent)):
-            newCent[i] = newCent[i]/len(self.getContents())
+    # HELPER METHODS
+    def _distance(self, point):
+        """
+        Returns the distance from point to this cluster's centroid.
 
-        #Check if the new centroid is the same as the old, if yes return True
-        if numpy.allclose(list(self._centroid), newCent) == True:
-            return True
-        #If changed, change the centroid to be new one, and return False
+        This is the unchecked kernel of distance(), for points that are already known
+        to be valid, such as points of the dataset. It only checks its precondition
+        if a6dataset.STRICT is True.
+
+        Parameter point: The point to be measured
+        Precondition: point is a tuple of numbers (int or float), with the same dimension
+        as the centroid.
+        """
+        if a6dataset.STRICT:
+            assert a6dataset.is_point(point) and len(point) == len(self._centroid)
+        return self._scalar(point, self._centroid)
+
+
+    def _setStats(self, count, total, low, high, inertia, radius):
+        """
+        Caches statistics about the points in this cluster, measured by someone else.
+
+        Parameter count: the number of points
+        Precondition: count is len(getIndices())
+
+        Parameter total: the sum of the points
+        Precondition: total is a 1-D float array with an element per dimension
+
+        Parameter low: the smallest coordinates of the points
+        Precondition: low is a 1-D float array with an element per dimension
+
+        Parameter high: the largest coordinates of the points
+        Precondition: high is a 1-D float array with an element per dimension
+
+        Parameter inertia: the sum of the squared euclidean distances to the centroid
+        Precondition: inertia is a float >= 0
+
+        Parameter radius: the largest distance to the centroid, by the metric
+        Precondition: radius is a float >= 0
+        """
+        if count == 0:
+            self._stats = [0, total, None, None, 0.0, 0]
         else:
-            self._centroid = newCent
-            return False
+            self._stats = [int(count), total, tuple(low.tolist()), tuple(high.tolist()),
+                           float(inertia), float(radius)]
+
+
+    def _measure(self):
+        """
+        Measures and caches all of the statistics about the points in this cluster.
+
+        The points are read through getView(), rather than copied one tuple at a time
+        by getContents().
+        """
+        dim = self._dataset.getDimension()
+        if len(self._indices) == 0:
+            self._setStats(0, numpy.zeros(dim), None, None, 0.0, 0)
+            return
+
+        points = self.getView().getArray()
+        centroid = numpy.array([self._centroid], dtype=numpy.float64)
+        if isinstance(points, a6dataset.SparseBlock):
+            squares = a6kernels.sparse_squared_distances(points, centroid)[:, 0]
+            labels = numpy.zeros(len(points), dtype=numpy.intp)
+            stats = a6kernels.sparse_label_stats(points, labels, numpy.sqrt(squares), 1)
+            self._setStats(len(points), stats[0][0], stats[2][0], stats[3][0],
+                           squares.sum(), stats[5][0])
+            return
+
+        diff = points-centroid
+        squares = numpy.einsum('ij,ij->i', diff, diff)
+        if self._metric == 'euclidean':
+            radius = math.sqrt(squares.max())
+        else:
+            radius = a6kernels.METRICS[self._metric][1](points, centroid).max()
+        self._setStats(len(points), points.sum(axis=0), points.min(axis=0),
+                       points.max(axis=0), squares.sum(), radius)
+
+
+    def _bitmap(self):
+        """
+        Returns the membership bitmap of this cluster, building it first if needed.
+        """
+        self._sync()
+        if self._members is None:
+            bits = numpy.zeros(self._dataset.getSize(), dtype=bool)
+            bits[self._indices] = True
+            self._members = bytearray(numpy.packbits(bits, bitorder='little').tobytes())
+        return self._members
+
+
+    def _sync(self):
+        """
+        Forgets the bitmap and the statistics if the index list was changed directly.
+
+        A change through getIndices is noticed by the length of the list, which is
+        checked against the length when the bitmap and statistics were made.
+        """
+        if self._synced != len(self._indices):
+            self._members = None
+            self._stats = None
+            self._synced = len(self._indices)
 
 
     # PROVIDED METHODS: Do not modify!
@@ -6,12 +6,27 @@ You cannot do anything in this assignment (except run the unit test) before this
 is finished.
 
 """
+import io
+import os
 import math
+import time
 import random
+import itertools
 import numpy
 
 
+# Whether internal calls re-check their preconditions (see below)
+STRICT = False
+
+
 # HELPERS TO CHECK PRECONDITIONS
+#
+# The points of a Dataset are checked once, when they enter it (in the initializer or
+# addPoint), and the public methods of every class check their arguments as always.
+# But internal calls on points that came from a Dataset, such as Algorithm._nearest
+# and the distance computations inside Cluster, skip the checks since those points are
+# already known to be valid. Set STRICT to True to make these internal calls check
+# their arguments again, which can help when debugging.
 def is_point(value):
     """
     Returns True if value is a tuple of int or float
@@ -23,14 +38,13 @@ def is_point(value):
     if (type(value) != tuple):
         return False
 
-    # All float
-    okay = True
+    # All float (stop at the first one that is not)
     for x in value:
         if (not type(x) in [int,float]):
-            okay = False
+            return False
 
     #return
-    return okay
+    return True
 
 
 def is_point_list(value):
@@ -60,6 +74,254 @@ def is_point_list(value):
     return check
 
 
+def is_dtype(value):
+    """
+    Returns True if value is a valid storage type for a Dataset.
+
+    A storage type is either None (the points are stored as a list of tuples) or one
+    of numpy.float64 or numpy.float32 (the points are stored in a 2-D numpy array).
+
+    Parameter value: a value to check
+    Precondition: value can be anything
+    """
+    if value is None:
+        return True
+
+    try:
+        return numpy.dtype(value) in [numpy.dtype(numpy.float64), numpy.dtype(numpy.float32)]
+    except TypeError:
+        return False
+
+
+# The number of rows allocated the first time an empty array store grows
+MIN_CAPACITY = 16
+
+# The number of points a file-backed data set holds back before writing them out
+WAL_ROWS = 4096
+
+# The number of points read and added at a time by the bulk loaders
+INGEST_ROWS = 65536
+
+
+def open_memmap(filename, dim=None, dtype=numpy.float64, writable=False):
+    """
+    Returns a Dataset whose points are read from the given file through numpy.memmap.
+
+    The file is either a .npy file holding a 2-D float64/float32 array (a row per
+    point), or a raw binary file holding the coordinates of the points one after the
+    other. For a .npy file the dimension and type come from the file itself. For a
+    raw file they must be given by dim and dtype, and any trailing partial point is
+    ignored.
+
+    The points are never loaded into memory as a whole. getPoint, getBlock and the
+    clustering engines read them straight from the mapping, so only the pages they
+    touch are loaded. If writable is True, addPoint appends points to the file (see
+    Dataset.flush), and changes made to getArray() are written to the file. A raw
+    file that does not exist yet is created empty in that case.
+
+    Parameter filename: the file to open
+    Precondition: filename is a string naming a .npy or raw binary file
+
+    Parameter dim: the point dimension (OPTIONAL for .npy files)
+    Precondition: dim is None or an int > 0. It is not None for a raw file.
+
+    Parameter dtype: the coordinate type of a raw file (OPTIONAL)
+    Precondition: dtype is numpy.float64 or numpy.float32
+
+    Parameter writable: whether points may be added to the file (OPTIONAL)
+    Precondition: writable is a bool
+    """
+    assert type(filename) == str
+    assert dim is None or (type(dim) == int and dim > 0)
+    assert type(writable) == bool
+
+    if filename.endswith('.npy'):
+        with open(filename, 'rb') as file:
+            version = numpy.lib.format.read_magic(file)
+            if version == (1,0):
+                shape, fortran, dtype = numpy.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran, dtype = numpy.lib.format.read_array_header_2_0(file)
+            offset = file.tell()
+        assert len(shape) == 2 and not fortran
+        assert dim is None or dim == shape[1]
+        dim = shape[1]
+        rows = shape[0]
+    else:
+        assert dim is not None
+        if writable and not os.path.exists(filename):
+            open(filename, 'wb').close()
+        offset = 0
+        rows = os.path.getsize(filename) // (dim*numpy.dtype(dtype).itemsize)
+
+    assert is_dtype(dtype) and dtype is not None
+    result = Dataset(dim, dtype=dtype)
+    result._map(filename, offset, rows, writable)
+    return result
+
+
+def wrap_array(array):
+    """
+    Returns a Dataset whose points are the rows of array, without copying them.
+
+    The dataset is a view of array, so array should not change while the dataset
+    is in use. This is how a worker process sees points held in shared memory.
+    Adding points to the dataset copies them to a new array first.
+
+    Parameter array: the points
+    Precondition: array is a 2-D float64 or float32 numpy array with a row per point,
+    and at least one column
+    """
+    assert isinstance(array, numpy.ndarray) and array.ndim == 2 and array.shape[1] > 0
+    assert is_dtype(array.dtype)
+
+    result = Dataset(array.shape[1], dtype=array.dtype)
+    result._buffer = array
+    result._size = len(array)
+    return result
+
+
+def wrap_csr(dim, indptr, indices, values):
+    """
+    Returns a sparse Dataset whose points are the rows of a CSR matrix, without copying.
+
+    The matrix is given by the usual three arrays: the nonzeros of point i are at
+    positions indptr[i]..indptr[i+1]-1 of indices (their columns) and values (their
+    coordinates). As with wrap_array, the arrays should not change while the dataset
+    is in use, and adding points to the dataset copies them first.
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter indptr: the start of each row in indices and values
+    Precondition: indptr is a 1-D numpy int array of at least one element, starting
+    at 0 and never decreasing
+
+    Parameter indices: the column of each nonzero
+    Precondition: indices is a 1-D numpy int array of values in 0..dim-1, with
+    indptr[-1] elements. The columns of each row are distinct.
+
+    Parameter values: the coordinate of each nonzero
+    Precondition: values is a 1-D float64 or float32 numpy array with an element per
+    element of indices
+    """
+    assert type(dim) == int and dim > 0
+    assert isinstance(indptr, numpy.ndarray) and indptr.ndim == 1 and len(indptr) > 0
+    assert isinstance(values, numpy.ndarray) and is_dtype(values.dtype)
+    assert indptr[0] == 0 and len(indices) == indptr[-1] and len(values) == len(indices)
+
+    result = Dataset(dim, dtype=values.dtype, sparse=True)
+    result._indptr = indptr.astype(numpy.intp, copy=False)
+    result._indices = indices.astype(numpy.intp, copy=False)
+    result._values = values
+    result._size = len(indptr)-1
+    return result
+
+
+def read_csv(dset, source, delimiter=',', skip=0):
+    """
+    Returns a report on adding the points in a CSV (or TSV) file to dset.
+
+    Each line of the file holds the coordinates of one point, separated by delimiter
+    (use '\t' for a TSV file). Blank lines and anything after a # are ignored. The
+    lines are parsed INGEST_ROWS at a time with numpy, and each chunk is added to
+    dset with addPoints, which checks its dimension. A chunk with no points in it is
+    skipped.
+
+    The report is a dictionary with the number of 'rows' added, the 'seconds' it took,
+    and the 'rate' in rows per second.
+
+    Parameter dset: the data set to add to
+    Precondition: dset is an instance of Dataset
+
+    Parameter source: the file to read
+    Precondition: source is a string naming a file, or a file open for reading text
+
+    Parameter delimiter: the coordinate separator (OPTIONAL)
+    Precondition: delimiter is a nonempty string
+
+    Parameter skip: the number of header lines to skip (OPTIONAL)
+    Precondition: skip is an int >= 0
+    """
+    assert isinstance(dset, Dataset)
+    assert type(delimiter) == str and len(delimiter) > 0
+    assert type(skip) == int and skip >= 0
+
+    file = open(source) if type(source) == str else source
+    start = time.perf_counter()
+    rows = 0
+    try:
+        lines = itertools.islice(file, skip, None)
+        chunk = list(itertools.islice(lines, INGEST_ROWS))
+        while len(chunk) > 0:
+            #a chunk of only blanks and comments would make loadtxt warn
+            if any(line.split('#', 1)[0].strip() for line in chunk):
+                block = numpy.loadtxt(chunk, delimiter=delimiter, ndmin=2,
+                                      dtype=numpy.float64)
+                dset.addPoints(block)
+                rows = rows+len(block)
+            chunk = list(itertools.islice(lines, INGEST_ROWS))
+    finally:
+        if type(source) == str:
+            file.close()
+
+    return _report(rows, time.perf_counter()-start)
+
+
+def read_binary(dset, source, dtype=numpy.float64):
+    """
+    Returns a report on adding the points in a raw binary file to dset.
+
+    The file holds the coordinates of the points one after the other, as numbers of
+    the given type, with no header. It is read INGEST_ROWS points at a time, and each
+    chunk is added to dset with addPoints. The report is the same as for read_csv.
+
+    Parameter dset: the data set to add to
+    Precondition: dset is an instance of Dataset
+
+    Parameter source: the file to read
+    Precondition: source is a string naming a file, or a file open for reading bytes.
+    Its length is a multiple of the size of a point.
+
+    Parameter dtype: the coordinate type of the file (OPTIONAL)
+    Precondition: dtype is numpy.float64 or numpy.float32
+    """
+    assert isinstance(dset, Dataset)
+    assert is_dtype(dtype) and dtype is not None
+    dim = dset.getDimension()
+    width = dim*numpy.dtype(dtype).itemsize
+
+    file = open(source, 'rb') if type(source) == str else source
+    start = time.perf_counter()
+    rows = 0
+    try:
+        data = file.read(INGEST_ROWS*width)
+        while len(data) > 0:
+            assert len(data) % width == 0, 'the file ends with a partial point'
+            block = numpy.frombuffer(data, dtype=dtype).reshape(-1, dim)
+            dset.addPoints(block)
+            rows = rows+len(block)
+            data = file.read(INGEST_ROWS*width)
+    finally:
+        if type(source) == str:
+            file.close()
+
+    return _report(rows, time.perf_counter()-start)
+
+
+def _report(rows, seconds):
+    """
+    Returns the report dictionary of a bulk loader.
+
+    Parameter rows: the number of points added
+    Precondition: rows is an int >= 0
+
+    Parameter seconds: the time it took
+    Precondition: seconds is a float >= 0
+    """
+    return {'rows': rows, 'seconds': seconds, 'rate': rows/seconds if seconds > 0 else math.inf}
+
+
 # CLASSES FOR THE ASSIGNMENT
 class Dataset(object):
     """
@@ -68,6 +330,29 @@ class Dataset(object):
     The data is stored as a list of points (int/float tuples). All points have
     the same number elements which is the dimension of the data set.
 
+    Alternatively, a data set can be created with a numpy dtype (float64 or float32).
+    In that case the points are stored in one contiguous 2-D numpy array with a row
+    per point. The array grows by doubling its capacity whenever addPoint runs out of
+    room, so adding a point is amortized constant time. This uses far less memory per
+    point than a list of tuples, and lets the clustering code work on the whole data
+    set at once through getArray(). However, the original tuples are not kept. So
+    getPoint returns float tuples (an int coordinate comes back as a float), and
+    getContents returns a new list on every call, so changing it does not change the
+    data set. This applies to all of the storage modes below as well.
+
+    Finally, open_memmap creates a data set whose array is a numpy.memmap of a file on
+    disk. Such a data set can be much larger than memory. Points added to it are kept
+    in a small write-ahead buffer, which is appended to the file when it fills up, or
+    when flush() is called.
+
+    A data set created with sparse=True (or by wrap_csr) stores only the nonzero
+    coordinates of its points, in CSR form: the columns and values of all nonzeros
+    one point after the other, and the start of each point among them. For very
+    high-dimensional points with few nonzeros, this takes memory in proportion to
+    the nonzeros rather than the dimension. Then getBlock returns a SparseBlock
+    instead of a 2-D array, and the kernels in a6kernels measure such blocks without
+    ever filling in the zeros.
+
     None of the attributes should be accessed directly outside of the class Dataset
     (e.g. in the methods of class Cluster or KMeans). Instead, this class has getter and
     setter style methods (with the appropriate preconditions) for modifying these values.
@@ -76,11 +361,54 @@ class Dataset(object):
     # Attribute _dimension: The point dimension for this dataset
     # Invariant: _dimension is an int > 0.
     #
+    # Attribute _dtype: The storage type for this dataset
+    # Invariant: _dtype is None (list storage) or a numpy float64/float32 dtype
+    #
+    # Attribute _sparse: Whether this dataset uses sparse storage
+    # Invariant: _sparse is a bool. If it is True, _dtype is not None.
+    #
     # MUTABLE ATTRIBUTES (Can be changed at any time, via addPoint)
     # Attribute _contents:  The dataset contents
     # Invariant: _contents is a list of tuples of numbers (float or int),
     # possibly empty.
     # Each element of _contents is a tuple of size _dimension
+    # If _dtype is not None, _contents is None and the points are in _buffer instead
+    #
+    # Attribute _buffer: The array storage for this dataset
+    # Invariant: _buffer is None if _dtype is None.  Otherwise it is a 2-D numpy
+    # array of type _dtype with _dimension columns and at least _size rows.
+    # Only the first _size rows are points; the rest is spare capacity.
+    #
+    # Attribute _size: The number of points in _buffer
+    # Invariant: _size is an int >= 0 (always 0 if _dtype is None)
+    #
+    # Attribute _file: The file mapped by _buffer
+    # Invariant: _file is None if _buffer is an ordinary array. Otherwise it is the
+    # name of the file, and _buffer is a memmap of exactly _size rows of it.
+    #
+    # Attribute _offset: The position of the first point in _file
+    # Invariant: _offset is an int >= 0 (the size of the header for a .npy file)
+    #
+    # Attribute _writable: Whether points may be added to _file
+    # Invariant: _writable is a bool (always True if _file is None)
+    #
+    # Attribute _pending: The points added but not yet written to _file
+    # Invariant: _pending is a list of float tuples of size _dimension, always
+    # empty if _file is None. Point _size+i of this data set is _pending[i].
+    #
+    # Attribute _indptr: The start of each point among the nonzeros (sparse storage)
+    # Invariant: _indptr is None if _sparse is False. Otherwise it is a 1-D int array
+    # of at least _size+1 elements, whose first _size+1 elements start at 0 and
+    # never decrease. The rest is spare capacity.
+    #
+    # Attribute _indices: The column of each nonzero (sparse storage)
+    # Invariant: _indices is None if _sparse is False. Otherwise it is a 1-D int
+    # array of at least _indptr[_size] elements. The nonzeros of point i are at
+    # positions _indptr[i].._indptr[i+1]-1, with distinct columns in 0.._dimension-1.
+    #
+    # Attribute _values: The coordinate of each nonzero (sparse storage)
+    # Invariant: _values is None if _sparse is False. Otherwise it is a 1-D array of
+    # type _dtype with as many elements as _indices.
 
     # Getters for encapsulated attributes
     def getDimension(self):
@@ -91,11 +419,30 @@ class Dataset(object):
         return self._dimension
 
 
+    def getDtype(self):
+        """
+        Returns the storage type of this data set.
+
+        The result is None if the points are stored as a list of tuples. Otherwise it
+        is the numpy dtype (float64 or float32) of the backing array.
+        """
+        return self._dtype
+
+
+    def isSparse(self):
+        """
+        Returns True if this data set uses sparse storage; False otherwise.
+        """
+        return self._sparse
+
+
     def getSize(self):
         """
         Returns the number of points in this data set.
         """
         # IMPLEMENT ME
+        if self._dtype is not None:
+            return self._size+len(self._pending)
         return len(self._contents)
 
 
@@ -106,12 +453,76 @@ class Dataset(object):
         This method returns the contents directly (not a copy). Any changes made to this
         list will modify the data set. If you want to access the data set, but want to
         protect yourself from modifying the data, use getPoint() instead.
+
+        If this data set uses array storage, there is no list to return. Instead, this
+        method builds a new list of points (float tuples) from the array. Changes to
+        that list do not modify the data set. Use getArray() for direct access.
         """
         # IMPLEMENT ME
+        if self._sparse:
+            return [self.getPoint(i) for i in range(self._size)]
+        elif self._dtype is not None:
+            return [tuple(row) for row in self._buffer[:self._size].tolist()]+self._pending
         return self._contents
 
 
-    def __init__(self, dim, contents=None):
+    def getArray(self):
+        """
+        Returns the contents of this data set as a 2-D numpy array (a row per point).
+
+        If this data set uses array storage, the result is a view of the backing array
+        (not a copy). Any changes made to this array will modify the data set. If this
+        data set uses list storage, the result is a new float64 array.
+
+        If this data set is backed by a file, any pending points are written to the
+        file first, and the result is the memmap of the file. If this data set uses
+        sparse storage, the result is a SparseBlock of all of the points instead (see
+        getBlock).
+        """
+        if self._sparse:
+            return self.getBlock(0, self._size)
+        elif self._dtype is not None:
+            self.flush()
+            return self._buffer[:self._size]
+
+        result = numpy.array(self._contents, dtype=numpy.float64)
+        return result.reshape(len(self._contents), self._dimension)
+
+
+    def getBlock(self, start, stop):
+        """
+        Returns the points at positions start..stop-1 as a 2-D numpy array.
+
+        This is how the vectorized code reads a data set a block at a time, so that
+        it never needs the whole data set as one array. If this data set uses array
+        storage, the result is a view of the backing array (not a copy). If this data
+        set uses list storage, the result is a new float64 array. If this data set
+        uses sparse storage, the result is a SparseBlock viewing the nonzeros of the
+        points (not a copy).
+
+        Parameter start: the position of the first point
+        Precondition: start is an int with 0 <= start <= getSize()
+
+        Parameter stop: the position after the last point
+        Precondition: stop is an int with start <= stop <= getSize()
+        """
+        assert type(start) == int and type(stop) == int
+        assert 0 <= start and start <= stop and stop <= self.getSize()
+        if self._sparse:
+            first = self._indptr[start]
+            last = self._indptr[stop]
+            return SparseBlock(self._dimension, self._indptr[start:stop+1]-first,
+                               self._indices[first:last], self._values[first:last])
+        elif self._dtype is not None:
+            if stop > self._size:
+                self.flush()
+            return self._buffer[start:stop]
+
+        result = numpy.array(self._contents[start:stop], dtype=numpy.float64)
+        return result.reshape(stop-start, self._dimension)
+
+
+    def __init__(self, dim, contents=None, dtype=None, sparse=False):
         """
         Initializes a database for the given point dimension.
 
@@ -123,6 +534,14 @@ class Dataset(object):
         If contents is None, the data set start off empty. The parameter contents is
         None by default.
 
+        If dtype is None, the data set stores its points as a list of tuples. Otherwise
+        the points are copied into a 2-D numpy array of that type. The parameter dtype
+        is None by default.
+
+        If sparse is True, the data set only stores the nonzero coordinates of its
+        points (in type dtype, or float64 if dtype is None). The parameter sparse is
+        False by default.
+
         Parameter dim: The dimension of the dataset
         Precondition: dim is an int > 0
 
@@ -130,20 +549,57 @@ class Dataset(object):
         Precondition: contents is either None or a list of points (int/float tuples).
         If contents is not None, then contents is not empty and the length of each
         point is equal to dim.
+
+        Parameter dtype: the storage type (OPTIONAL)
+        Precondition: dtype is None, numpy.float64 or numpy.float32
+
+        Parameter sparse: whether to store only the nonzero coordinates (OPTIONAL)
+        Precondition: sparse is a bool
         """
         # IMPLEMENT ME
         #enforce preconditions
         assert type(dim) == int and dim>0
         assert contents is None or is_point_list(contents)
+        assert is_dtype(dtype)
+        assert type(sparse) == bool
 
         #set dimension
         self._dimension = dim
+        if sparse and dtype is None:
+            dtype = numpy.float64
+        self._dtype = None if dtype is None else numpy.dtype(dtype)
+        self._sparse = sparse
+        self._indptr = None
+        self._indices = None
+        self._values = None
+        self._buffer = None
+        self._size = 0
+        self._file = None
+        self._offset = 0
+        self._writable = True
+        self._pending = []
 
         #set contents
-        if contents is None:
+        if contents is not None:
+            assert len(contents[0]) == dim
+
+        if sparse:
+            self._contents = None
+            self._indptr = numpy.zeros(1, dtype=numpy.intp)
+            self._indices = numpy.empty(0, dtype=numpy.intp)
+            self._values = numpy.empty(0, dtype=self._dtype)
+            if contents is not None:
+                self._append(numpy.array(contents, dtype=numpy.float64))
+        elif self._dtype is not None:
+            self._contents = None
+            if contents is None:
+                self._buffer = numpy.empty((0,dim), dtype=self._dtype)
+            else:
+                self._buffer = numpy.array(contents, dtype=self._dtype)
+                self._size = len(contents)
+        elif contents is None:
             self._contents = []
         else:
-            assert len(contents[0]) == dim
             self._contents = contents.copy() #shallow copy
 
 
@@ -160,6 +616,10 @@ class Dataset(object):
         That returns the list storing the data set, and any changes to that list will
         alter the data set.
 
+        If this data set does not use list storage, the point is read from its array,
+        so it is a tuple of floats even if it was added as a tuple of ints. In that
+        case getContents() cannot modify the data set either (see getArray()).
+
         Parameter i: the index position of the point
         Precondition: i is an int that refers to a valid position in 0..getSize()-1
         """
@@ -167,6 +627,12 @@ class Dataset(object):
         assert type(i) == int
         assert i >= 0 and i <= (self.getSize()-1)
         #return point at position i
+        if self._sparse:
+            return tuple(self.getBlock(i, i+1)[0].tolist())
+        elif self._dtype is not None and i >= self._size:
+            return self._pending[i-self._size]
+        elif self._dtype is not None:
+            return tuple(self._buffer[i].tolist())
         return self._contents[i]
 
 
@@ -174,12 +640,500 @@ class Dataset(object):
         """
         Adds a the given point to the end of this data set.
 
-        The point does not need to be copied since tuples are not mutable.
+        The point does not need to be copied since tuples are not mutable. With array
+        storage, the point is written into the next free row of the array, doubling
+        the capacity first if the array is full. If the data set is backed by a file,
+        the point goes into the write-ahead buffer, which is flushed to the file once
+        it holds WAL_ROWS points. With sparse storage, only its nonzero coordinates
+        are stored.
 
         Parameter point: The point to add to the set
         Precondition: point is a tuple of int/float. The length of point is equal
-        to getDimension().
+        to getDimension(). If this data set is backed by a file, it is writable.
         """
         # IMPLEMENT ME
         assert is_point(point) and len(point) == self.getDimension()
-        self._contents.append(point)
+        if self._dtype is None:
+            self._contents.append(point)
+            return
+        elif self._sparse:
+            self._append(numpy.array([point], dtype=numpy.float64))
+            return
+        elif self._file is not None:
+            assert self._writable
+            self._pending.append(tuple(numpy.asarray(point, dtype=self._dtype).tolist()))
+            if len(self._pending) >= WAL_ROWS:
+                self.flush()
+            return
+
+        self._reserve(self._size+1)
+        self._buffer[self._size] = point
+        self._size = self._size+1
+
+
+    def addPoints(self, points):
+        """
+        Adds all of the given points to the end of this data set, in order.
+
+        This is much faster than calling addPoint on each point. The points are taken
+        INGEST_ROWS at a time. Each chunk is converted to a numpy array, its dimension
+        and type are checked once, and it is then copied into the storage in one
+        operation (growing the array, or appending to the file, at most once per
+        chunk). With list storage, the points are stored as float tuples.
+
+        The points may also be a SparseBlock. A sparse data set copies its nonzeros
+        over directly, while any other data set adds its points INGEST_ROWS at a time
+        with the zeros filled in.
+
+        Parameter points: The points to add
+        Precondition: points is a 2-D int or float numpy array or SparseBlock with
+        getDimension() columns, or an iterable (such as a list or generator) of points
+        (int/float tuples) whose length is equal to getDimension(). If this data set
+        is backed by a file, it is writable.
+        """
+        if isinstance(points, SparseBlock):
+            assert points.getDimension() == self._dimension
+            if self._sparse:
+                self._appendSparse(points)
+                return
+            for start in range(0, len(points), INGEST_ROWS):
+                self._append(points[start:start+INGEST_ROWS].toarray())
+            return
+        elif isinstance(points, numpy.ndarray):
+            assert points.ndim == 2 and points.shape[1] == self._dimension
+            assert points.dtype.kind in 'iuf'
+            for start in range(0, len(points), INGEST_ROWS):
+                self._append(points[start:start+INGEST_ROWS])
+            return
+
+        points = iter(points)
+        chunk = list(itertools.islice(points, INGEST_ROWS))
+        while len(chunk) > 0:
+            block = numpy.asarray(chunk)
+            assert block.ndim == 2 and block.shape[1] == self._dimension
+            assert block.dtype.kind in 'iuf'
+            self._append(block.astype(numpy.float64, copy=False))
+            chunk = list(itertools.islice(points, INGEST_ROWS))
+
+
+    def flush(self):
+        """
+        Writes any points waiting in the write-ahead buffer to the backing file.
+
+        The points are appended to the end of the file (for a .npy file, the shape
+        in the header is updated to match), and the file is mapped again to include
+        them. Changes made through getArray() are also written to the file. If this
+        data set is not backed by a file, this method does nothing.
+        """
+        if self._file is None:
+            return
+        if len(self._pending) == 0:
+            if isinstance(self._buffer, numpy.memmap):
+                self._buffer.flush()
+            return
+
+        data = numpy.array(self._pending, dtype=self._dtype)
+        self._pending = []
+        self._write(data)
+
+
+    # HELPER METHODS
+    def _append(self, block):
+        """
+        Adds the rows of block to the end of this data set.
+
+        Parameter block: the points to add
+        Precondition: block is a 2-D numpy array with getDimension() columns. If this
+        data set is backed by a file, it is writable.
+        """
+        if self._dtype is None:
+            self._contents.extend([tuple(row) for row in block.tolist()])
+        elif self._sparse:
+            rows, columns = numpy.nonzero(block)
+            indptr = numpy.zeros(len(block)+1, dtype=numpy.intp)
+            numpy.cumsum(numpy.bincount(rows, minlength=len(block)), out=indptr[1:])
+            self._appendSparse(SparseBlock(self._dimension, indptr, columns, block[rows, columns]))
+        elif self._file is not None:
+            assert self._writable
+            self.flush()
+            self._write(numpy.asarray(block, dtype=self._dtype))
+        else:
+            self._reserve(self._size+len(block))
+            self._buffer[self._size:self._size+len(block)] = block
+            self._size = self._size+len(block)
+
+
+    def _appendSparse(self, block):
+        """
+        Adds the points of a sparse block to the end of this (sparse) data set.
+
+        Parameter block: the points to add
+        Precondition: block is a SparseBlock with getDimension() columns, and this data
+        set uses sparse storage
+        """
+        start = int(self._indptr[self._size])
+        stop = start+block.getNonzeros()
+        self._reserveSparse(self._size+len(block), stop)
+
+        self._indices[start:stop] = block.getIndices()
+        self._values[start:stop] = block.getValues()
+        self._indptr[self._size+1:self._size+len(block)+1] = block.getIndptr()[1:]+start
+        self._size = self._size+len(block)
+
+
+    def _write(self, data):
+        """
+        Appends the rows of data to the backing file, and maps the file again.
+
+        Parameter data: the points to write
+        Precondition: data is a 2-D numpy array of type getDtype() with getDimension()
+        columns, and there are no pending points
+        """
+        if isinstance(self._buffer, numpy.memmap):
+            self._buffer.flush()
+        with open(self._file, 'r+b') as file:
+            file.seek(self._offset+self._size*self._dimension*self._dtype.itemsize)
+            file.write(data.tobytes())
+            if self._offset > 0:
+                self._writeHeader(file, self._size+len(data))
+
+        self._map(self._file, self._offset, self._size+len(data), self._writable)
+
+
+    def _map(self, filename, offset, rows, writable):
+        """
+        Makes this data set a view of rows points of the given file.
+
+        Parameter filename: the file to map
+        Precondition: filename is a string naming an existing file
+
+        Parameter offset: the position of the first point in the file
+        Precondition: offset is an int >= 0
+
+        Parameter rows: the number of points in the file
+        Precondition: rows is an int >= 0
+
+        Parameter writable: whether points may be added to the file
+        Precondition: writable is a bool
+        """
+        self._file = filename
+        self._offset = offset
+        self._writable = writable
+        self._size = rows
+
+        if rows == 0:
+            self._buffer = numpy.empty((0,self._dimension), dtype=self._dtype)
+        else:
+            mode = 'r+' if writable else 'r'
+            self._buffer = numpy.memmap(filename, dtype=self._dtype, mode=mode,
+                                        offset=offset, shape=(rows,self._dimension))
+
+
+    def _writeHeader(self, file, rows):
+        """
+        Rewrites the header of the backing .npy file to hold rows points.
+
+        The header must keep its length, which numpy allows for by padding headers
+        with room for the first dimension to grow.
+
+        Parameter file: the backing file
+        Precondition: file is the .npy file of this data set, open for update
+
+        Parameter rows: the new number of points
+        Precondition: rows is an int >= 0
+        """
+        header = {'descr': numpy.lib.format.dtype_to_descr(self._dtype),
+                  'fortran_order': False, 'shape': (rows,self._dimension)}
+        file.seek(0)
+        version = numpy.lib.format.read_magic(file)
+
+        staging = io.BytesIO()
+        if version == (1,0):
+            numpy.lib.format.write_array_header_1_0(staging, header)
+        else:
+            numpy.lib.format.write_array_header_2_0(staging, header)
+        assert len(staging.getvalue()) == self._offset, 'header of '+self._file+' cannot grow'
+
+        file.seek(0)
+        file.write(staging.getvalue())
+
+
+    def _reserve(self, size):
+        """
+        Makes sure the array storage has room for at least size points.
+
+        If the array is too small, it is replaced by one with double the capacity (or
+        MIN_CAPACITY rows if it was empty) and the existing points are copied over.
+
+        Parameter size: the number of points to make room for
+        Precondition: size is an int >= 0 and this data set uses array storage
+        """
+        capacity = len(self._buffer)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity = max(2*capacity, MIN_CAPACITY)
+
+        buffer = numpy.empty((capacity, self._dimension), dtype=self._dtype)
+        buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+
+
+    def _reserveSparse(self, size, nonzeros):
+        """
+        Makes sure the sparse storage has room for size points and nonzeros nonzeros.
+
+        Each of the arrays that is too small is replaced by one with double the
+        capacity (or at least MIN_CAPACITY), as in _reserve.
+
+        Parameter size: the number of points to make room for
+        Precondition: size is an int >= 0 and this data set uses sparse storage
+
+        Parameter nonzeros: the number of nonzeros to make room for
+        Precondition: nonzeros is an int >= 0
+        """
+        capacity = len(self._indptr)-1
+        if size > capacity:
+            while capacity < size:
+                capacity = max(2*capacity, MIN_CAPACITY)
+            indptr = numpy.zeros(capacity+1, dtype=numpy.intp)
+            indptr[:self._size+1] = self._indptr[:self._size+1]
+            self._indptr = indptr
+
+        used = int(self._indptr[self._size])
+        capacity = len(self._indices)
+        if nonzeros > capacity:
+            while capacity < nonzeros:
+                capacity = max(2*capacity, MIN_CAPACITY)
+            indices = numpy.empty(capacity, dtype=numpy.intp)
+            values = numpy.empty(capacity, dtype=self._dtype)
+            indices[:used] = self._indices[:used]
+            values[:used] = self._values[:used]
+            self._indices = indices
+            self._values = values
+
+
+class SparseBlock(object):
+    """
+    A class representing a block of sparse points, in CSR form.
+
+    This is what getBlock returns for a sparse Dataset, in place of a 2-D array. Only
+    the nonzero coordinates are stored: the nonzeros of point i are at positions
+    indptr[i]..indptr[i+1]-1 of the arrays indices (their columns) and values (their
+    coordinates).
+
+    A block supports the parts of the array interface that the clustering code reads
+    points through: len(), indexing by an int (a dense 1-D array for one point), by a
+    slice or by an int array (another block), and astype(). The kernels in a6kernels
+    work on the three arrays directly, so their cost depends on the number of
+    nonzeros and not on the dimension. A block should be treated as read-only, since
+    it is usually a view of the storage of its dataset.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _dimension: The point dimension
+    # Invariant: _dimension is an int > 0
+    #
+    # Attribute _indptr: The start of each point among the nonzeros
+    # Invariant: _indptr is a 1-D int array with an element per point plus one. It
+    # starts at 0, never decreases, and ends at the number of nonzeros.
+    #
+    # Attribute _indices: The column of each nonzero
+    # Invariant: _indices is a 1-D int array of values in 0.._dimension-1
+    #
+    # Attribute _values: The coordinate of each nonzero
+    # Invariant: _values is a 1-D float64 or float32 array with an element per element
+    # of _indices
+
+    def getDimension(self):
+        """
+        Returns the point dimension of this block.
+        """
+        return self._dimension
+
+
+    def getIndptr(self):
+        """
+        Returns the array with the start of each point among the nonzeros.
+
+        The array has an element per point plus one (not a copy).
+        """
+        return self._indptr
+
+
+    def getIndices(self):
+        """
+        Returns the array with the column of each nonzero (not a copy).
+        """
+        return self._indices
+
+
+    def getValues(self):
+        """
+        Returns the array with the coordinate of each nonzero (not a copy).
+        """
+        return self._values
+
+
+    def getDtype(self):
+        """
+        Returns the numpy dtype of the coordinates of this block.
+        """
+        return self._values.dtype
+
+
+    def getNonzeros(self):
+        """
+        Returns the number of nonzero coordinates in this block.
+        """
+        return len(self._values)
+
+
+    def __init__(self, dim, indptr, indices, values):
+        """
+        Initializes a block from the three CSR arrays, without copying them.
+
+        Parameter dim: the point dimension
+        Precondition: dim is an int > 0
+
+        Parameter indptr: the start of each point among the nonzeros
+        Precondition: indptr is a 1-D numpy int array starting at 0, never decreasing
+        and ending at len(values)
+
+        Parameter indices: the column of each nonzero
+        Precondition: indices is a 1-D numpy int array of values in 0..dim-1, with an
+        element per element of values. The columns of each point are distinct.
+
+        Parameter values: the coordinate of each nonzero
+        Precondition: values is a 1-D float64 or float32 numpy array
+        """
+        assert type(dim) == int and dim > 0
+        assert len(indptr) > 0 and len(indices) == len(values)
+        self._dimension = dim
+        self._indptr = indptr
+        self._indices = indices
+        self._values = values
+
+
+    def __len__(self):
+        """
+        Returns the number of points in this block.
+        """
+        return len(self._indptr)-1
+
+
+    def __iter__(self):
+        """
+        Returns an iterator over the points of this block, as dense 1-D arrays.
+        """
+        for pos in range(len(self)):
+            yield self[pos]
+
+
+    def __getitem__(self, key):
+        """
+        Returns the point(s) of this block selected by key.
+
+        If key is an int, the result is a new dense 1-D array for that point (a negative
+        key counts from the end, and a key out of range raises IndexError). If key is
+        a slice with no step, the result is a block viewing those points. If key is an
+        int array (or a bool array with an element per point), the result is a new
+        block with those points, in that order.
+
+        Parameter key: the points to select
+        Precondition: key is an int, a slice with no step, or a 1-D numpy int or bool
+        array of valid positions
+        """
+        if isinstance(key, (int, numpy.integer)):
+            key = int(key)
+            if key < 0:
+                key = key+len(self)
+            if key < 0 or key >= len(self):
+                raise IndexError('point '+repr(key)+' is out of range')
+            first = self._indptr[key]
+            last = self._indptr[key+1]
+            result = numpy.zeros(self._dimension, dtype=self._values.dtype)
+            result[self._indices[first:last]] = self._values[first:last]
+            return result
+        elif isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            assert step == 1
+            stop = max(start, stop)
+            first = self._indptr[start]
+            last = self._indptr[stop]
+            return SparseBlock(self._dimension, self._indptr[start:stop+1]-first,
+                               self._indices[first:last], self._values[first:last])
+
+        rows = numpy.asarray(key)
+        if rows.dtype == bool:
+            rows = numpy.flatnonzero(rows)
+        starts = self._indptr[rows]
+        lengths = self._indptr[rows+1]-starts
+        indptr = numpy.zeros(len(rows)+1, dtype=numpy.intp)
+        numpy.cumsum(lengths, out=indptr[1:])
+
+        #the position of each kept nonzero in the arrays of this block
+        positions = numpy.repeat(starts-indptr[:-1], lengths)+numpy.arange(indptr[-1])
+        return SparseBlock(self._dimension, indptr, self._indices[positions],
+                           self._values[positions])
+
+
+    def astype(self, dtype, copy=True):
+        """
+        Returns a block with the same points, with coordinates of the given type.
+
+        As for numpy arrays, if copy is False and the coordinates already have that
+        type, the result is this block itself.
+
+        Parameter dtype: the coordinate type
+        Precondition: dtype is numpy.float64 or numpy.float32
+
+        Parameter copy: whether to always copy the coordinates (OPTIONAL)
+        Precondition: copy is a bool
+        """
+        if not copy and self._values.dtype == numpy.dtype(dtype):
+            return self
+        return SparseBlock(self._dimension, self._indptr, self._indices,
+                           self._values.astype(dtype))
+
+
+    def toarray(self):
+        """
+        Returns the points of this block as a new dense 2-D array (a row per point).
+        """
+        result = numpy.zeros((len(self), self._dimension), dtype=self._values.dtype)
+        result[self.getRows(), self._indices] = self._values
+        return result
+
+
+    def getRows(self):
+        """
+        Returns an int array with the position of the point holding each nonzero.
+        """
+        return numpy.repeat(numpy.arange(len(self)), numpy.diff(self._indptr))
+
+
+    def getNorms(self):
+        """
+        Returns a float array with the squared length of each point.
+        """
+        return self.sumRows(self._values*self._values)
+
+
+    def sumRows(self, data):
+        """
+        Returns an array adding up data over the nonzeros of each point.
+
+        Element (or row) i of the result is the sum of the elements (or rows) of data
+        at the positions of the nonzeros of point i, added in order. It is 0 for a
+        point with no nonzeros.
+
+        Parameter data: a value for each nonzero
+        Precondition: data is a 1-D or 2-D numpy array with an element (or row) per
+        nonzero of this block
+        """
+        result = numpy.zeros((len(self),)+data.shape[1:], dtype=data.dtype)
+        present = numpy.flatnonzero(numpy.diff(self._indptr))
+        if len(present) > 0:
+            result[present] = numpy.add.reduceat(data, self._indptr[present], axis=0)
+        return result
@@ -0,0 +1,220 @@
+"""
+Spatial index for k-Means clustering
+
+This file contains the class KDTree, a k-d tree over the cluster centroids. With many
+clusters, it finds the nearest centroid to a point after measuring the distance to only
+a few of them (roughly log k), instead of all k. It answers queries for a whole array
+of points at once.
+
+"""
+import math
+import numpy
+
+
+# For accessing the previous parts of the assignment
+import a6kernels
+
+
+class KDTree(object):
+    """
+    A class representing a k-d tree over a set of centroids.
+
+    Every node of the tree holds a subset of the centroids and the bounding box of that
+    subset. An inner node splits its centroids in two halves, at the median of the
+    coordinate with the largest spread. A leaf holds at most leafsize centroids.
+
+    To find the nearest centroids to an array of points, the points first go down the
+    tree to the leaf on their side of each split, and take the nearest centroid of that
+    leaf as their best guess. Then the tree is searched again, but each point only
+    visits the nodes whose bounding box is at least as close as its best guess. Hence
+    the result is exact, and ties are broken in favor of the earlier centroid, as in
+    Algorithm._nearest.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _centroids: The centroids in the tree
+    # Invariant: _centroids is a non-empty 2-D float64 or float32 array with a row per
+    # centroid. The distances are computed in its type.
+    #
+    # Attribute _nodes: The nodes of the tree; node 0 is the root
+    # Invariant: _nodes is a non-empty list of lists [low, high, members, axis,
+    # value, left, right]. The arrays low and high are the corners of the bounding
+    # box of the centroids in the node. For a leaf, members is an int array of the
+    # positions of its centroids, and the other elements are None. For an inner node,
+    # members is None, and the centroids whose coordinate axis is less than value
+    # are in node left (the others are in node right).
+
+    def getCentroids(self):
+        """
+        Returns the centroids in this tree as a 2-D numpy array (a row per centroid).
+        """
+        return self._centroids
+
+
+    def __init__(self, centroids, leafsize=8):
+        """
+        Initializes a k-d tree over the given centroids.
+
+        Float32 centroids are kept as float32, and then the points are measured in
+        float32 too. Any other centroids are converted to float64.
+
+        Parameter centroids: the centroids
+        Precondition: centroids is a non-empty 2-D numpy array with a row per centroid
+
+        Parameter leafsize: the largest number of centroids in a leaf (OPTIONAL)
+        Precondition: leafsize is an int > 0
+        """
+        assert isinstance(centroids, numpy.ndarray) and centroids.ndim == 2
+        assert len(centroids) > 0
+        assert type(leafsize) == int and leafsize > 0
+
+        dtype = numpy.float32 if centroids.dtype == numpy.float32 else numpy.float64
+        self._centroids = numpy.array(centroids, dtype=dtype)
+        self._nodes = []
+        self._build(numpy.arange(len(centroids)), leafsize)
+
+
+    def nearest(self, points, budget=a6kernels.MEMORY_BUDGET):
+        """
+        Returns a pair (labels, dists) giving the nearest centroid to each point.
+
+        The result is the same as a6kernels.nearest(points, getCentroids()): labels is an
+        int array with the position of the nearest centroid for each point, and dists
+        is a float array with the distance to it. Ties are broken in favor of the
+        centroid occurring earlier.
+
+        Parameter points: the points to label
+        Precondition: points is a 2-D numpy array with a row per point, and as many
+        columns as the centroids
+
+        Parameter budget: the memory budget in bytes, for measuring a leaf (OPTIONAL)
+        Precondition: budget is an int > 0
+        """
+        points = numpy.asarray(points, dtype=self._centroids.dtype)
+        labels = numpy.zeros(len(points), dtype=numpy.intp)
+        dists = numpy.full(len(points), math.inf)
+
+        everything = numpy.arange(len(points))
+        self._descend(0, points, everything, labels, dists, budget)
+        self._search(0, points, everything, labels, dists, budget)
+        return labels, dists
+
+
+    # HELPER METHODS
+    def _build(self, members, leafsize):
+        """
+        Returns the position in _nodes of a new subtree over the given centroids.
+
+        Parameter members: the positions of the centroids in the subtree
+        Precondition: members is a non-empty 1-D int array
+
+        Parameter leafsize: the largest number of centroids in a leaf
+        Precondition: leafsize is an int > 0
+        """
+        points = self._centroids[members]
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        node = [low, high, members, None, None, None, None]
+        self._nodes.append(node)
+        position = len(self._nodes)-1
+
+        axis = int(numpy.argmax(high-low))
+        if len(members) <= leafsize or high[axis] == low[axis]:
+            return position
+
+        #split at the median of the widest coordinate
+        value = numpy.median(points[:, axis])
+        below = points[:, axis] < value
+        if not below.any():
+            below = points[:, axis] <= value
+        if below.all():
+            return position
+
+        node[2] = None
+        node[3] = axis
+        node[4] = value
+        node[5] = self._build(members[below], leafsize)
+        node[6] = self._build(members[~below], leafsize)
+        return position
+
+
+    def _descend(self, position, points, active, labels, dists, budget):
+        """
+        Sends the active points down the tree, to guess their nearest centroids.
+
+        Each point follows its side of every split down to a leaf, and its entry of
+        labels and dists is set to the nearest centroid in that leaf.
+
+        Parameter position: the node to start at
+        Precondition: position is a valid position in _nodes
+
+        Parameter points: all of the points
+        Precondition: points is a 2-D float64 array
+
+        Parameter active: the positions in points of the points to send down
+        Precondition: active is a 1-D int array
+
+        Parameter labels: the guessed centroid of each point (modified)
+        Precondition: labels is a 1-D int array with an element per point
+
+        Parameter dists: the distance to the guessed centroid (modified)
+        Precondition: dists is a 1-D float array with an element per point
+
+        Parameter budget: the memory budget in bytes
+        Precondition: budget is an int > 0
+        """
+        if len(active) == 0:
+            return
+
+        node = self._nodes[position]
+        if node[2] is not None:
+            self._measure(node[2], points, active, labels, dists, budget)
+            return
+
+        below = points[active, node[3]] < node[4]
+        self._descend(node[5], points, active[below], labels, dists, budget)
+        self._descend(node[6], points, active[~below], labels, dists, budget)
+
+
+    def _search(self, position, points, active, labels, dists, budget):
+        """
+        Searches the tree for centroids at least as close as the current guesses.
+
+        Only the points whose current distance is at least the distance to the
+        bounding box of the node take part. At a leaf, their guesses are improved
+        with any closer centroid (or equally close earlier centroid).
+
+        The parameters are the same as for _descend.
+        """
+        if len(active) == 0:
+            return
+
+        node = self._nodes[position]
+        gap = numpy.maximum(node[0]-points[active], 0)+numpy.maximum(points[active]-node[1], 0)
+        active = active[numpy.sqrt(numpy.einsum('ij,ij->i', gap, gap)) <= dists[active]]
+        if len(active) == 0:
+            return
+
+        if node[2] is not None:
+            self._measure(node[2], points, active, labels, dists, budget)
+        else:
+            self._search(node[5], points, active, labels, dists, budget)
+            self._search(node[6], points, active, labels, dists, budget)
+
+
+    def _measure(self, members, points, active, labels, dists, budget):
+        """
+        Improves the guesses of the active points with the centroids in members.
+
+        A centroid replaces the current guess of a point if it is closer, or if it is
+        just as close and occurs earlier.
+
+        Parameter members: the positions of the centroids to try
+        Precondition: members is a non-empty 1-D int array in increasing order
+
+        The other parameters are the same as for _descend.
+        """
+        found, near = a6kernels.nearest(points[active], self._centroids[members], budget)
+        found = members[found]
+        better = (near < dists[active]) | ((near == dists[active]) & (found < labels[active]))
+        labels[active[better]] = found[better]
+        dists[active[better]] = near[better]
@@ -0,0 +1,747 @@
+"""
+Vectorized kernels for k-Means clustering
+
+This file contains the numpy functions used by the faster clustering engines. Each
+kernel works on a block of points (a 2-D numpy array with one row per point), so the
+memory a kernel uses depends on the size of the block and not on the whole dataset.
+
+It also holds the registry of distance metrics, METRICS. Each metric has a scalar
+kernel, measuring one point against one centroid in plain Python, and a batched
+kernel, measuring a block of points against all of the centroids at once.
+
+The kernels whose names start with sparse_ work on a6dataset.SparseBlock blocks
+instead. They measure squared euclidean distances as |x|^2 + |c|^2 - 2 x.c, so that
+they only visit the nonzeros of the points. The general kernels (nearest, label_sums,
+label_stats, squared_to and gather) pass sparse blocks on to them.
+
+"""
+import math
+import numpy
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+
+
+# The largest number of bytes a single distance computation may allocate
+MEMORY_BUDGET = 64*1024*1024
+
+# The number of dataset rows read at a time when streaming over a dataset
+BLOCK_ROWS = 65536
+
+# The registered distance metrics: each name is mapped to a pair (scalar, batch) of
+# kernels (see register_metric)
+METRICS = {}
+
+
+def chunk_rows(k, dim, budget=MEMORY_BUDGET, itemsize=8):
+    """
+    Returns the number of points whose distances to k centroids fit in the budget.
+
+    Computing the distances from r points to k centroids makes an r x k x dim array
+    of coordinate differences, so this is budget // (k*dim*itemsize), but never less
+    than 1.
+
+    Parameter k: the number of centroids
+    Precondition: k is an int > 0
+
+    Parameter dim: the point dimension
+    Precondition: dim is an int > 0
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+
+    Parameter itemsize: the number of bytes per coordinate (OPTIONAL)
+    Precondition: itemsize is an int > 0
+    """
+    return max(1, budget // (k*dim*itemsize))
+
+
+def distances(points, centroids):
+    """
+    Returns the matrix of euclidean distances from every point to every centroid.
+
+    The result has a row per point and a column per centroid. Each entry is computed
+    the same way as Cluster.distance: the square root of the sum of the squared
+    coordinate differences. The arithmetic is done in the common type of points and
+    centroids, so if both are float32 the result is float32 as well.
+
+    Parameter points: the points to measure
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with the same number of columns
+    as points
+    """
+    diff = points[:, None, :] - centroids[None, :, :]
+    return numpy.sqrt(numpy.einsum('ijk,ijk->ij', diff, diff))
+
+
+def squared_distances(points, centroids):
+    """
+    Returns the matrix of squared euclidean distances from every point to every centroid.
+
+    This is distances without the square root. It has the same nearest centroids.
+
+    Parameter points: the points to measure
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with the same number of columns
+    as points
+    """
+    diff = points[:, None, :] - centroids[None, :, :]
+    return numpy.einsum('ijk,ijk->ij', diff, diff)
+
+
+def manhattan_distances(points, centroids):
+    """
+    Returns the matrix of manhattan distances from every point to every centroid.
+
+    The manhattan distance is the sum of the absolute coordinate differences.
+
+    Parameter points: the points to measure
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with the same number of columns
+    as points
+    """
+    return numpy.abs(points[:, None, :] - centroids[None, :, :]).sum(axis=2)
+
+
+def cosine_distances(points, centroids):
+    """
+    Returns the matrix of cosine distances from every point to every centroid.
+
+    The cosine distance is 1 minus the cosine of the angle between the two vectors.
+    A zero vector is treated as having cosine 0 with everything (distance 1).
+
+    Parameter points: the points to measure
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with the same number of columns
+    as points
+    """
+    return normalized_cosine_distances(normalize(points), centroids)
+
+
+def normalized_cosine_distances(points, centroids):
+    """
+    Returns the matrix of cosine distances from every unit-length point to every centroid.
+
+    This is the fast path of cosine_distances, for points that were scaled to length
+    1 ahead of time (see normalize). Only the centroids are scaled, and the cosines
+    come out of a single matrix product.
+
+    Parameter points: the points to measure
+    Precondition: points is a 2-D numpy array with a row per point, each of length 1
+    (or 0)
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with the same number of columns
+    as points
+    """
+    return 1-points @ normalize(centroids).T
+
+
+def normalize(points):
+    """
+    Returns a copy of points with each row scaled to length 1.
+
+    Rows of length 0 are left as they are.
+
+    Parameter points: the points to scale
+    Precondition: points is a 2-D numpy float array with a row per point
+    """
+    lengths = numpy.sqrt(numpy.einsum('ij,ij->i', points, points))
+    lengths[lengths == 0] = 1
+    return points/lengths[:, None].astype(points.dtype)
+
+
+def euclidean(point, centroid):
+    """
+    Returns the euclidean distance from point to centroid.
+
+    This is the scalar kernel behind Cluster.distance. It adds up the squares of the
+    coordinate differences in order, and takes the square root.
+
+    Parameter point: the point to measure
+    Precondition: point is a tuple (or 1-D array) of numbers
+
+    Parameter centroid: the centroid to measure against
+    Precondition: centroid is a tuple of numbers of the same length as point
+    """
+    sum = 0
+    for x in range(len(point)):
+        sum = sum + (point[x]-centroid[x])**2
+    return math.sqrt(sum)
+
+
+def sqeuclidean(point, centroid):
+    """
+    Returns the squared euclidean distance from point to centroid.
+
+    The parameters are the same as for euclidean.
+    """
+    sum = 0
+    for x in range(len(point)):
+        sum = sum + (point[x]-centroid[x])**2
+    return sum
+
+
+def manhattan(point, centroid):
+    """
+    Returns the manhattan distance from point to centroid.
+
+    The parameters are the same as for euclidean.
+    """
+    sum = 0
+    for x in range(len(point)):
+        sum = sum + abs(point[x]-centroid[x])
+    return sum
+
+
+def cosine(point, centroid):
+    """
+    Returns the cosine distance from point to centroid.
+
+    A zero vector is treated as having cosine 0 with everything (distance 1).
+
+    The parameters are the same as for euclidean.
+    """
+    dot = 0
+    plen = 0
+    clen = 0
+    for x in range(len(point)):
+        dot = dot + point[x]*centroid[x]
+        plen = plen + point[x]*point[x]
+        clen = clen + centroid[x]*centroid[x]
+    if plen == 0 or clen == 0:
+        return 1.0
+    return 1-dot/(math.sqrt(plen)*math.sqrt(clen))
+
+
+def normalized_cosine(point, centroid):
+    """
+    Returns the cosine distance from a unit-length point to centroid.
+
+    Parameter point: the point to measure
+    Precondition: point is a tuple (or 1-D array) of numbers, of length 1 (or 0)
+
+    Parameter centroid: the centroid to measure against
+    Precondition: centroid is a tuple of numbers of the same length as point
+    """
+    dot = 0
+    clen = 0
+    for x in range(len(point)):
+        dot = dot + point[x]*centroid[x]
+        clen = clen + centroid[x]*centroid[x]
+    if clen == 0:
+        return 1.0
+    return 1-dot/math.sqrt(clen)
+
+
+def register_metric(name, scalar, batch):
+    """
+    Adds a distance metric to METRICS.
+
+    The metric can then be given by name to Cluster and Algorithm. Whatever the
+    metric, a centroid is still moved to the mean of its points.
+
+    Parameter name: the name of the metric
+    Precondition: name is a string that is not already in METRICS
+
+    Parameter scalar: the scalar kernel
+    Precondition: scalar is a function taking a point and a centroid (tuples or 1-D
+    arrays of the same length) and returning their distance as a number
+
+    Parameter batch: the batched kernel
+    Precondition: batch is a function taking a 2-D array of points and a 2-D array
+    of centroids, and returning the matrix of their distances (a row per point),
+    with the same values as scalar
+    """
+    assert type(name) == str and name not in METRICS
+    assert callable(scalar) and callable(batch)
+    METRICS[name] = (scalar, batch)
+
+
+def nearest(points, centroids, budget=MEMORY_BUDGET, metric='euclidean'):
+    """
+    Returns a pair (labels, dists) giving the nearest centroid to each point.
+
+    The value labels is an int array with the position of the nearest centroid for
+    each point, and dists is a float array with the distance to that centroid. Ties
+    are broken in favor of the centroid occurring earlier in centroids.
+
+    The points are processed in chunks, so that no distance matrix is ever larger
+    than the memory budget. As in distances, float32 points and centroids are
+    measured in float32.
+
+    Parameter points: the points to label
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a non-empty 2-D numpy array with the same number of
+    columns as points
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+
+    Parameter metric: the distance metric (OPTIONAL)
+    Precondition: metric is a key of METRICS
+    """
+    if isinstance(points, a6dataset.SparseBlock):
+        return sparse_nearest(points, centroids, budget, metric)
+
+    batch = METRICS[metric][1]
+    size = len(points)
+    itemsize = numpy.result_type(points, centroids).itemsize
+    step = chunk_rows(len(centroids), centroids.shape[1], budget, itemsize)
+    labels = numpy.empty(size, dtype=numpy.intp)
+    dists = numpy.empty(size, dtype=numpy.float64)
+
+    for start in range(0, size, step):
+        stop = min(start+step, size)
+        matrix = batch(points[start:stop], centroids)
+        labels[start:stop] = numpy.argmin(matrix, axis=1)
+        dists[start:stop] = matrix[numpy.arange(stop-start), labels[start:stop]]
+
+    return labels, dists
+
+
+def assign(dset, centroids, budget=MEMORY_BUDGET, metric='euclidean'):
+    """
+    Returns a pair (labels, dists) giving the nearest centroid to each dataset point.
+
+    This is the same as nearest, except that it streams over the dataset BLOCK_ROWS
+    points at a time instead of taking one array of points.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a non-empty 2-D numpy array with dset.getDimension()
+    columns
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+
+    Parameter metric: the distance metric (OPTIONAL)
+    Precondition: metric is a key of METRICS
+    """
+    size = dset.getSize()
+    labels = numpy.empty(size, dtype=numpy.intp)
+    dists = numpy.empty(size, dtype=numpy.float64)
+
+    for start in range(0, size, BLOCK_ROWS):
+        stop = min(start+BLOCK_ROWS, size)
+        block = dset.getBlock(start, stop)
+        labels[start:stop], dists[start:stop] = nearest(block, centroids, budget, metric)
+
+    return labels, dists
+
+
+def group(labels, k):
+    """
+    Returns a list of k int arrays, the positions in labels holding each label.
+
+    Each array is in increasing order. All k arrays are found with a single stable
+    sort of labels, rather than a separate scan for each label.
+
+    Parameter labels: the labels to group
+    Precondition: labels is a 1-D numpy int array of values in 0..k-1
+
+    Parameter k: the number of labels
+    Precondition: k is an int > 0
+    """
+    order = numpy.argsort(labels, kind='stable')
+    bounds = numpy.cumsum(numpy.bincount(labels, minlength=k))
+    return numpy.split(order, bounds[:-1])
+
+
+def label_sums(points, labels, k):
+    """
+    Returns a pair (sums, counts) adding up the points with each label.
+
+    The value sums is a k x dim float64 array whose row j is the sum of the points
+    labeled j, and counts is an int array whose element j is the number of points
+    labeled j. Each label's points are added in the order they appear in points.
+
+    Parameter points: the points to add up
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter labels: the label of each point
+    Precondition: labels is a 1-D numpy int array of values in 0..k-1, with an
+    element per row of points
+
+    Parameter k: the number of labels
+    Precondition: k is an int > 0
+    """
+    if isinstance(points, a6dataset.SparseBlock):
+        return sparse_label_sums(points, labels, k)
+
+    counts = numpy.bincount(labels, minlength=k)
+    sums = numpy.empty((k, points.shape[1]), dtype=numpy.float64)
+    for col in range(points.shape[1]):
+        sums[:, col] = numpy.bincount(labels, weights=points[:, col], minlength=k)
+    return sums, counts
+
+
+def label_stats(points, labels, dists, k):
+    """
+    Returns a tuple (sums, counts, low, high, inertia, radius) describing each label.
+
+    The values sums and counts are the same as the pair returned by label_sums. The
+    values low and high are k x dim float64 arrays whose row j is the smallest and
+    largest coordinates of the points labeled j (infinite if there are none). The
+    values inertia and radius are float arrays whose element j is the sum and the
+    maximum of the squared dists (and the plain dists) of the points labeled j.
+
+    Parameter points: the points to describe
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter labels: the label of each point
+    Precondition: labels is a 1-D numpy int array of values in 0..k-1, with an
+    element per row of points
+
+    Parameter dists: the distance from each point to the centroid of its label
+    Precondition: dists is a 1-D numpy float array with an element per row of points
+
+    Parameter k: the number of labels
+    Precondition: k is an int > 0
+    """
+    if isinstance(points, a6dataset.SparseBlock):
+        return sparse_label_stats(points, labels, dists, k)
+
+    sums, counts = label_sums(points, labels, k)
+    low = numpy.full((k, points.shape[1]), math.inf)
+    high = numpy.full((k, points.shape[1]), -math.inf)
+    inertia = numpy.bincount(labels, weights=dists*dists, minlength=k)
+    radius = numpy.zeros(k, dtype=numpy.float64)
+
+    #reduce each run of equal labels in the sorted order
+    present = numpy.flatnonzero(counts)
+    if len(present) > 0:
+        #numpy sorts 16-bit keys with a (much faster) radix sort
+        keys = labels.astype(numpy.uint16) if k <= 65536 else labels
+        order = numpy.argsort(keys, kind='stable')
+        starts = (numpy.cumsum(counts)-counts)[present]
+        ordered = points[order]
+        low[present] = numpy.minimum.reduceat(ordered, starts, axis=0)
+        high[present] = numpy.maximum.reduceat(ordered, starts, axis=0)
+        radius[present] = numpy.maximum.reduceat(dists[order], starts)
+
+    return sums, counts, low, high, inertia, radius
+
+
+def cluster_sums(dset, labels, k):
+    """
+    Returns a pair (sums, counts) adding up the dataset points in each cluster.
+
+    This is the same as label_sums, except that it streams over the dataset one
+    block of BLOCK_ROWS points at a time. The sums of the blocks are added together
+    in order, starting from zero.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter labels: the cluster of each dataset point
+    Precondition: labels is a 1-D numpy int array of values in 0..k-1, with an
+    element per dataset point
+
+    Parameter k: the number of clusters
+    Precondition: k is an int > 0
+    """
+    size = dset.getSize()
+    sums = numpy.zeros((k, dset.getDimension()), dtype=numpy.float64)
+    counts = numpy.zeros(k, dtype=numpy.intp)
+
+    for start in range(0, size, BLOCK_ROWS):
+        stop = min(start+BLOCK_ROWS, size)
+        part = label_sums(dset.getBlock(start, stop), labels[start:stop], k)
+        sums += part[0]
+        counts += part[1]
+
+    return sums, counts
+
+
+def nearest_two(points, centroids, budget=MEMORY_BUDGET):
+    """
+    Returns a triple (labels, first, second) for the two nearest centroids to each point.
+
+    The values labels and first are the same as the pair returned by nearest. The
+    value second is a float array with the distance from each point to its second
+    nearest centroid (infinity if there is only one centroid).
+
+    Parameter points: the points to label
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a non-empty 2-D numpy array with the same number of
+    columns as points
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+    """
+    size = len(points)
+    itemsize = numpy.result_type(points, centroids).itemsize
+    step = chunk_rows(len(centroids), centroids.shape[1], budget, itemsize)
+    labels = numpy.empty(size, dtype=numpy.intp)
+    first = numpy.empty(size, dtype=numpy.float64)
+    second = numpy.empty(size, dtype=numpy.float64)
+
+    for start in range(0, size, step):
+        stop = min(start+step, size)
+        rows = numpy.arange(stop-start)
+        matrix = distances(points[start:stop], centroids)
+        labels[start:stop] = numpy.argmin(matrix, axis=1)
+        first[start:stop] = matrix[rows, labels[start:stop]]
+        matrix[rows, labels[start:stop]] = math.inf
+        second[start:stop] = matrix.min(axis=1)
+
+    return labels, first, second
+
+
+def squared_to(dset, point):
+    """
+    Returns a float array with the squared distance from every dataset point to point.
+
+    The dataset is read one block of BLOCK_ROWS points at a time.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter point: the point to measure against
+    Precondition: point is a 1-D numpy array with dset.getDimension() elements
+    """
+    size = dset.getSize()
+    result = numpy.empty(size, dtype=numpy.float64)
+
+    for start in range(0, size, BLOCK_ROWS):
+        stop = min(start+BLOCK_ROWS, size)
+        block = dset.getBlock(start, stop)
+        if isinstance(block, a6dataset.SparseBlock):
+            result[start:stop] = sparse_squared_distances(block, point[None, :])[:, 0]
+        else:
+            diff = block-point
+            result[start:stop] = numpy.einsum('ij,ij->i', diff, diff)
+
+    return result
+
+
+def gather(dset, positions):
+    """
+    Returns a 2-D numpy array with the dataset points at the given positions.
+
+    The points are read from the dataset one block of BLOCK_ROWS points at a time,
+    and only the blocks containing some position are read. The array has the same
+    type as the dataset storage. For list storage, the array is float64 and is built
+    from just the tuples at the positions, since reading a block would convert all
+    of its tuples. For a sparse dataset, the result is a new a6dataset.SparseBlock
+    with those points instead.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter positions: the positions of the points
+    Precondition: positions is a 1-D numpy int array of increasing valid positions
+    """
+    if dset.isSparse():
+        return dset.getBlock(0, dset.getSize())[positions]
+    elif dset.getDtype() is None:
+        contents = dset.getContents()
+        result = numpy.array([contents[pos] for pos in positions.tolist()],
+                             dtype=numpy.float64)
+        return result.reshape(len(positions), dset.getDimension())
+
+    result = numpy.empty((len(positions), dset.getDimension()), dtype=dset.getDtype())
+    blocks = positions // BLOCK_ROWS
+    bounds = numpy.searchsorted(blocks, numpy.unique(blocks), side='right')
+
+    first = 0
+    for last in bounds.tolist():
+        start = int(blocks[first])*BLOCK_ROWS
+        stop = min(start+BLOCK_ROWS, dset.getSize())
+        result[first:last] = dset.getBlock(start, stop)[positions[first:last]-start]
+        first = last
+
+    return result
+
+
+def sparse_squared_distances(points, centroids):
+    """
+    Returns the matrix of squared euclidean distances from sparse points to centroids.
+
+    Each entry is |x|^2 + |c|^2 - 2 x.c, where the dot product x.c only visits the
+    nonzeros of x. So the cost is proportional to the number of nonzeros times the
+    number of centroids, whatever the dimension. This expansion can round a little
+    differently from squared_distances (and is never less than 0).
+
+    Parameter points: the points to measure
+    Precondition: points is an a6dataset.SparseBlock
+
+    Parameter centroids: the centroids to measure against
+    Precondition: centroids is a 2-D numpy array with a column per dimension of points
+    """
+    columns = numpy.ascontiguousarray(centroids.T)
+    return _sparse_squares(points, columns, numpy.einsum('ij,ij->i', centroids, centroids))
+
+
+def sparse_nearest(points, centroids, budget=MEMORY_BUDGET, metric='euclidean'):
+    """
+    Returns a pair (labels, dists) giving the nearest centroid to each sparse point.
+
+    This is nearest for a block of sparse points, using sparse_squared_distances. The
+    points are processed in chunks, so that the products of their nonzeros with the
+    centroids stay within the memory budget (going by the average nonzeros per point).
+
+    Parameter points: the points to label
+    Precondition: points is an a6dataset.SparseBlock
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a non-empty 2-D numpy array with a column per
+    dimension of points
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+
+    Parameter metric: the distance metric (OPTIONAL)
+    Precondition: metric is 'euclidean' or 'sqeuclidean'
+    """
+    assert metric in ['euclidean', 'sqeuclidean'], metric+' is not supported for sparse points'
+    size = len(points)
+    columns = numpy.ascontiguousarray(centroids.T)
+    lengths = numpy.einsum('ij,ij->i', centroids, centroids)
+    itemsize = numpy.result_type(points.getDtype(), centroids).itemsize
+    width = max(1, -(-points.getNonzeros() // max(size, 1)))
+    step = chunk_rows(len(centroids), width, budget, itemsize)
+    labels = numpy.empty(size, dtype=numpy.intp)
+    dists = numpy.empty(size, dtype=numpy.float64)
+
+    for start in range(0, size, step):
+        stop = min(start+step, size)
+        matrix = _sparse_squares(points[start:stop], columns, lengths)
+        labels[start:stop] = numpy.argmin(matrix, axis=1)
+        dists[start:stop] = matrix[numpy.arange(stop-start), labels[start:stop]]
+
+    if metric == 'euclidean':
+        numpy.sqrt(dists, out=dists)
+    return labels, dists
+
+
+def sparse_label_sums(points, labels, k):
+    """
+    Returns a pair (sums, counts) adding up the sparse points with each label.
+
+    This is label_sums for a block of sparse points. Each nonzero is added to the
+    entry of its label and column, in order, with a single numpy.bincount.
+
+    Parameter points: the points to add up
+    Precondition: points is an a6dataset.SparseBlock
+
+    Parameter labels: the label of each point
+    Precondition: labels is a 1-D numpy int array of values in 0..k-1, with an
+    element per point
+
+    Parameter k: the number of labels
+    Precondition: k is an int > 0
+    """
+    dim = points.getDimension()
+    counts = numpy.bincount(labels, minlength=k)
+    keys = labels[points.getRows()]*dim+points.getIndices()
+    sums = numpy.bincount(keys, weights=points.getValues(), minlength=k*dim)
+    return sums.reshape(k, dim), counts
+
+
+def sparse_label_stats(points, labels, dists, k):
+    """
+    Returns a tuple (sums, counts, low, high, inertia, radius) describing each label.
+
+    This is label_stats for a block of sparse points. The bounding boxes come from
+    the nonzeros, sorted by label and column. A coordinate that is zero for some
+    point with a label (that is, it is not among its nonzeros) also counts as 0.
+
+    Parameter points: the points to describe
+    Precondition: points is an a6dataset.SparseBlock
+
+    The other parameters are the same as for label_stats.
+    """
+    dim = points.getDimension()
+    sums, counts = sparse_label_sums(points, labels, k)
+    inertia = numpy.bincount(labels, weights=dists*dists, minlength=k)
+    radius = numpy.zeros(k, dtype=numpy.float64)
+    low = numpy.full(k*dim, math.inf)
+    high = numpy.full(k*dim, -math.inf)
+
+    #reduce each run of equal keys in the sorted order
+    keys = labels[points.getRows()]*dim+points.getIndices()
+    if len(keys) > 0:
+        order = numpy.argsort(keys, kind='stable')
+        ordered = keys[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], ordered[1:] != ordered[:-1])))
+        low[ordered[starts]] = numpy.minimum.reduceat(points.getValues()[order], starts)
+        high[ordered[starts]] = numpy.maximum.reduceat(points.getValues()[order], starts)
+
+    #include the zeros of the points missing a column
+    dense = numpy.bincount(keys, minlength=k*dim).reshape(k, dim) == counts[:, None]
+    low = numpy.where(dense, low.reshape(k, dim), numpy.minimum(low.reshape(k, dim), 0))
+    high = numpy.where(dense, high.reshape(k, dim), numpy.maximum(high.reshape(k, dim), 0))
+
+    present = numpy.flatnonzero(counts)
+    if len(present) > 0:
+        order = numpy.argsort(labels, kind='stable')
+        starts = (numpy.cumsum(counts)-counts)[present]
+        radius[present] = numpy.maximum.reduceat(dists[order], starts)
+
+    return sums, counts, low, high, inertia, radius
+
+
+def sparse_residuals(points, centroids, labels):
+    """
+    Returns a float array with the squared distance from each sparse point to its centroid.
+
+    Element i is the squared euclidean distance from point i to centroids[labels[i]],
+    computed by the same expansion as sparse_squared_distances.
+
+    Parameter points: the points to measure
+    Precondition: points is an a6dataset.SparseBlock
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a 2-D numpy array with a column per dimension of points
+
+    Parameter labels: the centroid of each point
+    Precondition: labels is a 1-D numpy int array of positions in centroids, with an
+    element per point
+    """
+    lengths = numpy.einsum('ij,ij->i', centroids, centroids)
+    products = centroids[labels[points.getRows()], points.getIndices()]*points.getValues()
+    result = points.getNorms()+lengths[labels]-2*points.sumRows(products)
+    return numpy.maximum(result, 0)
+
+
+def _sparse_squares(points, columns, lengths):
+    """
+    Returns the matrix of squared euclidean distances from sparse points to centroids.
+
+    Parameter points: the points to measure
+    Precondition: points is an a6dataset.SparseBlock
+
+    Parameter columns: the transposed centroids (a row per dimension)
+    Precondition: columns is a C-contiguous 2-D numpy array
+
+    Parameter lengths: the squared length of each centroid
+    Precondition: lengths is a 1-D numpy array with an element per column of columns
+    """
+    products = columns[points.getIndices()]*points.getValues()[:, None]
+    result = points.getNorms()[:, None]+lengths[None, :]-2*points.sumRows(products)
+    return numpy.maximum(result, 0, out=result)
+
+
+# The built-in distance metrics
+register_metric('euclidean', euclidean, distances)
+register_metric('sqeuclidean', sqeuclidean, squared_distances)
+register_metric('manhattan', manhattan, manhattan_distances)
+register_metric('cosine', cosine, cosine_distances)
+register_metric('cosine-normalized', normalized_cosine, normalized_cosine_distances)
@@ -0,0 +1,229 @@
+"""
+Saved models for k-Means clustering
+
+This file contains the class Model, which holds only the centroids found by an
+Algorithm (and some facts about how they were found). A model can be saved to a
+compact .npz file and loaded again in another program, to label new points without
+the Dataset and Cluster objects used for training.
+
+"""
+import json
+import numpy
+
+
+# For accessing the previous parts of the assignment
+import a6kernels
+import a6kdtree
+import a6algorithm
+
+
+# The version of the model file format written by save
+MODEL_VERSION = 1
+
+# The smallest number of clusters for which predict uses a k-d tree
+TREE_CLUSTERS = 64
+
+
+def from_algorithm(alg, metadata=None):
+    """
+    Returns a new Model with the current centroids of alg.
+
+    The metadata of the model records the number of steps alg has performed and the
+    number of points in each cluster, as well as the entries of metadata (if any).
+    The model has the metric of alg, and computes distances in the same type.
+
+    Parameter alg: the trained algorithm
+    Precondition: alg is an instance of Algorithm
+
+    Parameter metadata: extra facts to record about the training (OPTIONAL)
+    Precondition: metadata is None or a dict that can be written as JSON
+    """
+    assert metadata is None or type(metadata) == dict
+
+    clusters = alg.getClusters()
+    centroids = numpy.array([x.getCentroid() for x in clusters], dtype=numpy.float64)
+    facts = {'steps': alg.getSteps(), 'counts': [len(x.getIndices()) for x in clusters]}
+    if metadata is not None:
+        facts.update(metadata)
+    return Model(centroids.reshape(len(clusters), -1), facts, alg.getMetric(),
+                 alg.getDtype())
+
+
+def load(filename):
+    """
+    Returns the Model stored in the given file.
+
+    Only numeric arrays and a JSON string are read from the file, so loading a model
+    never unpickles any objects.
+
+    Parameter filename: the model file
+    Precondition: filename is the name of a file written by Model.save, with a
+    version no later than MODEL_VERSION
+    """
+    with numpy.load(filename, allow_pickle=False) as data:
+        version = int(data['version'])
+        assert version <= MODEL_VERSION, 'model version '+repr(version)+' is not supported'
+        centroids = data['centroids']
+        metadata = json.loads(str(data['metadata']))
+        shape = (int(data['k']), int(data['dimension']))
+        metric = str(data['metric']) if 'metric' in data else 'euclidean'
+        dtype = numpy.dtype(str(data['dtype'])).type if 'dtype' in data else numpy.float64
+
+    assert centroids.shape == shape
+    return Model(centroids, metadata, metric, dtype)
+
+
+class Model(object):
+    """
+    A class representing the result of k-means clustering.
+
+    A model is just the list of centroids, as a 2-D numpy array with a row per
+    cluster, a dict of metadata, the name of a distance metric and the type that
+    distances are computed in. Its method predict() labels new points with the
+    position of their nearest centroid, exactly as the Algorithm that produced the
+    centroids would (ties go to the earlier centroid).
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _centroids: The cluster centroids
+    # Invariant: _centroids is a non-empty 2-D float64 array with a row per cluster
+    #
+    # Attribute _metadata: The facts recorded about the training
+    # Invariant: _metadata is a dict that can be written as JSON
+    #
+    # Attribute _metric: The distance metric
+    # Invariant: _metric is a key of a6kernels.METRICS
+    #
+    # Attribute _dtype: The type distances are computed in
+    # Invariant: _dtype is the numpy dtype of one of the types in a6algorithm.DTYPES
+    #
+    # MUTABLE ATTRIBUTES (Can be changed at any time, via predict)
+    # Attribute _index: The k-d tree over the centroids
+    # Invariant: _index is None, or a KDTree over _centroids in type _dtype (only
+    # built if there are at least TREE_CLUSTERS centroids, and the metric is euclidean)
+
+    def getDimension(self):
+        """
+        Returns the point dimension of this model.
+        """
+        return self._centroids.shape[1]
+
+
+    def getSize(self):
+        """
+        Returns the number of clusters in this model.
+        """
+        return len(self._centroids)
+
+
+    def getCentroids(self):
+        """
+        Returns the centroids of this model as a 2-D numpy array (a row per cluster).
+
+        This method returns the array directly (it does not copy), so it should not
+        be modified.
+        """
+        return self._centroids
+
+
+    def getMetric(self):
+        """
+        Returns the name of the distance metric of this model.
+        """
+        return self._metric
+
+
+    def getDtype(self):
+        """
+        Returns the type distances are computed in, as one of the types in
+        a6algorithm.DTYPES.
+        """
+        return self._dtype.type
+
+
+    def getMetadata(self):
+        """
+        Returns a copy of the metadata of this model.
+        """
+        return dict(self._metadata)
+
+
+    def __init__(self, centroids, metadata=None, metric='euclidean', dtype=numpy.float64):
+        """
+        Initializes a model with the given centroids.
+
+        Parameter centroids: the cluster centroids
+        Precondition: centroids is a non-empty 2-D numpy array with a row per cluster
+
+        Parameter metadata: the facts recorded about the training (OPTIONAL)
+        Precondition: metadata is None or a dict that can be written as JSON
+
+        Parameter metric: the distance metric (OPTIONAL)
+        Precondition: metric is a key of a6kernels.METRICS
+
+        Parameter dtype: the type to compute distances in (OPTIONAL)
+        Precondition: dtype is one of the types in a6algorithm.DTYPES
+        """
+        assert isinstance(centroids, numpy.ndarray) and centroids.ndim == 2
+        assert centroids.shape[0] > 0 and centroids.shape[1] > 0
+        assert metadata is None or type(metadata) == dict
+        assert metric in a6kernels.METRICS
+        assert dtype in a6algorithm.DTYPES
+
+        self._centroids = numpy.array(centroids, dtype=numpy.float64)
+        self._metadata = {} if metadata is None else dict(metadata)
+        self._metric = metric
+        self._dtype = numpy.dtype(dtype)
+        self._index = None
+
+
+    def predict(self, points):
+        """
+        Returns an int array with the position of the nearest centroid to each point.
+
+        The points are labeled a6kernels.BLOCK_ROWS at a time with the batched kernel
+        of the metric, or with a k-d tree over the centroids if the metric is
+        euclidean and there are at least TREE_CLUSTERS of them. Either way, the
+        points and the centroids are first converted to the type of this model.
+
+        Parameter points: the points to label
+        Precondition: points is a 2-D numpy array with a row per point, and
+        getDimension() columns
+        """
+        assert isinstance(points, numpy.ndarray) and points.ndim == 2
+        assert points.shape[1] == self.getDimension()
+
+        centroids = self._centroids.astype(self._dtype, copy=False)
+        if (self._index is None and self._metric == 'euclidean'
+            and len(centroids) >= TREE_CLUSTERS):
+            self._index = a6kdtree.KDTree(centroids)
+
+        labels = numpy.empty(len(points), dtype=numpy.intp)
+        for start in range(0, len(points), a6kernels.BLOCK_ROWS):
+            stop = min(start+a6kernels.BLOCK_ROWS, len(points))
+            work = points[start:stop].astype(self._dtype, copy=False)
+            if self._index is None:
+                found = a6kernels.nearest(work, centroids, a6kernels.MEMORY_BUDGET,
+                                          self._metric)
+            else:
+                found = self._index.nearest(work)
+            labels[start:stop] = found[0]
+        return labels
+
+
+    def save(self, filename):
+        """
+        Saves this model to the given file, in the .npz format.
+
+        The file holds the format version, the centroids, the dimension, the number
+        of clusters, the metric, the type of the distances and the metadata (as a
+        JSON string). If filename does not end in '.npz', that suffix is added.
+
+        Parameter filename: the file to write
+        Precondition: filename is a string
+        """
+        assert type(filename) == str
+
+        numpy.savez(filename, version=numpy.array(MODEL_VERSION),
+                    centroids=self._centroids, dimension=numpy.array(self.getDimension()),
+                    k=numpy.array(self.getSize()), metric=numpy.array(self._metric),
+                    dtype=numpy.array(self._dtype.str), metadata=numpy.array(json.dumps(self._metadata)))
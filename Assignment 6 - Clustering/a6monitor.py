@@ -0,0 +1,139 @@
+"""
+Instrumentation for k-Means clustering
+
+This file contains sinks for the step events of an Algorithm (see Algorithm.addSink).
+A RingBuffer keeps the most recent events in memory, while a JsonLines sink writes
+every event to a file, one JSON object per line. The function summarize adds up a
+list of events, to show whether the partition or the update dominates a run.
+
+"""
+import json
+import collections
+
+
+# The fields of a step event that are timings, in seconds
+PHASES = ['partition', 'update']
+
+
+class RingBuffer(object):
+    """
+    A class representing an in-memory sink that keeps the last few events.
+
+    An instance is called with each event. Once it holds size events, every new
+    event pushes out the oldest one.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _events: The events kept so far, oldest first
+    # Invariant: _events is a deque with a maximum length
+
+    def getEvents(self):
+        """
+        Returns a new list with the events in this buffer, oldest first.
+        """
+        return list(self._events)
+
+
+    def __init__(self, size=1000):
+        """
+        Initializes an empty buffer for at most size events.
+
+        Parameter size: the number of events to keep (OPTIONAL)
+        Precondition: size is an int > 0
+        """
+        assert type(size) == int and size > 0
+        self._events = collections.deque(maxlen=size)
+
+
+    def __call__(self, event):
+        """
+        Adds an event to this buffer.
+
+        Parameter event: the event
+        Precondition: event is a dictionary
+        """
+        self._events.append(event)
+
+
+    def clear(self):
+        """
+        Removes all events from this buffer.
+        """
+        self._events.clear()
+
+
+class JsonLines(object):
+    """
+    A class representing a sink that appends each event to a file as a line of JSON.
+
+    The file is flushed after every event, so it is complete up to the last step
+    even if the program crashes. Call close() when done with the sink.
+    """
+    # IMMUTABLE ATTRIBUTES (Fixed after initialization with no DIRECT access)
+    # Attribute _file: The open file
+    # Invariant: _file is a text file open for appending (or closed)
+
+    def __init__(self, filename):
+        """
+        Initializes a sink appending to the given file.
+
+        Parameter filename: the file to append to (it is created if needed)
+        Precondition: filename is a string
+        """
+        assert type(filename) == str
+        self._file = open(filename, 'a')
+
+
+    def __call__(self, event):
+        """
+        Writes an event to the file.
+
+        Parameter event: the event
+        Precondition: event is a dictionary that can be written as JSON
+        """
+        self._file.write(json.dumps(event)+'\n')
+        self._file.flush()
+
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self._file.close()
+
+
+def read_events(filename):
+    """
+    Returns the list of events in a file written by JsonLines.
+
+    Parameter filename: the file to read
+    Precondition: filename is a string naming a file written by JsonLines
+    """
+    with open(filename) as file:
+        return [json.loads(line) for line in file if line.strip() != '']
+
+
+def summarize(events):
+    """
+    Returns a dictionary adding up a list of step events.
+
+    The result has the number of steps, the total seconds of each phase in PHASES,
+    the share of the time spent in each phase (between 0 and 1), the total number of
+    points moved, and the inertia and shift of the last event.
+
+    Parameter events: the events to add up
+    Precondition: events is a non-empty list of step events
+    """
+    assert type(events) == list and len(events) > 0
+
+    result = {'steps': len(events)}
+    total = 0.0
+    for phase in PHASES:
+        result[phase] = sum(event[phase] for event in events)
+        total = total+result[phase]
+    for phase in PHASES:
+        result[phase+'_share'] = result[phase]/total if total > 0 else 0.0
+
+    result['moved'] = sum(event['moved'] for event in events)
+    result['inertia'] = events[-1]['inertia']
+    result['shift'] = events[-1]['shift']
+    return result
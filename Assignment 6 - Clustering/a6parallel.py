@@ -0,0 +1,179 @@
+"""
+Multi-process support for k-Means clustering
+
+This file contains the functions that let the clustering code spread its work over
+several processes. The points are copied once into shared memory (see the module
+multiprocessing.shared_memory), and each worker process attaches to that memory by
+name. Hence the points never have to be pickled and sent to the workers.
+
+"""
+import math
+import numpy
+import contextlib
+from multiprocessing import shared_memory
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6kernels
+
+
+def share(dset):
+    """
+    Returns a pair (memory, spec) holding a copy of the dataset in shared memory.
+
+    The value memory is the SharedMemory block. The caller must close and unlink it
+    once the workers are done with it. The value spec is a tuple (name, shape, type)
+    that attach uses to find the points from another process. The points are copied
+    a block at a time, so that a dataset backed by a file is never loaded at once.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+    """
+    size = dset.getSize()
+    dtype = numpy.dtype(numpy.float64 if dset.getDtype() is None else dset.getDtype())
+    shape = (size, dset.getDimension())
+
+    memory, spec = allocate(shape, dtype)
+    copy = numpy.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    for start in range(0, size, a6kernels.BLOCK_ROWS):
+        stop = min(start+a6kernels.BLOCK_ROWS, size)
+        copy[start:stop] = dset.getBlock(start, stop)
+
+    del copy
+    return memory, spec
+
+
+@contextlib.contextmanager
+def shared_dataset(dset):
+    """
+    Returns a context manager holding a copy of the dataset in shared memory.
+
+    The with statement gets the spec of the copy (see share), to send to the workers
+    (see call_attached). When the with statement ends, the shared memory is closed
+    and unlinked, even if it ends with an exception.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+    """
+    memory, spec = share(dset)
+    try:
+        yield spec
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def call_attached(spec, function, *args):
+    """
+    Returns the result of function(dset, *args), for the dataset dset in shared memory.
+
+    This is how a worker process works on a dataset shared by shared_dataset. The
+    dataset wraps the shared points without copying them (see a6dataset.wrap_array),
+    and the memory is closed again once function returns. So function must not keep
+    any reference to the dataset or its points.
+
+    Parameter spec: the shared points
+    Precondition: spec is a spec for a shared 2-D array, as returned by share
+
+    Parameter function: the work to do
+    Precondition: function is a function taking a Dataset, followed by args
+    """
+    memory, array = attach(spec)
+    try:
+        return function(a6dataset.wrap_array(array), *args)
+    finally:
+        del array
+        memory.close()
+
+
+def allocate(shape, dtype):
+    """
+    Returns a pair (memory, spec) for a new, uninitialized array in shared memory.
+
+    See share for the meaning of memory and spec.
+
+    Parameter shape: the shape of the array
+    Precondition: shape is a tuple of ints >= 0
+
+    Parameter dtype: the type of the array
+    Precondition: dtype is a numpy dtype
+    """
+    dtype = numpy.dtype(dtype)
+    size = dtype.itemsize*math.prod(shape)
+    memory = shared_memory.SharedMemory(create=True, size=max(size,1))
+    return memory, (memory.name, shape, dtype.str)
+
+
+def attach(spec):
+    """
+    Returns a pair (memory, array) for the shared array described by spec.
+
+    The array is a view of the shared memory. The caller must close memory (but not
+    unlink it) when done with the array, and must delete the array first.
+
+    Parameter spec: the array description
+    Precondition: spec is a tuple (name, shape, type) returned by share or allocate
+    """
+    # Only the creating process may unlink the memory, so it must not be tracked here.
+    # Versions before 3.13 cannot opt out, but share the creator's tracker instead.
+    try:
+        memory = shared_memory.SharedMemory(name=spec[0], track=False)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=spec[0])
+    return memory, numpy.ndarray(spec[1], dtype=numpy.dtype(spec[2]), buffer=memory.buf)
+
+
+def partition_shard(points, labels, start, stop, centroids, budget, metric='euclidean'):
+    """
+    Returns a list of (sums, counts) pairs, after labeling the points start..stop-1.
+
+    This is the work done by one worker process of a parallel partition. It finds the
+    nearest centroid of each point in the shard (a6kernels.nearest), and writes the
+    result to the shared label array. Then it adds up the points of each cluster, a
+    block of a6kernels.BLOCK_ROWS points at a time (a6kernels.label_sums), and
+    returns the sums and counts of each block in order. The caller adds the pairs of
+    all of the shards together, in order, to get the same result as
+    a6kernels.cluster_sums.
+
+    Parameter points: the shared points
+    Precondition: points is a spec for a shared 2-D array with a row per point
+
+    Parameter labels: the shared labels
+    Precondition: labels is a spec for a shared 1-D int array with an element per
+    point
+
+    Parameter start: the first point of the shard
+    Precondition: start is an int >= 0, and a multiple of a6kernels.BLOCK_ROWS
+
+    Parameter stop: the point after the last point of the shard
+    Precondition: stop is an int with start <= stop <= the number of points
+
+    Parameter centroids: the cluster centroids
+    Precondition: centroids is a 2-D float64 or float32 array with a row per cluster.
+    The distances are computed in its type.
+
+    Parameter budget: the memory budget in bytes
+    Precondition: budget is an int > 0
+
+    Parameter metric: the distance metric (OPTIONAL)
+    Precondition: metric is a key of a6kernels.METRICS
+    """
+    k = len(centroids)
+    pmemory, parray = attach(points)
+    lmemory, larray = attach(labels)
+
+    result = []
+    block = None
+    work = None
+    for pos in range(start, stop, a6kernels.BLOCK_ROWS):
+        end = min(pos+a6kernels.BLOCK_ROWS, stop)
+        block = parray[pos:end]
+        work = block.astype(centroids.dtype, copy=False)
+        larray[pos:end] = a6kernels.nearest(work, centroids, budget, metric)[0]
+        result.append(a6kernels.label_sums(block, larray[pos:end], k))
+
+    del block, work, parray, larray
+    pmemory.close()
+    lmemory.close()
+    return result
@@ -0,0 +1,278 @@
+"""
+Choosing the number of clusters for k-Means clustering
+
+This file contains the function sweep, which clusters a dataset for every k in a
+range and recommends the k with the best silhouette score. Neighboring values of k
+reuse each other's work: the run for k+1 starts from the clusters found for k, with
+the cluster of largest inertia split in two. The range can be cut into segments that
+are swept by several worker processes at once.
+
+"""
+import time
+import random
+import numpy
+import concurrent.futures
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6kernels
+import a6parallel
+import a6algorithm
+
+
+# The number of points the silhouette score is measured on, by default
+SAMPLE_SIZE = 1000
+
+
+def sweep(dset, kmin, kmax, workers=None, maxstep=300, engine='numpy', sample=SAMPLE_SIZE):
+    """
+    Returns a pair (best, curve) describing the clusterings of dset for k in kmin..kmax.
+
+    The value curve is a list with a dictionary for each k, in order. It has the
+    number of clusters 'k', the final 'inertia' (see Algorithm.getInertia), the
+    'silhouette' score of the clusters (see silhouette), the number of 'steps' the run
+    took and the 'seconds' it took. The value best is the k with the largest
+    silhouette score (the smallest such k, if there is a tie). The inertia can be
+    plotted against k to look for an elbow as well.
+
+    The range is cut into contiguous segments, one per worker (or a single segment if
+    workers is None), of about the same total work. The first k of a segment starts
+    from k-means++ seeds, and each later k warm starts from the clusters of the k
+    before it (see _split). The silhouette scores of all k are measured on the same
+    random sample of points. With workers, the dataset is copied once into shared
+    memory, as in a6algorithm.restart.
+
+    The random choices are made with the module random, so random.seed makes the
+    result repeatable, but it depends on the number of workers.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter kmin: the smallest number of clusters
+    Precondition: kmin is an int >= 2
+
+    Parameter kmax: the largest number of clusters
+    Precondition: kmax is an int, kmin <= kmax <= dset.getSize()
+
+    Parameter workers: the number of worker processes (OPTIONAL)
+    Precondition: workers is None or an int > 0. If dset is sparse, it is None.
+
+    Parameter maxstep: the maximum number of steps of each run (OPTIONAL)
+    Precondition: maxstep is an int > 0
+
+    Parameter engine: the partition engine of each run (OPTIONAL)
+    Precondition: engine is one of the strings in a6algorithm.ENGINES
+
+    Parameter sample: the number of points to measure the silhouette on (OPTIONAL)
+    Precondition: sample is an int >= 2
+    """
+    assert isinstance(dset, a6dataset.Dataset)
+    assert type(kmin) == int and type(kmax) == int
+    assert 2 <= kmin and kmin <= kmax and kmax <= dset.getSize()
+    assert workers is None or (type(workers) == int and workers > 0 and not dset.isSparse())
+    assert type(maxstep) == int and maxstep > 0
+    assert engine in a6algorithm.ENGINES
+    assert type(sample) == int and sample >= 2
+
+    size = dset.getSize()
+    positions = numpy.array(sorted(random.sample(range(size), min(sample, size))),
+                            dtype=numpy.intp)
+    segments = _segments(kmin, kmax, 1 if workers is None else workers)
+    keys = [random.getrandbits(64) for x in segments]
+
+    if workers is None:
+        state = random.getstate()
+        parts = [_sweep_run(dset, segments[0][0], segments[0][1], maxstep, engine,
+                            positions, keys[0])]
+        random.setstate(state)
+    else:
+        with a6parallel.shared_dataset(dset) as spec:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                jobs = [pool.submit(a6parallel.call_attached, spec, _sweep_run,
+                                    segments[pos][0], segments[pos][1], maxstep, engine,
+                                    positions, keys[pos])
+                        for pos in range(len(segments))]
+                parts = [job.result() for job in jobs]
+
+    curve = [entry for part in parts for entry in part]
+    best = max(curve, key=lambda entry: (entry['silhouette'], -entry['k']))['k']
+    return best, curve
+
+
+def silhouette(points, labels, budget=a6kernels.MEMORY_BUDGET):
+    """
+    Returns the mean silhouette score of the labeled points.
+
+    The score of a point is (b-a)/max(a,b), where a is its mean euclidean distance to
+    the other points with its label, and b is the smallest mean distance to the
+    points of another label. It is 0 for a point that is alone in its label. Scores
+    near 1 mean tight, well separated clusters.
+
+    The distances are computed a chunk of points at a time (within the memory
+    budget, as in a6kernels.nearest), and the sums of the distances to each label
+    come out of one matrix product per chunk.
+
+    Parameter points: the points
+    Precondition: points is a 2-D numpy array with a row per point
+
+    Parameter labels: the label of each point
+    Precondition: labels is a 1-D numpy int array of values >= 0, with an element per
+    point
+
+    Parameter budget: the memory budget in bytes (OPTIONAL)
+    Precondition: budget is an int > 0
+    """
+    size = len(points)
+    k = int(labels.max())+1
+    counts = numpy.bincount(labels, minlength=k)
+    if numpy.count_nonzero(counts) < 2:
+        return 0.0
+
+    members = numpy.zeros((size, k), dtype=numpy.float64)
+    members[numpy.arange(size), labels] = 1
+    sizes = numpy.where(counts > 0, counts, 1).astype(numpy.float64)
+    missing = counts == 0
+
+    scores = numpy.zeros(size, dtype=numpy.float64)
+    step = a6kernels.chunk_rows(size, points.shape[1], budget)
+    for start in range(0, size, step):
+        stop = min(start+step, size)
+        rows = numpy.arange(stop-start)
+        own = labels[start:stop]
+        totals = a6kernels.distances(points[start:stop], points) @ members
+
+        inner = totals[rows, own]/numpy.maximum(counts[own]-1, 1)
+        means = totals/sizes
+        means[:, missing] = numpy.inf
+        means[rows, own] = numpy.inf
+        outer = means.min(axis=1)
+
+        widest = numpy.maximum(inner, outer)
+        score = numpy.where(widest > 0, (outer-inner)/numpy.where(widest > 0, widest, 1), 0)
+        scores[start:stop] = numpy.where(counts[own] > 1, score, 0)
+
+    return float(scores.mean())
+
+
+# HELPER FUNCTIONS
+def _segments(kmin, kmax, parts):
+    """
+    Returns a list of pairs (first, last) cutting kmin..kmax into contiguous segments.
+
+    The time of a run grows with k, so the segments are cut to have about the same
+    sum of k rather than the same length. There are at most parts segments, and
+    none is empty.
+
+    Parameter kmin: the smallest number of clusters
+    Precondition: kmin is an int > 0
+
+    Parameter kmax: the largest number of clusters
+    Precondition: kmax is an int >= kmin
+
+    Parameter parts: the largest number of segments
+    Precondition: parts is an int > 0
+    """
+    values = numpy.arange(kmin, kmax+1)
+    ends = numpy.cumsum(values)
+    cuts = numpy.searchsorted(ends, ends[-1]*numpy.arange(1, parts)/parts, side='right')
+
+    result = []
+    first = 0
+    for cut in sorted(set(cuts.tolist()+[len(values)])):
+        if cut > first:
+            result.append((int(values[first]), int(values[cut-1])))
+            first = cut
+    return result
+
+
+def _sweep_run(dset, first, last, maxstep, engine, positions, key):
+    """
+    Returns the list of curve entries of sweep for k in first..last.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter first: the first number of clusters
+    Precondition: first is an int >= 2
+
+    Parameter last: the last number of clusters
+    Precondition: last is an int, first <= last <= dset.getSize()
+
+    Parameter positions: the sample to measure the silhouette on
+    Precondition: positions is a 1-D numpy int array of increasing valid positions
+
+    Parameter key: the seed for the module random
+    Precondition: key is an int
+
+    The other parameters are the same as for sweep.
+    """
+    random.seed(key)
+    points = a6kernels.gather(dset, positions)
+    if isinstance(points, a6dataset.SparseBlock):
+        points = points.toarray()
+
+    result = []
+    seeds = None
+    init = 'k-means++'
+    for k in range(first, last+1):
+        start = time.perf_counter()
+        alg = a6algorithm.Algorithm(dset, k, seeds=seeds, engine=engine, init=init)
+        alg.run(maxstep)
+        seconds = time.perf_counter()-start
+        alg.close()
+
+        labels = alg.classifyPoints(points.astype(numpy.float64, copy=False))
+        result.append({'k': k, 'inertia': alg.getInertia(),
+                       'silhouette': silhouette(points, labels), 'steps': alg.getSteps(),
+                       'seconds': seconds})
+        if k < last:
+            seeds = _split(dset, alg)
+    return result
+
+
+def _split(dset, alg):
+    """
+    Returns a list of seeds for k+1 clusters, from the k clusters of alg.
+
+    Seeds are dataset indices, so each cluster is represented by its point closest
+    to the centroid. The extra seed is the point farthest from its centroid in the
+    cluster of largest inertia, which splits that cluster in two. An empty cluster
+    is replaced by the farthest point from its centroid not yet used.
+
+    Parameter dset: the dataset
+    Precondition: dset is an instance of Dataset
+
+    Parameter alg: the algorithm for k clusters, after a run
+    Precondition: alg is an Algorithm for dset with fewer clusters than points
+    """
+    clusters = alg.getClusters()
+    k = len(clusters)
+    centroids = numpy.array([x.getCentroid() for x in clusters], dtype=numpy.float64)
+    labels, dists = a6kernels.assign(dset, centroids.reshape(k, -1))
+
+    #the closest point of each cluster is the first of its run, sorting by distance
+    order = numpy.lexsort((dists, labels))
+    counts = numpy.bincount(labels, minlength=k)
+    starts = (numpy.cumsum(counts)-counts)[counts > 0]
+    seeds = order[starts].tolist()
+
+    #split the cluster of largest inertia at its farthest point
+    inertia = numpy.bincount(labels, weights=dists*dists, minlength=k)
+    widest = int(numpy.argmax(inertia))
+    inside = numpy.flatnonzero(labels == widest)
+    taken = set(seeds)
+    extra = int(inside[numpy.argmax(dists[inside])])
+    if extra not in taken:
+        seeds.append(extra)
+        taken.add(extra)
+
+    #then use the farthest points overall, for any empty clusters
+    if len(seeds) < k+1:
+        for index in numpy.argsort(-dists, kind='stable').tolist():
+            if index not in taken:
+                seeds.append(index)
+                taken.add(index)
+            if len(seeds) == k+1:
+                break
+    return seeds
@@ -0,0 +1,112 @@
+"""
+Unit tests for the engines, file storage and checkpoints of Algorithm
+
+Run with pytest from this folder.
+
+"""
+import random
+import numpy
+import pytest
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6algorithm
+
+
+def make_dataset(size=2000, dim=3, dtype=numpy.float64):
+    """
+    Returns a dataset of random points in a few loose blobs.
+
+    Parameter size: the number of points (OPTIONAL)
+    Precondition: size is an int > 0
+
+    Parameter dim: the point dimension (OPTIONAL)
+    Precondition: dim is an int > 0
+
+    Parameter dtype: the storage type (OPTIONAL)
+    Precondition: dtype is numpy.float64 or numpy.float32
+    """
+    generator = numpy.random.default_rng(7)
+    centers = generator.uniform(-10, 10, (6, dim))
+    points = centers[generator.integers(0, 6, size)]+generator.normal(0, 2, (size, dim))
+    dset = a6dataset.Dataset(dim, dtype=dtype)
+    dset.addPoints(points)
+    return dset
+
+
+def labels_of(alg, dset):
+    """
+    Returns an int array with the position of the cluster of each dataset point.
+
+    Parameter alg: the algorithm
+    Precondition: alg is an instance of Algorithm
+
+    Parameter dset: the dataset of alg
+    Precondition: dset is an instance of Dataset
+    """
+    result = numpy.full(dset.getSize(), -1, dtype=numpy.intp)
+    for pos, cluster in enumerate(alg.getClusters()):
+        result[cluster.getIndices()] = pos
+    return result
+
+
+@pytest.mark.parametrize('options', [{'engine': 'hamerly'}, {'engine': 'kdtree'},
+                                     {'engine': 'numpy', 'workers': 2}])
+def test_engines_match_numpy(options):
+    """
+    Tests that the other engines find the same clusters as the numpy engine.
+    """
+    dset = make_dataset()
+    seeds = random.Random(3).sample(range(dset.getSize()), 12)
+
+    expected = a6algorithm.Algorithm(dset, 12, seeds, engine='numpy')
+    with a6algorithm.Algorithm(dset, 12, seeds, **options) as alg:
+        for x in range(20):
+            expected.step()
+            alg.step()
+            assert (labels_of(alg, dset) == labels_of(expected, dset)).all()
+            assert ([x.getCentroid() for x in alg.getClusters()] ==
+                    [x.getCentroid() for x in expected.getClusters()])
+
+
+def test_memmap_append(tmp_path):
+    """
+    Tests that adding points to a .npy file rewrites its header.
+    """
+    filename = str(tmp_path/'points.npy')
+    points = numpy.arange(30, dtype=numpy.float64).reshape(10, 3)
+    numpy.save(filename, points[:4])
+
+    dset = a6dataset.open_memmap(filename, writable=True)
+    dset.addPoint((12.0, 13.0, 14.0))
+    dset.addPoints(points[5:])
+    dset.flush()
+    assert dset.getArray().tolist() == points.tolist()
+
+    assert numpy.load(filename).tolist() == points.tolist()
+    again = a6dataset.open_memmap(filename)
+    assert again.getSize() == 10 and again.getPoint(9) == (27.0, 28.0, 29.0)
+
+
+def test_checkpoint_resume(tmp_path):
+    """
+    Tests that resuming from a checkpoint ends the same as a run without one.
+    """
+    dset = make_dataset()
+    seeds = random.Random(5).sample(range(dset.getSize()), 8)
+    filename = str(tmp_path/'state.npz')
+
+    expected = a6algorithm.Algorithm(dset, 8, seeds, engine='numpy')
+    expected.run(100)
+
+    first = a6algorithm.Algorithm(dset, 8, seeds, engine='numpy')
+    first.run(3)
+    first.checkpoint(filename)
+    alg = a6algorithm.resume(filename, dset)
+    alg.run(100-alg.getSteps())
+
+    assert expected.getSteps() > 3 and alg.getSteps() == expected.getSteps()
+    assert (labels_of(alg, dset) == labels_of(expected, dset)).all()
+    assert ([x.getCentroid() for x in alg.getClusters()] ==
+            [x.getCentroid() for x in expected.getClusters()])
@@ -0,0 +1,35 @@
+"""
+Unit tests for the index list of Cluster
+
+Run with pytest from this folder.
+
+"""
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6cluster
+
+
+def test_indices_changed_directly():
+    """
+    Tests that a cluster follows changes made to the list from getIndices.
+    """
+    dset = a6dataset.Dataset(1, [(float(x),) for x in range(10)])
+
+    cluster = a6cluster.Cluster(dset, (0.0,))
+    cluster.addIndex(3)
+    cluster.getIndices().clear()
+    assert not cluster.hasIndex(3)
+    cluster.addIndex(3)
+    assert cluster.getIndices() == [3]
+
+    cluster = a6cluster.Cluster(dset, (0.0,))
+    cluster.getIndices().append(1)
+    cluster.addIndex(1)
+    assert cluster.getIndices() == [1]
+
+    cluster = a6cluster.Cluster(dset, (0.0,))
+    cluster.addIndex(2)
+    assert cluster.getInertia() == 4.0
+    cluster.getIndices().append(4)
+    assert cluster.getInertia() == 20.0
+    assert cluster.getRadius() == 4.0
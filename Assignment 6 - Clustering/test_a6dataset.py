@@ -0,0 +1,57 @@
+"""
+Unit tests for the storage and reading of Dataset
+
+Run with pytest from this folder.
+
+"""
+import io
+import numpy
+import pytest
+import warnings
+
+
+# For accessing the previous parts of the assignment
+import a6dataset
+import a6cluster
+
+
+def test_sparse_index():
+    """
+    Tests that indexing a SparseBlock by an int fails outside of its points.
+    """
+    dset = a6dataset.Dataset(3, [(1.0,0.0,0.0),(0.0,2.0,0.0),(0.0,0.0,3.0)], sparse=True)
+    block = dset.getBlock(0, 3)
+    assert block[-1].tolist() == [0.0, 0.0, 3.0]
+    with pytest.raises(IndexError):
+        block[3]
+    with pytest.raises(IndexError):
+        block[-4]
+    with pytest.raises(IndexError):
+        dset.getBlock(0, 0)[0]
+
+
+def test_sparse_view_iteration():
+    """
+    Tests that iterating over a view of a sparse cluster stops after its points.
+    """
+    points = [(1.0,0.0,0.0),(0.0,2.0,0.0),(0.0,0.0,3.0),(4.0,0.0,0.0)]
+    dset = a6dataset.Dataset(3, points, sparse=True)
+    cluster = a6cluster.Cluster(dset, (0.0,0.0,0.0))
+    cluster.setIndices([3,0,2])
+
+    rows = [row.tolist() for row in cluster.getView()]
+    assert rows == [list(points[3]), list(points[0]), list(points[2])]
+
+
+def test_csv_comment_chunk(monkeypatch):
+    """
+    Tests that read_csv does not warn about a chunk with only comments and blanks.
+    """
+    monkeypatch.setattr(a6dataset, 'INGEST_ROWS', 2)
+    source = io.StringIO('1,2\n3,4\n# comment\n\n5,6\n')
+    dset = a6dataset.Dataset(2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        report = a6dataset.read_csv(dset, source)
+    assert report['rows'] == 3
+    assert dset.getContents() == [(1.0,2.0),(3.0,4.0),(5.0,6.0)]